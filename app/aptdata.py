@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import io
+import os
+from version_compare import compute_upgrades, debvercmp
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+# Computes the available updates of a Debian based host straight from the package lists downloaded by apt
+# (/var/lib/apt/lists/*_Packages) and the dpkg status file, without loading python-apt.
+
+default_lists_dir = '/var/lib/apt/lists'
+default_status_file = '/var/lib/dpkg/status'
+list_suffix = '_Packages'
+stanza_fields = frozenset(['Package', 'Version', 'Architecture', 'Status'])
+
+
+def open_list(path):
+    """
+    Opens a package list as UTF-8 text whatever the locale, descriptions and maintainer names are not ASCII.
+    """
+    if path.endswith('.gz'):
+        import gzip
+        return io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8')
+    if path.endswith('.xz'):
+        import lzma
+        return io.TextIOWrapper(lzma.open(path, 'rb'), encoding='utf-8')
+    return io.open(path, encoding='utf-8')
+
+
+def iter_stanzas(lines):
+    """
+    Streams the paragraphs of a deb822 file (Packages, status), only the fields needed to find updates are kept.
+    :return: generator of dict Field name to value.
+    """
+    stanza = {}
+    for line in lines:
+        if line[0:1] in (' ', '\t'):
+            continue  # Continuation of a multi-line field
+        line = line.rstrip('\n')
+        if not line:
+            if stanza:
+                yield stanza
+                stanza = {}
+            continue
+        field, separator, value = line.partition(':')
+        if separator and field in stanza_fields:
+            stanza[field] = value.strip()
+    if stanza:
+        yield stanza
+
+
+def read_status(status_file=None):
+    """
+    :type status_file: str The dpkg status file, /var/lib/dpkg/status if None.
+    :return: dict (name, arch) to the list of installed versions.
+    """
+    installed = {}
+    with io.open(status_file or default_status_file, encoding='utf-8') as status:
+        for stanza in iter_stanzas(status):
+            if stanza.get('Status', '').endswith(' installed') and 'Version' in stanza:
+                installed.setdefault((stanza['Package'], stanza.get('Architecture', 'all')), []).append(
+                    stanza['Version'])
+    return installed
+
+
+def repo_id(filename):
+    """
+    Names a package list after its suite and component, ex: deb.debian.org_debian_dists_bookworm-updates_main_
+    binary-amd64_Packages is bookworm-updates/main.
+    """
+    name = filename.split(list_suffix)[0]
+    if '_dists_' in name:
+        name = name.split('_dists_', 1)[1]
+    if '_binary-' in name:
+        name = name.split('_binary-', 1)[0]
+    return name.replace('_', '/')
+
+
+def find_lists(lists_dir):
+    """
+    :return: dict Repository id to the paths of its package lists, one per architecture.
+    """
+    lists = {}
+    if not os.path.isdir(lists_dir):
+        return lists
+    for filename in sorted(os.listdir(lists_dir)):
+        if filename.endswith(list_suffix) or filename.endswith(list_suffix + '.gz') or \
+                filename.endswith(list_suffix + '.xz'):
+            lists.setdefault(repo_id(filename), []).append(os.path.join(lists_dir, filename))
+    return lists
+
+
+def iter_package_list(path, wanted=None):
+    """
+    :type wanted: set Package names to keep, all if None.
+    :return: generator of (name, arch, version) tuples.
+    """
+    with open_list(path) as package_list:
+        for stanza in iter_stanzas(package_list):
+            name = stanza.get('Package')
+            if name and 'Version' in stanza and (wanted is None or name in wanted):
+                yield name, stanza.get('Architecture', 'all'), stanza['Version']
+
+
+def query_apt(repos_filter, lists_dir=None, status_file=None):
+    """
+    Offline equivalent of providers.query_yum for apt.
+    :type repos_filter: str Comma separated repository ids (suite/component), all downloaded lists if empty.
+    :type lists_dir: str The apt lists folder, /var/lib/apt/lists if None.
+    :type status_file: str The dpkg status file, /var/lib/dpkg/status if None.
+    """
+    installed = read_status(status_file)
+    wanted = frozenset(name for name, arch in installed)
+    lists = find_lists(lists_dir or default_lists_dir)
+    if repos_filter:
+        repo_ids = [repo.strip() for repo in repos_filter.split(',') if repo.strip() in lists]
+    else:
+        repo_ids = sorted(lists)
+
+    # On equal versions the first repository listed wins
+    upgrades = compute_upgrades(installed, ((name, arch, version, repo) for repo in repo_ids for path in lists[repo]
+                                            for name, arch, version in iter_package_list(path, wanted)), debvercmp)
+    clean_list = []
+    for name, arch in sorted(upgrades):
+        version, repo = upgrades[(name, arch)]
+        clean_list.append({'name': name, 'repo': repo, 'version': version})
+    return clean_list
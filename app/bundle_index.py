@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import fnmatch
+import hashlib
+import json
+import io
+import os
+import re
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+cache_file_name = 'bundle_index.json'
+glob_chars = ('*', '?', '[')
+regex_prefix = '^'
+
+
+def _to_regex(member):
+    if member.startswith(regex_prefix):
+        return member
+    return fnmatch.translate(member)
+
+
+class BundleIndex(object):
+    """
+    Maps a package name to the bundle it belongs to.
+    Plain members are resolved with a single dict lookup, members containing glob characters (abrt-*) or starting
+    with '^' (regular expression) are only tried when no exact member matched, in bundle name order.
+    """
+    __slots__ = ('exact', 'patterns', '_compiled', '_memo')
+
+    def __init__(self, exact=None, patterns=None):
+        """
+        :type exact: dict Package name to bundle name.
+        :type patterns: list (glob or regular expression, bundle name) tuples.
+        """
+        self.exact = exact or {}
+        self.patterns = patterns or []
+        self._compiled = [(re.compile(_to_regex(pattern)), bundle) for pattern, bundle in self.patterns]
+        self._memo = {}
+
+    @classmethod
+    def from_bundles(cls, package_bundle):
+        """
+        :type package_bundle: dict Bundle name to list of package names or patterns, as in package_bundle.json.
+        """
+        exact = {}
+        patterns = []
+        for bundle in sorted(package_bundle):
+            for member in package_bundle[bundle]:
+                if member.startswith(regex_prefix) or any(char in member for char in glob_chars):
+                    patterns.append((member, bundle))
+                elif member not in exact:
+                    exact[member] = bundle
+        return cls(exact, patterns)
+
+    def lookup(self, pkg_name):
+        bundle = self.exact.get(pkg_name)
+        if bundle is not None or not self._compiled:
+            return bundle
+        if pkg_name in self._memo:
+            return self._memo[pkg_name]
+        for pattern, pattern_bundle in self._compiled:
+            if pattern.match(pkg_name):
+                bundle = pattern_bundle
+                break
+        self._memo[pkg_name] = bundle
+        return bundle
+
+    def __len__(self):
+        return len(self.exact) + len(self.patterns)
+
+
+def _write_cache(cache_path, payload):
+    tmp_path = cache_path + '.' + str(os.getpid())
+    try:
+        with open(tmp_path, 'w') as cache_file:
+            json.dump(payload, cache_file)
+        os.rename(tmp_path, cache_path)
+    except (IOError, OSError):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_bundle_index(bundle_file, cache_dir=None):
+    """
+    Compiles the bundle file into a BundleIndex, reusing the compiled copy saved in cache_dir when the bundle file
+    has the same mtime and size, or failing that the same content hash.
+    :type bundle_file: str Path to the JSON bundle list.
+    :type cache_dir: str Folder to keep the compiled index in, no caching if None.
+    """
+    stat = os.stat(bundle_file)
+    cache_path = None
+    cached = None
+    if cache_dir:
+        cache_path = os.path.join(cache_dir, cache_file_name)
+        try:
+            with io.open(cache_path, encoding='utf-8') as cache_file:
+                cached = json.load(cache_file)
+        except Exception:
+            cached = None
+
+    if cached and cached['path'] == os.path.realpath(bundle_file) and cached['mtime'] == stat.st_mtime and \
+            cached['size'] == stat.st_size:
+        return BundleIndex(cached['exact'], [tuple(pattern) for pattern in cached['patterns']])
+
+    with open(bundle_file, 'rb') as json_file:
+        content = json_file.read()
+    digest = hashlib.sha1(content).hexdigest()
+    if cached and cached['sha1'] == digest:
+        index = BundleIndex(cached['exact'], [tuple(pattern) for pattern in cached['patterns']])
+    else:
+        index = BundleIndex.from_bundles(json.loads(content.decode('utf-8')))
+
+    if cache_path:
+        if not os.path.isdir(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError:
+                return index
+        _write_cache(cache_path, {'path': os.path.realpath(bundle_file), 'mtime': stat.st_mtime,
+                                  'size': stat.st_size, 'sha1': digest, 'exact': index.exact,
+                                  'patterns': index.patterns})
+    return index
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import os
+import sys
+import time
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+# Single entry point: cli.py <generate|context|pr|check> -c <conf file>. A command imports its module when it runs, not
+# before. check, also given as --check, tells the monitoring whether there are updates from the update cache filled by
+# generate_list. It is run every few minutes, so it skips argparse and configparser (both import re) and only reads
+# the [General] cwd and [Cache] options of the configuration, keeping the cold start near the interpreter's own.
+# Exit codes follow the Nagios plugin convention.
+
+commands = {'generate': 'generate_list', 'context': 'update_context', 'pr': 'send_pull_request'}
+check_ok, check_warning, check_unknown = 0, 1, 3
+true_values = ('1', 'yes', 'true', 'on')
+
+
+def read_options(filename):
+    """
+    Reads the key=value and key: value lines of an INI file, without interpolation nor multi-line values.
+    :return: dict Section to its options, the keys lower-cased like ConfigParser does.
+    """
+    sections = {}
+    options = None
+    with open(filename) as conf_file:
+        for line in conf_file:
+            line = line.strip()
+            if not line or line[0] in '#;':
+                continue
+            if line[0] == '[' and line[-1] == ']':
+                options = sections.setdefault(line[1:-1], {})
+            elif options is not None:
+                separator = min(index for index in (line.find('='), line.find(':'), len(line)) if index >= 0)
+                options[line[:separator].strip().lower()] = line[separator + 1:].strip()
+    return sections
+
+
+def conf_file_arg(argv):
+    """
+    :return: str The value of -c/--conf-file in argv, None if missing.
+    """
+    for index, arg in enumerate(argv):
+        if arg in ('-c', '--conf-file') and index + 1 < len(argv):
+            return argv[index + 1]
+        if arg.startswith('--conf-file='):
+            return arg.split('=', 1)[1]
+        if arg.startswith('-c') and len(arg) > 2:
+            return arg[2:]
+    return None
+
+
+def wants_check(argv):
+    """
+    :return: bool True if argv asks for check, as its command or with --check.
+    """
+    values = [argv[index + 1] for index, arg in enumerate(argv[:-1]) if arg in ('-c', '--conf-file')]
+    return '--check' in argv or argv.count('check') > values.count('check')
+
+
+def check(conf_file):
+    """
+    Prints whether the last computed list holds updates.
+    :return: int check_ok if it is empty, check_warning if not, check_unknown if there is no list from the last ttl
+    seconds.
+    """
+    if not conf_file or not os.path.exists(conf_file):
+        print('UNKNOWN - configuration file not found')
+        return check_unknown
+    options = read_options(conf_file)
+    cache = options.get('Cache', {})
+    if cache.get('enabled', '').lower() not in true_values or 'cwd' not in options.get('General', {}):
+        print('UNKNOWN - the update cache is disabled')
+        return check_unknown
+
+    import update_cache
+    ttl = int(cache.get('ttl') or update_cache.default_ttl)
+    summary = update_cache.latest_summary(os.path.join(options['General']['cwd'], '.cache'), ttl)
+    if summary is None:
+        print('UNKNOWN - no list of updates computed in the last %ds' % ttl)
+        return check_unknown
+    created, count = summary
+    if count == 0:
+        print('OK - no package to update | packages=0')
+        return check_ok
+    print('WARNING - %d packages to update, computed %ds ago | packages=%d' % (count, time.time() - created, count))
+    return check_warning
+
+
+def run_command(argv):
+    """
+    Runs generate, context or pr, parsing argv and the configuration the way their own __main__ does.
+    """
+    import argparse
+    try:
+        from configparser import ConfigParser
+    except ImportError:
+        print("Python 3's configparser or its backport to Python 2 is needed")  # ver. < 3.0
+    parser = argparse.ArgumentParser(description='Puppet resources from the pending OS package updates')
+    parser.add_argument('-c', '--conf-file', dest='conf_file', help='Configuration file', required=True)
+    parser.add_argument('--check', dest='check', action='store_true',
+                        help='Tell if there are updates from the cached list, same as the check command')
+    parser.add_argument('command', choices=sorted(commands) + ['check'],
+                        help='generate: the Hiera file, context: generate, commit, push and open the pull request, '
+                             'pr: open the pull request, check: tell if there are updates from the cached list')
+    args = parser.parse_args(argv)
+    conf = ConfigParser()
+    with open(args.conf_file, 'r') as conf_file:
+        conf.read_file(conf_file)
+
+    module = __import__(commands[args.command])
+    module.main(conf)
+    return 0
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if wants_check(argv):
+        return check(conf_file_arg(argv))
+    return run_command(argv)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+import generate_list
+import update_cache
+import update_context
+from git_workspace import GitWorkspace
+from metrics import metrics
+from pr_client import BitbucketClient
+from providers import get_repodata_dir, get_rpmdb_dir
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+# Long running alternative to calling update_context.py from cron (Python 3.7 or later only, CI skips this file on
+# older interpreters): the interpreter, the package provider, the GIT workspace and the PR client stay loaded between
+# cycles. Cycles run every [Daemon] interval seconds give or take the jitter, or as soon as the rpmdb or the
+# repository metadata changes. A unix socket answers 'status' with the state of the daemon as JSON and 'run' by
+# starting a cycle.
+
+default_interval = 3600
+default_jitter = 0.1
+default_poll_interval = 60
+
+
+class WarmProvider(object):
+    """
+    Wraps a package provider, its last answer is reused as long as the rpmdb and the repository metadata are the same.
+    Only the provider refreshes the metadata from the mirrors, refresh() has it do so whatever the fingerprint.
+    """
+
+    def __init__(self, provider, fingerprint):
+        """
+        :type provider: function See generate_list.get_provider.
+        :type fingerprint: function Returns a value changing with the rpmdb and the repository metadata.
+        """
+        self.provider = provider
+        self.fingerprint = fingerprint
+        self.key = None
+        self.packages = None
+
+    @property
+    def tool(self):
+        return getattr(self.provider, 'tool', 'yum')
+
+    @property
+    def dependencies(self):
+        return getattr(self.provider, 'dependencies', None)
+
+    def installed(self):
+        """
+        :return: frozenset See providers.Provider.installed, always read from the wrapped provider.
+        """
+        return self.provider.installed()
+
+    def query(self, repos_filter, clean_metadata):
+        self.packages = self.provider(repos_filter, clean_metadata)
+        # Keyed on the metadata the provider may just have refreshed
+        self.key = (repos_filter, self.fingerprint())
+        metrics.add('provider_queries')
+        return self.key
+
+    def refresh(self, repos_filter):
+        """
+        Queries the provider, cleaning the metadata so that it is fetched again from the mirrors.
+        :return: tuple The key of the answer, the same as the last one when nothing changed on the mirrors or locally.
+        """
+        return self.query(repos_filter, True)
+
+    def __call__(self, repos_filter, clean_metadata):
+        if self.packages is None or (repos_filter, self.fingerprint()) != self.key:
+            self.query(repos_filter, clean_metadata)
+        return list(self.packages)
+
+
+class Daemon(object):
+
+    def __init__(self, conf, provider=None, workspace=None, client=None):
+        """
+        :type conf: ConfigParser Reads the [Daemon] section on top of the update_context configuration.
+        :type provider: function Package provider, the configured one if None.
+        :type workspace: GitWorkspace The configured one if None.
+        :type client: BitbucketClient The configured one if None and PR generation is enabled.
+        """
+        self.conf = conf
+        self.interval = conf.getint('Daemon', 'interval', fallback=default_interval)
+        self.jitter = conf.getfloat('Daemon', 'jitter', fallback=default_jitter)
+        self.poll_interval = conf.getint('Daemon', 'poll_interval', fallback=default_poll_interval)
+        self.socket_path = conf.get('Daemon', 'status_socket', fallback='') or \
+            os.path.join(conf['General']['cwd'], 'daemon.sock')
+        self.repodata_dir = get_repodata_dir(conf)
+        self.rpmdb_dir = get_rpmdb_dir(conf)
+        self.repos_filter = conf.get('Package', 'pkg_repos', fallback='')
+        self.provider = WarmProvider(provider or generate_list.get_provider(conf), self.fingerprint)
+        self.workspace = workspace or GitWorkspace.from_conf(conf)
+        self.client = client
+        if self.client is None and conf.getboolean('PR', 'generate', fallback=False):
+            self.client = BitbucketClient.from_conf(conf)
+        # Yum, dnf and git are not thread safe, cycles run one at a time outside of the event loop
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.wake = None
+        self.stopping = None
+        # Key of the provider answer the last successful cycle was run with
+        self.last_key = None
+        self.status = {'host': socket.getfqdn(), 'pid': os.getpid(), 'started': time.time(), 'cycles': 0,
+                       'running': False, 'last_run': None, 'last_trigger': None, 'last_duration': None,
+                       'last_result': None, 'last_error': None, 'next_run': None}
+
+    def fingerprint(self):
+        return update_cache.compute_key(self.repodata_dir, self.repos_filter, self.rpmdb_dir)
+
+    def next_delay(self):
+        return max(0.0, self.interval * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def trigger(self, reason):
+        self.status['last_trigger'] = reason
+        self.wake.set()
+
+    def run_cycle(self, trigger=None):
+        """
+        :type trigger: str What started the cycle, a 'schedule' one refreshes the metadata first and stops there when
+        neither the metadata nor the rpmdb changed since the last successful cycle.
+        :return: dict See update_context.update, {'skipped': True} if the cycle stopped after the refresh.
+        """
+        metrics.reset()
+        try:
+            if trigger == 'schedule':
+                with metrics.stage('refresh'):
+                    key = self.provider.refresh(self.repos_filter)
+                if key == self.last_key:
+                    return {'skipped': True}
+            result = update_context.update(self.conf, self.workspace, self.provider, self.client)
+            if not result.get('push_error'):
+                self.last_key = self.provider.key
+            return result
+        finally:
+            if self.client is not None:
+                self.client.save_cache()
+            metrics.emit()
+
+    async def run_once(self):
+        loop = asyncio.get_running_loop()
+        self.status['running'] = True
+        start = time.time()
+        try:
+            self.status['last_result'] = await loop.run_in_executor(self.executor, self.run_cycle,
+                                                                    self.status['last_trigger'])
+            self.status['last_error'] = None
+        except Exception as e:
+            self.status['last_error'] = str(e)
+            print('Update cycle failed: ' + str(e))
+        finally:
+            self.status['running'] = False
+            self.status['cycles'] += 1
+            self.status['last_run'] = start
+            self.status['last_duration'] = round(time.time() - start, 3)
+
+    async def schedule(self):
+        # The first cycle is spread over the jitter window too, so that hosts started together do not hit the mirrors
+        # at once
+        delay = random.uniform(0, self.interval * self.jitter)
+        while not self.stopping.is_set():
+            self.status['next_run'] = time.time() + delay
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                self.status['last_trigger'] = 'schedule'
+            if self.stopping.is_set():
+                break
+            self.wake.clear()
+            await self.run_once()
+            delay = self.next_delay()
+
+    async def watch(self):
+        """
+        Polls the rpmdb and the repository metadata, a change triggers a cycle.
+        """
+        loop = asyncio.get_running_loop()
+        last = await loop.run_in_executor(None, self.fingerprint)
+        while not self.stopping.is_set():
+            try:
+                await asyncio.wait_for(self.stopping.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            current = await loop.run_in_executor(None, self.fingerprint)
+            if current != last and not self.status['running']:
+                last = current
+                # A scheduled refresh changes the metadata too, the cycle it ran already saw it
+                if (self.repos_filter, current) != self.last_key:
+                    self.trigger('watch')
+
+    async def handle_client(self, reader, writer):
+        try:
+            command = (await reader.readline()).decode('utf-8').strip() or 'status'
+            if command == 'run':
+                self.trigger('socket')
+                response = {'triggered': True}
+            elif command == 'status':
+                response = self.status
+            else:
+                response = {'error': 'Unknown command ' + command}
+            writer.write((json.dumps(response, sort_keys=True, default=str) + '\n').encode('utf-8'))
+            await writer.drain()
+        finally:
+            writer.close()
+
+    def stop(self):
+        self.stopping.set()
+        self.wake.set()
+
+    async def serve(self, handle_signals=False):
+        """
+        :type handle_signals: bool Stops the daemon on SIGINT and SIGTERM.
+        """
+        self.wake = asyncio.Event()
+        self.stopping = asyncio.Event()
+        if handle_signals:
+            loop = asyncio.get_running_loop()
+            for signal_number in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(signal_number, self.stop)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        server = await asyncio.start_unix_server(self.handle_client, path=self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        try:
+            await asyncio.gather(self.schedule(), self.watch())
+        finally:
+            server.close()
+            await server.wait_closed()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            if self.client is not None:
+                self.client.close()
+            self.executor.shutdown()
+
+
+def query_status(socket_path, command='status'):
+    """
+    :return: dict The answer of the daemon listening on socket_path.
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+        client.sendall((command + '\n').encode('utf-8'))
+        data = b''
+        while not data.endswith(b'\n'):
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    finally:
+        client.close()
+    return json.loads(data.decode('utf-8'))
+
+
+if __name__ == '__main__':
+    from configparser import ConfigParser
+    conf = ConfigParser()
+
+    parser = argparse.ArgumentParser(description='Update daemon keeping the package provider and GIT workspace warm')
+    parser.add_argument('-c', '--conf-file', dest='conf_file', help='Configuration file', required=True)
+    parser.add_argument('-s', '--status', dest='status', action='store_true',
+                        help='Print the status of the running daemon')
+    parser.add_argument('-r', '--run', dest='run', action='store_true', help='Ask the running daemon for a cycle')
+    args = parser.parse_args()
+
+    with open(args.conf_file, 'r') as conf_file:
+        conf.read_file(conf_file)
+
+    if args.status or args.run:
+        socket_path = conf.get('Daemon', 'status_socket', fallback='') or \
+            os.path.join(conf['General']['cwd'], 'daemon.sock')
+        print(json.dumps(query_status(socket_path, 'run' if args.run else 'status'), indent=4, sort_keys=True))
+    else:
+        metrics.configure(conf, 'daemon')
+        if conf['General']['proxy'] != '':
+            os.environ['https_proxy'] = conf['General']['proxy']
+        daemon = Daemon(conf)
+        asyncio.run(daemon.serve(handle_signals=True))
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import argparse
+import os
+import time
+import generate_list
+from git_workspace import GitError, GitWorkspace
+from metrics import metrics
+from pr_client import BitbucketClient, PRError
+from providers import ListProvider
+from send_pull_request import create_pr_from_conf
+from snapshot import remove_snapshot, snapshot_path
+from update_context import generate, get_working_branch, hiera_paths, pr_exists
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+# Promotes one update list through several Puppet environments: the package provider is queried once, then every
+# [Target:<name>] section gets its own merge/strip/bundle/write in a process pool, each in its own GIT worktree of a
+# shared clone, and the branches are pushed together.
+
+target_prefix = 'Target:'
+# Options of a target section going to another section than [Package]
+target_sections = {'base_file': 'General', 'file': 'General', 'hiera_folder': 'General',
+                   'dest_branch': 'GIT', 'src_branch': 'GIT', 'work_branch': 'GIT',
+                   'description': 'PR', 'reviewers': 'PR', 'title': 'PR'}
+
+
+def conf_to_dict(conf):
+    return dict((section, dict(conf.items(section, raw=True))) for section in conf.sections())
+
+
+def dict_to_conf(sections):
+    from configparser import ConfigParser
+    conf = ConfigParser()
+    conf.read_dict(sections)
+    return conf
+
+
+def target_confs(conf):
+    """
+    :return: list (target name, configuration dict) tuples, in configuration order. A target's configuration is the
+    common one overridden by its section, its GIT worktree and caches live under <cwd>/targets/<name>.
+    :raise ValueError: If two targets have the same working branch, the branches are pushed at once.
+    """
+    common = conf_to_dict(conf)
+    targets = []
+    branches = {}
+    for section in conf.sections():
+        if not section.startswith(target_prefix):
+            continue
+        name = section[len(target_prefix):]
+        sections = dict((key, dict(values)) for key, values in common.items() if not key.startswith(target_prefix))
+        for option, value in conf.items(section, raw=True):
+            sections.setdefault(target_sections.get(option, 'Package'), {})[option] = value
+        if 'title' not in conf[section] and sections.get('PR', {}).get('title'):
+            sections['PR']['title'] += ' (' + name + ')'  # Lookups by title must tell the targets apart
+        sections['General']['cwd'] = os.path.join(conf['General']['cwd'], 'targets', name)
+        sections['GIT']['name'] = 'repo'
+        working_branch = get_working_branch(sections)
+        if working_branch in branches:
+            raise ValueError('Targets ' + branches[working_branch] + ' and ' + name + ' share the working branch ' +
+                             working_branch)
+        branches[working_branch] = name
+        targets.append((name, sections))
+    return targets
+
+
+def run_target(name, sections, packages_found, tool):
+    """
+    Runs in a pool process, or in this one when the targets run sequentially, the worktree is already checked out.
+    :return: tuple The target name, its commit message, the shards it wrote, the stages and counters of its
+    metrics, its update cache entry and its snapshot, see generate_list.store_cache_entry and store_snapshot.
+    """
+    conf = dict_to_conf(sections)
+    run_metrics = (metrics.stages, metrics.counters, metrics.started)
+    metrics.reset()
+    try:
+        working_file = os.path.join(conf['General']['cwd'], conf['GIT']['name'], conf['General']['hiera_folder'],
+                                    conf['General']['file'])
+        commit_message = generate(conf, working_file, get_working_branch(conf),
+                                  ListProvider(packages_found, tool, generate_list.get_provider(conf)))
+        stages, counters = list(metrics.stages), dict(metrics.counters)
+    finally:
+        # The metrics of the run, merged by run_targets, are kept when the target runs in this process
+        metrics.stages, metrics.counters, metrics.started = run_metrics
+    return name, commit_message, list(generate_list.last_paths), stages, counters, \
+        generate_list.last_cache_entry, generate_list.last_snapshot
+
+
+def run_targets(targets, packages_found, tool, processes):
+    """
+    :type targets: list (target name, configuration dict) tuples.
+    :type tool: str The package manager installing the bundles, see providers.installers.
+    :return: tuple Dicts of the target name to its commit message, to the shards it wrote, to its update cache
+    entry and to its snapshot.
+    """
+    if processes > 1 and len(targets) > 1:
+        try:
+            from concurrent.futures import ProcessPoolExecutor
+        except ImportError:  # Python 2 without the 'futures' backport
+            ProcessPoolExecutor = None
+        if ProcessPoolExecutor:
+            with ProcessPoolExecutor(max_workers=min(processes, len(targets))) as executor:
+                futures = [executor.submit(run_target, name, sections, packages_found, tool)
+                           for name, sections in targets]
+                results = [future.result() for future in futures]
+        else:
+            results = [run_target(name, sections, packages_found, tool) for name, sections in targets]
+    else:
+        results = [run_target(name, sections, packages_found, tool) for name, sections in targets]
+
+    messages = {}
+    written = {}
+    cache_entries = {}
+    snapshots = {}
+    for name, commit_message, paths, stages, counters, cache_entry, snapshot in results:
+        messages[name] = commit_message
+        written[name] = paths
+        cache_entries[name] = cache_entry
+        snapshots[name] = snapshot
+        for record in stages:
+            metrics.record(name + '_' + record['stage'], record['wall'], record['cpu'])
+        for counter, value in counters.items():
+            metrics.add(counter, value)
+    return messages, written, cache_entries, snapshots
+
+
+def propose(targets, target_confs_by_name, client):
+    """
+    Looks up or creates the PR of each target, a failure only affects its own target.
+    :type client: BitbucketClient Shared by the targets.
+    :return: dict The target name to its PR error, None if its PR is open.
+    """
+    pr_errors = {}
+    for name, sections in targets:
+        target_conf = target_confs_by_name[name]
+        pr_errors[name] = None
+        try:
+            if not pr_exists(target_conf, client) and \
+                    create_pr_from_conf(target_conf, get_working_branch(target_conf), client) is None:
+                pr_errors[name] = 'PR creation failed'  # Printed by send_payload
+        except PRError as e:
+            pr_errors[name] = str(e)
+            print(str(e))
+    return pr_errors
+
+
+if __name__ == '__main__':
+    try:
+        from configparser import ConfigParser
+    except ImportError:
+        print("Python 3's configparser or its backport to Python 2 is needed")  # ver. < 3.0
+    conf = ConfigParser()
+
+    parser = argparse.ArgumentParser(description='Write one update list to the Hiera files of several environments')
+    parser.add_argument('-c', '--conf-file', dest='conf_file', help='Configuration file', required=True)
+    args = parser.parse_args()
+
+    with open(args.conf_file, 'r') as conf_file:
+        conf.read_file(conf_file)
+    metrics.configure(conf, 'fan_out')
+
+    start = time.time()
+    if conf['General']['proxy'] != '':
+        os.environ['https_proxy'] = conf['General']['proxy']
+
+    try:
+        targets = target_confs(conf)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    if not targets:
+        raise SystemExit('No [' + target_prefix + '<name>] section in ' + args.conf_file)
+
+    with metrics.stage('query'):
+        repos_filter = conf.get('Package', 'pkg_repos', fallback='')
+        provider = generate_list.get_provider(conf)
+        packages_found = provider(repos_filter, True)
+    metrics.add('packages_found', len(packages_found))
+
+    workspace = GitWorkspace.from_conf(conf)
+    target_confs_by_name = dict((name, dict_to_conf(sections)) for name, sections in targets)
+    worktrees = workspace.prepare_worktrees([
+        (os.path.join(target_confs_by_name[name]['General']['cwd'], 'repo'),
+         target_confs_by_name[name]['GIT']['src_branch'], get_working_branch(target_confs_by_name[name]))
+        for name, sections in targets])
+
+    for (name, sections), worktree in zip(targets, worktrees):
+        if worktree.created or worktree.discarded:
+            remove_snapshot(snapshot_path(target_confs_by_name[name]))
+
+    messages, written, cache_entries, snapshots = run_targets(targets, packages_found, provider.tool,
+                                                              conf.getint('Targets', 'processes', fallback=4))
+
+    pushed = []
+    for (name, sections), worktree in zip(targets, worktrees):
+        target_conf = target_confs_by_name[name]
+        hiera_file = os.path.join(target_conf['General']['hiera_folder'], target_conf['General']['file'])
+        if worktree.stage(hiera_paths(target_conf, worktree.path, hiera_file, written[name])):
+            worktree.commit(messages[name])
+            pushed.append(get_working_branch(target_conf))
+        elif worktree.unpushed:
+            pushed.append(get_working_branch(target_conf))  # Commits left by a failed push, sent again
+        workspace.process_count += worktree.process_count
+        workspace.elapsed += worktree.elapsed
+    failed = set()
+    if pushed:
+        try:
+            workspace.push(pushed)  # Worktrees share the refs of the clone
+        except GitError as e:
+            # The commits stay on the local branches, the next run pushes them again or discards them
+            print(str(e))
+            failed.update(name for name, sections in targets)
+            pushed = []
+    for name, sections in targets:
+        if name not in failed:
+            generate_list.store_snapshot(snapshots[name])
+    print('GIT: %d processes in %.3fs, %d of %d branches pushed, total run %.3fs' %
+          (workspace.process_count, workspace.elapsed, len(pushed), len(targets), time.time() - start))
+
+    pr_errors = {}
+    try:
+        if conf.getboolean('PR', 'generate'):
+            client = BitbucketClient.from_conf(conf)
+            try:
+                # The branch of a failed push is not on the remote, or not up to date
+                pr_errors = propose([(name, sections) for name, sections in targets if name not in failed],
+                                    target_confs_by_name, client)
+            finally:
+                client.close()
+    except ValueError as e:
+        print('Invalid or missing value for PR/generate')
+    for name, sections in targets:
+        if name not in failed and not pr_errors.get(name):
+            generate_list.store_cache_entry(cache_entries[name])
+    metrics.emit()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import argparse
+import json
+import os
+import sys
+import generate_list
+from generate_list import bundle_package, merge_resource_dicts
+from send_pull_request import create_pr_from_conf
+from git_workspace import GitError, GitWorkspace
+from hiera_io import read_resources, write_json
+from metrics import metrics
+from pr_client import BitbucketClient, PRError
+from update_context import get_working_branch, pr_exists
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+
+def unwrap(resources, root_key):
+    if root_key in resources:
+        return resources[root_key]
+    return dict((key, value) for key, value in resources.items() if key != 'execs')
+
+
+def iter_node_resources(paths, read_stdin, root_key):
+    """
+    Yields the resources computed by generate_list.py for each node.
+    :type paths: list JSON files, or folders of JSON files, named after the node.
+    :type read_stdin: bool Also read JSON lines as {"node": "fqdn", "resources": {...}} from stdin.
+    :return: generator of (node, package resources) tuples.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            files = [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith('.json')]
+        else:
+            files = [path]
+        for node_file in files:
+            node = os.path.basename(node_file)
+            if node.endswith('.json'):
+                node = node[:-len('.json')]
+            yield node, load_resources(node_file, root_key)
+    if read_stdin:
+        for line in sys.stdin:
+            if line.strip():
+                payload = json.loads(line)
+                yield payload['node'], unwrap(payload['resources'], root_key)
+
+
+def load_resources(filename, root_key):
+    if not os.path.exists(filename):
+        return {}
+    resources, wrapped = read_resources(filename, root_key)
+    if not wrapped:
+        resources.pop('execs', None)
+    return resources
+
+
+def aggregate(nodes, load_existing=None, merge=False, known_nodes=()):
+    """
+    Merges each node's resources into what it had so far, the way merge_resources does, then narrows down the
+    resources shared by every node.
+    :type nodes: iterable (node, package resources) tuples.
+    :type load_existing: callable Returns the resources a node already has, its node file on top of the base file.
+    :type merge: bool Merge the resources of a node into the ones it already has, replace them otherwise.
+    :type known_nodes: iterable Nodes already having a file, the ones not in nodes keep their existing resources so
+    that a resource leaving the common ones stays in their files.
+    :return: tuple The common resources and a dict of per node residual resources.
+    """
+    node_resources = {}
+    for node, resources in nodes:
+        if node in node_resources:
+            node_resources[node] = merge_resource_dicts(node_resources[node], resources)
+        elif merge and load_existing:
+            node_resources[node] = merge_resource_dicts(load_existing(node), resources)
+        else:
+            node_resources[node] = dict(resources)
+    if node_resources and load_existing:
+        for node in known_nodes:
+            if node not in node_resources:
+                node_resources[node] = load_existing(node)
+
+    common = None
+    for merged in node_resources.values():
+        if common is None:
+            common = dict(merged)
+        else:
+            for key in list(common):
+                if key not in merged or merged[key] != common[key]:
+                    del common[key]
+
+    common = common or {}
+    residuals = {}
+    for node, merged in node_resources.items():
+        residuals[node] = dict((key, value) for key, value in merged.items()
+                               if key not in common or common[key] != value)
+    return common, residuals
+
+
+def write_resources(filename, resources, root_key, package_bundle):
+    if package_bundle is not None:
+        resources = bundle_package({root_key: resources}, root_key, package_bundle)
+    else:
+        resources = {root_key: resources}
+    if not os.path.isdir(os.path.dirname(filename)):
+        os.makedirs(os.path.dirname(filename))
+    write_json(filename, resources)
+
+
+if __name__ == '__main__':
+    try:
+        from configparser import ConfigParser
+    except ImportError:
+        print("Python 3's configparser or its backport to Python 2 is needed")  # ver. < 3.0
+    conf = ConfigParser()
+
+    parser = argparse.ArgumentParser(description='Aggregate the update lists of many nodes in one GIT commit and PR')
+    parser.add_argument('-c', '--conf-file', dest='conf_file', help='Configuration file', required=True)
+    parser.add_argument('--stdin', dest='stdin', action='store_true', help='Read JSON lines from stdin')
+    parser.add_argument('inputs', nargs='*', help='Node JSON files or folders, named after the node')
+    args = parser.parse_args()
+
+    with open(args.conf_file, 'r') as conf_file:
+        conf.read_file(conf_file)
+    generate_list.conf = conf
+    metrics.configure(conf, 'fleet')
+
+    root_key = conf.get('Package', 'root_key', fallback='packages')
+    workspace = GitWorkspace.from_conf(conf)
+    working_branch = get_working_branch(conf)
+    workspace.prepare(conf['GIT']['src_branch'], working_branch)
+    hiera_folder = conf['General']['hiera_folder']
+    base_file = os.path.join(hiera_folder, conf.get('General', 'base_file', fallback=conf['General']['file']))
+    node_folder = os.path.join(hiera_folder, conf.get('Fleet', 'node_folder', fallback='nodes'))
+
+    existing_base = load_resources(os.path.join(workspace.path, base_file), root_key)
+
+    def load_existing(node):
+        resources = dict((key, dict(value)) for key, value in existing_base.items())
+        resources.update(load_resources(os.path.join(workspace.path, node_folder, node + '.json'), root_key))
+        return resources
+
+    known_nodes = []
+    if os.path.isdir(os.path.join(workspace.path, node_folder)):
+        known_nodes = [name[:-len('.json')] for name in sorted(os.listdir(os.path.join(workspace.path, node_folder)))
+                       if name.endswith('.json')]
+    with metrics.stage('aggregate'):
+        common, residuals = aggregate(iter_node_resources(args.inputs, args.stdin, root_key), load_existing,
+                                      conf.getboolean('Package', 'merge', fallback=False), known_nodes)
+    metrics.add('nodes', len(residuals))
+    if not residuals:
+        print('No node update list found')
+        sys.exit(0)
+
+    package_bundle = None
+    if not (conf.has_option('Package', 'bundle') and not conf.getboolean('Package', 'bundle')):
+        package_bundle = generate_list.load_package_bundle(conf)
+
+    write_resources(os.path.join(workspace.path, base_file), common, root_key, package_bundle)
+    changed_files = [base_file]
+    for node in sorted(residuals):
+        # Written even when empty, the node files tell the next run which nodes the common resources apply to
+        node_file = os.path.join(node_folder, node + '.json')
+        changed_files.append(node_file)
+        write_resources(os.path.join(workspace.path, node_file), residuals[node], root_key, package_bundle)
+
+    committed = workspace.stage(changed_files)
+    if committed:
+        workspace.commit('Found ' + str(len(common)) + ' common packages to update on ' + str(len(residuals)) +
+                         ' nodes')
+    if committed or workspace.unpushed:
+        try:
+            workspace.push([working_branch])
+        except GitError as e:
+            # The commit stays on the local branch, the next run pushes it again. No PR for a branch not pushed
+            print(str(e), file=sys.stderr)
+            metrics.emit()
+            sys.exit(1)
+
+    try:
+        if conf.getboolean('PR', 'generate'):
+            client = BitbucketClient.from_conf(conf)
+            try:
+                if not pr_exists(conf, client):
+                    create_pr_from_conf(conf, working_branch, client)
+            except PRError as e:
+                print(str(e))
+            finally:
+                client.close()
+    except ValueError as e:
+        print('Invalid or missing value for PR/generate')
+    metrics.emit()
@@ -2,60 +2,39 @@
 
 from __future__ import print_function
 import argparse
-import json
 import os
-import platform
 import sys
+from bundle_index import BundleIndex, load_bundle_index
+from metrics import metrics
+from hiera_io import iter_resources, read_resources, write_json, write_stream
+from providers import get_provider, get_repodata_dir, get_rpmdb_dir, installers
+from resources import emit_pp, emitters, hiera_sections
+from shards import ShardLayout, default_prefix_length, hiera_exists, index_path, load_index, new_index, read_shard, \
+    shard_folder, shard_path, write_index
 
 __author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
 __copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
 __license__ = "GPL version 3"
 
-package_provider_name = 'yum'
+conf = None
+last_delta = None  # snapshot.Delta of the last run in snapshot mode
+last_paths = []  # Shards and shard index written or removed by the last run in sharded mode
+last_cache_entry = None  # Update cache entry of the last run, see store_cache_entry
+last_snapshot = None  # Snapshot of the resources of the last run, see store_snapshot
 
 multilib_pkg = {'glibc': ['i686', 'x86_64'], 'glibc-devel': ['i686', 'x86_64'], 'gnutls': ['x86_64'],
                 'libgcc': ['i686', 'x86_64'], 'libstdc++': ['i686', 'x86_64']}
 multi_ver_pkg = ['kernel', 'kernel-core', 'kernel-devel', 'kernel-modules']
 
 
-def get_linux_dist():
-    if sys.version_info[0] >= 3 and sys.version_info[1] > 6:
-        raise NotImplementedError  # 'distro' module returns different names
-    else:
-        return platform.linux_distribution()
-
-
-def query_yum(repos_filter):
-    dist = get_linux_dist()
-    if dist[0] == 'Fedora' and int(dist[1]) >= 23:
-        import dnf
-        pkg_provider = dnf.Base()
-        pkg_provider.cleanMetadata()
-        pkg_provider.read_all_repos()
-        pkg_provider.fill_sack()
-        package_list = list(pkg_provider.sack.query().upgrades())
-        global package_provider_name
-        package_provider_name = 'dnf'
-    else:
-        import yum
-        pkg_provider = yum.YumBase()
-        pkg_provider.setCacheDir()
-        pkg_provider.cleanMetadata()
-        if repos_filter:
-            for repo in repos_filter.split(','):
-                pkg_provider.repos.enableRepo(repo)
-            pkg_provider.repos.doSetup()
-        package_list = pkg_provider.doPackageLists(pkgnarrow='updates', patterns='', ignore_case=True)
-
-    clean_list = []
-    try:
-        for rpm in package_list:
-            if repos_filter == '' or rpm.repo.id in repos_filter:
-                clean_list.append({'name': rpm.name, 'repo': rpm.repo.id, 'version': rpm.version + '-' + rpm.release})
-    except:
-        print('Have you thought about exporting the http_proxy/https_proxy ENV?')
-
-    return clean_list
+def resource_title(pkg):
+    """
+    :type pkg: dict The package payload.
+    :return: str The title of its Package resource, the version is part of it for the packages in multi_ver_pkg.
+    """
+    if pkg['name'] in multi_ver_pkg:
+        return pkg['name'] + '-' + pkg['version']
+    return pkg['name']
 
 
 def get_package_resource(pkg, require, filter_repo, install_from_cache):
@@ -65,19 +44,20 @@ def get_package_resource(pkg, require, filter_repo, install_from_cache):
     :type filter_repo: bool Filters the package repository to target a specific source.
     :type install_from_cache: bool Marks the resource as meant to be installed from cache only.
     """
+    name = resource_title(pkg)
+    ensure = pkg['version']
     if pkg['name'] in multi_ver_pkg:
-        pkg['name'] += '-' + pkg['version']
-        pkg['version'] = 'installed'
-    pkg_resource = {pkg['name']: {'ensure': pkg['version']}}
+        ensure = 'installed'
+    attributes = {'ensure': ensure}
     if require:
-        pkg_resource[pkg['name']]['require'] = 'YumRepo[' + pkg['repo'] + ']'
+        attributes['require'] = 'YumRepo[' + pkg['repo'] + ']'
     if filter_repo or install_from_cache:
-        pkg_resource[pkg['name']]['install_options'] = []
+        attributes['install_options'] = []
     if filter_repo:
-        pkg_resource[pkg['name']]['install_options'].append({'--disablerepo': '*', '--enablerepo': pkg['repo']})
+        attributes['install_options'].append({'--disablerepo': '*', '--enablerepo': pkg['repo']})
     if install_from_cache:
-        pkg_resource[pkg['name']]['install_options'].append('--cacheonly')
-    return pkg_resource
+        attributes['install_options'].append('--cacheonly')
+    return {name: attributes}
 
 
 def build_hash(pkg_list, wrap, require, filter_repo, install_from_cache, root_key):
@@ -100,60 +80,113 @@ def build_hash(pkg_list, wrap, require, filter_repo, install_from_cache, root_ke
     return resources
 
 
-def merge_resources(existing_file, new_resources, root_key):
-    with open(existing_file) as json_file:
-        existing_resources = json.load(json_file)
-        if root_key in existing_resources:
-            merged_resources = existing_resources[root_key]
+def merge_resource_dicts(merged_resources, new_resources):
+    """
+    Adds the new resources to the merged ones, the ensure of an existing resource is only bumped if not 'installed'.
+    :type merged_resources: dict Package resources, updated in place.
+    :type new_resources: dict Package resources.
+    """
+    for key in new_resources:
+        if key in merged_resources:
+            if merged_resources[key]['ensure'] not in [new_resources[key]['ensure'], 'installed']:
+                merged_resources[key]['ensure'] = new_resources[key]['ensure']
         else:
-            merged_resources = existing_resources
+            merged_resources.update({key: new_resources[key]})
+    return merged_resources
 
-        if root_key in new_resources:
-            new_resources = new_resources[root_key]
 
-        for key in new_resources:
-            if key in merged_resources:
-                if merged_resources[key]['ensure'] not in [new_resources[key]['ensure'], 'installed']:
-                    merged_resources[key]['ensure'] = new_resources[key]['ensure']
-            else:
-                merged_resources.update({key: new_resources[key]})
+def merge_resources(existing_file, new_resources, root_key):
+    merged_resources, wrapped = read_resources(existing_file, root_key)
+
+    if root_key in new_resources:
+        new_resources = new_resources[root_key]
+
+    merge_resource_dicts(merged_resources, new_resources)
+
+    if wrapped:
+        merged_resources = {root_key: merged_resources}
+    return merged_resources
+
+
+def patch_resources(existing_file, delta, installed, root_key):
+    """
+    Applies the changes since the previous run to the existing resources, the removed resources are only dropped if
+    nobody changed their version and that version got installed.
+    :type delta: snapshot.Delta Only the removals applied are kept in delta.removed.
+    :type installed: frozenset (name, version) of the installed packages, see providers.Provider.installed.
+    """
+    patched_resources, wrapped = read_resources(existing_file, root_key)
+    delta.removed = patch_resource_dicts(patched_resources, delta, installed)
 
-        if root_key in existing_resources:
-            merged_resources = {root_key: merged_resources}
-        return merged_resources
+    if wrapped:
+        patched_resources = {root_key: patched_resources}
+    return patched_resources
 
 
-def get_pkg_fqdn(pkg_name, pkg_version):
+def patch_resource_dicts(patched_resources, delta, versions):
+    """
+    :type patched_resources: dict Package resources, updated in place.
+    :type delta: snapshot.Delta
+    :type versions: frozenset (name, version) of the installed packages, see providers.Provider.installed.
+    :return: dict The removed resources actually dropped from patched_resources.
+    """
+    merge_resource_dicts(patched_resources, delta.added)
+    merge_resource_dicts(patched_resources, delta.changed)
+    removed = {}
+    for key, resource in delta.removed.items():
+        if key in patched_resources and patched_resources[key].get('ensure') == resource.get('ensure') and \
+                (key, resource.get('ensure')) in versions:
+            del patched_resources[key]
+            removed[key] = resource
+    return removed
+
+
+def get_pkg_fqdns(pkg_name, pkg_version, tool='yum'):
+    """
+    :type tool: str The package manager installing the package, see providers.installers.
+    """
+    archs = None
     try:
-        if conf.getboolean('Package', 'install_multilib') and conf.getboolean('Package', 'install_multilib'):
-            if pkg_name in multilib_pkg:
-                exec_cmd = ''
-                for lib_variant in multilib_pkg[pkg_name]:
-                    exec_cmd += ' ' + pkg_name + '-' + pkg_version + '.' + lib_variant
-                return exec_cmd
+        if conf.getboolean('Package', 'install_multilib'):
+            archs = multilib_pkg.get(pkg_name)
     except Exception as e:
         pass
-    return ' ' + pkg_name + '-' + pkg_version
+    return installers[tool].package_specs(pkg_name, pkg_version, archs)
 
 
-def bundle_package(resources, root_key, package_bundle):
+def get_pkg_fqdn(pkg_name, pkg_version, tool='yum'):
+    return ' ' + ' '.join(get_pkg_fqdns(pkg_name, pkg_version, tool))
+
+
+def bundle_package(resources, root_key, package_bundle, tool='yum'):
+    """
+    :type resources: dict The package resources, optionally wrapped under root_key.
+    :type root_key: str The common root key.
+    :type package_bundle: BundleIndex|TransactionGroups|dict The compiled bundle index or transaction groups, or the
+    raw content of the bundle list.
+    :type tool: str The package manager installing the bundles, see providers.installers.
+    """
     packages = resources
     execs = {}
 
     if root_key in resources:
         packages = resources[root_key]
-
-    for pkg in packages:
-        for bundle in package_bundle:
-            if pkg in package_bundle[bundle]:
-                exec_key = 'update_' + bundle
-                if exec_key in execs:
-                    execs[exec_key]['command'] += get_pkg_fqdn(pkg, packages[pkg]['ensure'])
-                else:
-                    command = package_provider_name + ' -y install' + get_pkg_fqdn(pkg, packages[pkg]['ensure'])
-                    execs.update({exec_key: {'command': command, 'path': '/bin:/usr/bin/',
-                                             'unless': 'rpm -q ' + pkg + '-' + packages[pkg]['ensure']}})
-                packages[pkg]['require'] = 'Exec[' + exec_key + ']'
+    if isinstance(package_bundle, dict):
+        package_bundle = BundleIndex.from_bundles(package_bundle)
+
+    bundle_members = {}
+    for pkg in sorted(packages):
+        bundle = package_bundle.lookup(pkg)
+        if bundle is not None:
+            exec_key = 'update_' + bundle
+            bundle_members.setdefault(exec_key, []).append(pkg)
+            packages[pkg]['require'] = 'Exec[' + exec_key + ']'
+
+    for exec_key, members in bundle_members.items():
+        specs = []
+        for pkg in members:
+            specs.extend(get_pkg_fqdns(pkg, packages[pkg]['ensure'], tool))
+        execs[exec_key] = installers[tool].exec_resource(specs, members[0], packages[members[0]]['ensure'])
 
     if len(execs) > 0:
         return {root_key: packages, 'execs': execs}
@@ -161,38 +194,155 @@ def bundle_package(resources, root_key, package_bundle):
         return {root_key: packages}
 
 
-def strip_resources(base_file, computed_file, root_key):
-    with open(base_file) as base_json_file:
-        base_resources = json.load(base_json_file)
-        with open(computed_file) as computed_json_file:
-            computed_resources = json.load(computed_json_file)
-            if root_key in computed_resources:
-                stripped_resourced = dict(computed_resources[root_key])
-            else:
-                stripped_resourced = dict(computed_resources)
-            for key in stripped_resourced:
-                if stripped_resourced[key] in [base_resources[root_key][key], base_resources[key]]:
-                    if root_key in computed_resources:
-                        del computed_resources[root_key][key]
-                    else:
-                        del computed_resources[key]
-            return computed_resources
+def strip_resource_dicts(resources, base_resources):
+    """
+    Drops, in place, the resources identical in base_resources.
+    """
+    for key in [key for key, resource in resources.items() if base_resources.get(key) == resource]:
+        del resources[key]
+    return resources
 
 
-if __name__ == '__main__':
+def strip_resources(base_file, computed, root_key):
+    """
+    Drops from the computed resources those identical in the base file.
+    :type computed: dict|str The computed resources, optionally wrapped under root_key, or the Hiera file holding them.
+    """
+    base_resources = read_resources(base_file, root_key)[0]
+    if isinstance(computed, dict):
+        wrapped = [root_key in computed]
+        computed = computed.get(root_key, computed).items()
+    else:
+        wrapped = [False]
+        computed = iter_resources(computed, root_key, wrapped)
+    stripped_resources = {}
+    for key, resource in computed:
+        if base_resources.get(key) != resource:
+            stripped_resources[key] = resource
+    if wrapped[0]:
+        return {root_key: stripped_resources}
+    return stripped_resources
+
+
+def load_package_bundle(conf_obj):
+    """
+    :return: BundleIndex|dict The configured bundle list, empty if there is none or it cannot be read.
+    """
+    package_bundle = {}
     try:
-        from configparser import ConfigParser
-    except ImportError:
-        print("Python 3's configparser or its backport to Python 2 is needed")  # ver. < 3.0
-    conf = ConfigParser()
+        if conf_obj.has_option('Package', 'bundle_list'):
+            cache_dir = None
+            if conf_obj.has_option('General', 'cwd'):
+                cache_dir = os.path.join(conf_obj['General']['cwd'], '.cache')
+            package_bundle = load_bundle_index(conf_obj['Package']['bundle_list'], cache_dir)
+    except Exception as e:
+        pass
+    return package_bundle
 
-    parser = argparse.ArgumentParser(description='YUM update parser for Puppet resource')
-    parser.add_argument('-c', '--conf-file', dest='conf_file', help='Configuration file')
-    args = parser.parse_args()
 
-    if args.conf_file and os.path.exists(args.conf_file):
-        with open(args.conf_file, 'r') as conf_file:
-            conf.read_file(conf_file)
+def update_shards(working_file, resources, root_key, layout, merge=True, base_file=None, delta=None, versions=None,
+                  tool='yum'):
+    """
+    Merges, strips, bundles and writes only the shards holding computed resources, see shards. All the shards are
+    rewritten on the first run, without merge or when the layout changed.
+    :type resources: dict The computed resources, optionally wrapped under root_key.
+    :type layout: ShardLayout Bundles the resources with its package_bundle if not None.
+    :type base_file: str Hiera file, or sharded Hiera file with the same layout, whose resources are stripped.
+    :type delta: snapshot.Delta Patches the shards with the changes since the previous run instead of merging, only
+    the removals applied are then kept in delta.removed.
+    :type versions: frozenset Installed (name, version-release), see patch_resource_dicts.
+    :return: dict The resources of the shards written, wrapped under root_key.
+    """
+    folder = shard_folder(working_file)
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    snapshot_delta = delta
+    wrapped = root_key in resources
+    computed = resources.get(root_key, resources)
+    index = load_index(folder)
+    existing = set(index['shards']) if index is not None else set()
+
+    if index is not None and index['layout'] != layout.key():
+        moved = {}
+        if merge:  # The resources already in the shards move to their new shard
+            for shard in existing:
+                moved.update(read_shard(folder, shard, root_key))
+        updates = layout.partition(merge_resource_dicts(moved, computed))
+        touched = existing | set(updates)
+        reread = False
+        delta = None
+    elif delta is not None and index is not None and merge:
+        from snapshot import Delta
+        updates = {}
+        for change in ('added', 'changed', 'removed'):
+            for title, resource in getattr(delta, change).items():
+                getattr(updates.setdefault(layout.shard(title), Delta()), change)[title] = resource
+        touched = set(updates)
+        reread = True
+    else:
+        updates = layout.partition(computed)
+        touched = set(updates) if merge else existing | set(updates)
+        reread = merge
+        delta = None
+    if index is None or index['layout'] != layout.key():
+        index = new_index(layout, wrapped)
+
+    base_folder = None
+    base_resources = {}
+    if base_file:
+        base_index = load_index(shard_folder(base_file))
+        if base_index is not None and base_index['layout'] == layout.key():
+            base_folder = shard_folder(base_file)
+        elif os.path.exists(base_file):
+            base_resources = read_resources(base_file, root_key)[0]
+
+    written = {}
+    removed = {}
+    for shard in sorted(touched):
+        path = shard_path(folder, shard)
+        shard_resources = read_shard(folder, shard, root_key) if reread else {}
+        if delta is not None:
+            removed.update(patch_resource_dicts(shard_resources, updates[shard], versions))
+        else:
+            merge_resource_dicts(shard_resources, updates.get(shard, {}))
+        strip_resource_dicts(shard_resources, read_shard(base_folder, shard, root_key) if base_folder
+                             else base_resources)
+
+        if not shard_resources:
+            index['shards'].pop(shard, None)
+            if os.path.exists(path):
+                os.remove(path)
+                last_paths.append(path)
+            continue
+        index['shards'][shard] = len(shard_resources)
+        written.update(shard_resources)
+        hiera = {root_key: shard_resources} if wrapped else shard_resources
+        if layout.package_bundle is not None:
+            hiera = bundle_package(hiera, root_key, layout.package_bundle, tool)
+        if write_json(path, hiera):
+            last_paths.append(path)
+
+    if snapshot_delta is not None:
+        snapshot_delta.removed = removed  # Merging instead of patching drops none
+    if write_index(folder, index):
+        last_paths.append(index_path(folder))
+    metrics.add('shards_touched', len(touched))
+    return {root_key: written}
+
+
+def run(conf_obj, provider=None):
+    """
+    Queries the package provider and builds, merges and bundles the Package resources as set in the configuration.
+    :type conf_obj: ConfigParser The configuration.
+    :type provider: function Replaces the configured package provider, see get_provider.
+    :return: dict The resources, None if there is nothing to update.
+    """
+    global conf, last_delta, last_paths, last_cache_entry, last_snapshot
+    conf = conf_obj
+    last_delta = None
+    last_paths = []
+    last_cache_entry = None
+    last_snapshot = None
 
     if conf.has_option('Package', 'root_key'):
         root_key = conf['Package']['root_key']
@@ -203,45 +353,208 @@ if __name__ == '__main__':
         os.environ['http_proxy'] = conf['General']['proxy']
         os.environ['https_proxy'] = conf['General']['proxy']
 
+    repos_filter = ''
     if conf.has_option('Package', 'pkg_repos'):
-        packages_found = query_yum(conf['Package']['pkg_repos'])
-    else:
-        packages_found = query_yum('')
+        repos_filter = conf['Package']['pkg_repos']
+
+    repodata_dir = get_repodata_dir(conf)
+    cache_key = None
+    clean_metadata = True
+    if conf.has_option('Cache', 'enabled') and conf.getboolean('Cache', 'enabled') and \
+            conf.has_option('General', 'cwd'):
+        import update_cache
+        cache_dir = os.path.join(conf['General']['cwd'], '.cache')
+        cache_ttl = conf.getint('Cache', 'ttl', fallback=update_cache.default_ttl)
+        with metrics.stage('cache_lookup'):
+            cache_key = update_cache.compute_key(repodata_dir, repos_filter, get_rpmdb_dir(conf))
+            cached_list = update_cache.lookup(cache_dir, cache_key, cache_ttl)
+        if cached_list is not None:
+            metrics.add('cache_hits')
+            print('No change in repository metadata or installed packages since last run')
+            return None
+        clean_metadata = not update_cache.has_fresh_entry(cache_dir, cache_ttl)
+
+    provider = provider or get_provider(conf)
+    with metrics.stage('query'):
+        packages_found = provider(repos_filter, clean_metadata)
+    metrics.add('packages_found', len(packages_found))
+
+    if cache_key:
+        # The provider may have refreshed the metadata, key the list on what it was computed from
+        cache_key = update_cache.compute_key(repodata_dir, repos_filter, get_rpmdb_dir(conf))
+        last_cache_entry = (cache_dir, cache_key, packages_found, cache_ttl,
+                            conf.getint('Cache', 'max_size', fallback=update_cache.default_max_size))
+
+    from updateinfo import filter_from_conf, filter_packages, index_from_conf
+    advisory_types, min_severity = filter_from_conf(conf)
+    if advisory_types or min_severity:
+        with metrics.stage('updateinfo'):
+            updateinfo = index_from_conf(conf)
+            if updateinfo:
+                packages_found = filter_packages(packages_found, updateinfo, advisory_types, min_severity)
+            else:
+                # Filtering against no advisory would drop every update
+                print('No updateinfo found in ' + repodata_dir + ', updates are not filtered by advisory')
+        metrics.add('packages_selected', len(packages_found))
 
     if len(packages_found) > 0:
-        if args.conf_file:
-            resources = build_hash(packages_found, conf.getboolean('Package', 'wrap'),
-                                   conf.getboolean('Package', 'require'),
-                                   conf.getboolean('Package', 'repo_in_resource'),
-                                   conf.getboolean('Package', 'install_from_cache'), root_key)
-        else:
-            resources = build_hash(packages_found, True, False, False, False, root_key)
+        output_format = conf.get('Package', 'format', fallback='json')  # Only JSON files are merged and stripped
+        with metrics.stage('build_hash'):
+            if conf.has_option('Package', 'wrap'):
+                resources = build_hash(packages_found, conf.getboolean('Package', 'wrap'),
+                                       conf.getboolean('Package', 'require'),
+                                       conf.getboolean('Package', 'repo_in_resource'),
+                                       conf.getboolean('Package', 'install_from_cache'), root_key)
+            else:
+                resources = build_hash(packages_found, True, False, False, False, root_key)
         if conf.has_option('Package', 'save') and conf.getboolean('Package', 'save'):
             working_file = os.path.join(conf['General']['cwd'], conf['GIT']['name'], conf['General']['hiera_folder'],
                                         conf['General']['file'])
-            if conf.getboolean('Package', 'merge') and os.path.exists(working_file):
-                resources = merge_resources(working_file, resources, root_key)
-
-            if conf.has_option('General', 'base_file') and conf['General']['file'] != conf['General']['base_file']:
+            snapshot_path = None
+            if conf.has_option('Package', 'snapshot') and conf.getboolean('Package', 'snapshot'):
+                import snapshot
+                snapshot_path = snapshot.snapshot_path(conf)
+                with metrics.stage('snapshot_diff'):
+                    computed = resources.get(root_key, resources)
+                    # Copied before bundle_package adds its 'require' to the resources
+                    computed = dict((key, dict(resource)) for key, resource in computed.items())
+                    previous = snapshot.load_snapshot(snapshot_path)
+                    try:
+                        last_delta = snapshot.diff(previous, computed)
+                    finally:
+                        if previous is not None:
+                            previous.close()
+                metrics.add('resources_added', len(last_delta.added))
+                metrics.add('resources_changed', len(last_delta.changed))
+                metrics.add('resources_removed', len(last_delta.removed))
+                if previous is not None and len(last_delta) == 0 and hiera_exists(working_file):
+                    print('No change since the last run')
+                    return None
+
+            base_file = None
+            if conf.has_option('General', 'base_file') and conf['General']['file'] != conf['General']['base_file'] \
+                    and output_format == 'json':
                 base_file = os.path.join(conf['General']['cwd'], conf['GIT']['name'], conf['General']['hiera_folder'],
                                          conf['General']['base_file'])
-                if os.path.exists(base_file):  # If node is first in group, base_file might not exist or be outdated
-                    resources = strip_resources(base_file, working_file, root_key)
+
+            shard_strategy = conf.get('Package', 'shards', fallback='')
+            if shard_strategy and output_format == 'json':
+                package_bundle = None
+                if not (conf.has_option('Package', 'bundle') and not conf.getboolean('Package', 'bundle')):
+                    package_bundle = load_package_bundle(conf)
+                    if isinstance(package_bundle, dict):
+                        package_bundle = BundleIndex.from_bundles(package_bundle)
+                    if conf.has_option('Package', 'auto_bundle') and conf.getboolean('Package', 'auto_bundle'):
+                        print('Transaction groups are not used with shards, only the bundle list is')
+                layout = ShardLayout(shard_strategy, conf.getint('Package', 'shard_prefix_length',
+                                                                 fallback=default_prefix_length), package_bundle)
+                versions = None
+                if snapshot_path and previous is not None:
+                    versions = provider.installed()
+                with metrics.stage('shards'):
+                    resources = update_shards(working_file, resources, root_key, layout,
+                                              conf.getboolean('Package', 'merge'), base_file,
+                                              last_delta if versions is not None else None, versions,
+                                              getattr(provider, 'tool', 'yum'))
+                metrics.add('package_resources', len(resources[root_key]))
+                if snapshot_path:
+                    last_snapshot = (snapshot_path, computed)
+                return resources
+
+            if conf.getboolean('Package', 'merge') and output_format == 'json' and os.path.exists(working_file):
+                if snapshot_path and previous is not None:
+                    with metrics.stage('patch'):
+                        resources = patch_resources(working_file, last_delta, provider.installed(), root_key)
+                else:
+                    with metrics.stage('merge'):
+                        resources = merge_resources(working_file, resources, root_key)
+
+            # If node is first in group, base_file might not exist or be outdated
+            if base_file and os.path.exists(base_file):
+                with metrics.stage('strip'):
+                    resources = strip_resources(base_file, resources, root_key)
 
         if not (conf.has_option('Package', 'bundle') and not conf.getboolean('Package', 'bundle')):
-            package_bundle = {}
-            try:
-                if conf.has_option('Package', 'bundle_list'):
-                    with open(conf['Package']['bundle_list']) as json_file:
-                        package_bundle = json.load(json_file)
-            except Exception as e:
-                pass
-            resources = bundle_package(resources, root_key, package_bundle)
-
-        if conf.has_option('Package', 'save') and conf.getboolean('Package', 'save') and working_file:
-            with open(working_file, 'w') as outfile:
-                json.dump(resources, outfile, indent=4, sort_keys=True)
-        else:
-            print(json.dumps(resources, indent=4, sort_keys=True))
+            package_bundle = load_package_bundle(conf)
+            if conf.has_option('Package', 'auto_bundle') and conf.getboolean('Package', 'auto_bundle'):
+                from transaction_groups import group_packages, read_dependencies
+                with metrics.stage('transaction_groups'):
+                    # Read along the updates by the providers parsing the primary metadata, else read here
+                    providers, requires = read_dependencies(packages_found, repodata_dir,
+                                                            getattr(provider, 'dependencies', None))
+                    if isinstance(package_bundle, dict):
+                        package_bundle = BundleIndex.from_bundles(package_bundle)
+                    names = dict((resource_title(pkg), pkg['name']) for pkg in packages_found)
+                    # Merged resources are not in packages_found, they still follow the static bundles
+                    pkg_names = dict((title, names.get(title, title)) for title in resources.get(root_key, resources))
+                    package_bundle = group_packages(pkg_names, providers, requires, package_bundle)
+            with metrics.stage('bundle'):
+                resources = bundle_package(resources, root_key, package_bundle, getattr(provider, 'tool', 'yum'))
+
+        with metrics.stage('dump'):
+            package_section, exec_section = hiera_sections(resources, root_key)[:2]
+            metrics.add('package_resources', len(package_section))
+            metrics.add('exec_resources', len(exec_section))
+            if output_format == 'pp':
+                chunks = emit_pp(resources, root_key, conf.get('Package', 'pp_class', fallback=''))
+            else:
+                chunks = emitters[output_format](resources, root_key)
+            if conf.has_option('Package', 'save') and conf.getboolean('Package', 'save') and working_file:
+                if not write_stream(working_file, chunks):
+                    print('No change to ' + working_file)
+                if snapshot_path:
+                    last_snapshot = (snapshot_path, computed)
+            else:
+                for chunk in chunks:
+                    sys.stdout.write(chunk)
+                sys.stdout.write('\n')
+        return resources
     else:
         print('No package to update')
+        return None
+
+
+def store_cache_entry(entry):
+    """
+    Caches the update list once what it was computed for succeeded, until then the next run computes it again.
+    :type entry: tuple The last_cache_entry of a run, None when the cache is disabled.
+    """
+    if entry is not None:
+        import update_cache
+        update_cache.store(*entry)
+
+
+def store_snapshot(entry):
+    """
+    Writes the snapshot once the resources it lists are on the remote branch, until then the next run diffs against
+    the previous snapshot and writes the same changes again.
+    :type entry: tuple The last_snapshot of a run, None when the snapshot mode is off or nothing was written.
+    """
+    if entry is not None:
+        import snapshot
+        snapshot.write_snapshot(*entry)
+
+
+def main(conf):
+    metrics.configure(conf, 'generate_list')
+    run(conf)
+    store_snapshot(last_snapshot)
+    store_cache_entry(last_cache_entry)
+    metrics.emit()
+
+
+if __name__ == '__main__':
+    try:
+        from configparser import ConfigParser
+    except ImportError:
+        print("Python 3's configparser or its backport to Python 2 is needed")  # ver. < 3.0
+    conf = ConfigParser()
+
+    parser = argparse.ArgumentParser(description='YUM update parser for Puppet resource')
+    parser.add_argument('-c', '--conf-file', dest='conf_file', help='Configuration file')
+    args = parser.parse_args()
+
+    if args.conf_file and os.path.exists(args.conf_file):
+        with open(args.conf_file, 'r') as conf_file:
+            conf.read_file(conf_file)
+    main(conf)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import os
+import shutil
+import subprocess
+import time
+from metrics import metrics
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+
+class GitError(Exception):
+    pass
+
+
+class GitWorkspace(object):
+    """
+    A shallow clone, reused across runs, where only the sparse paths (the hiera folder) are checked out.
+    Branches are resolved with ls-remote and files are staged with hash-object/update-index, every git
+    process spawned is counted and timed in process_count and elapsed.
+    """
+
+    def __init__(self, path, url, sparse_paths=None, proxy='', user_name='', user_email=''):
+        """
+        :type path: str Folder of the local clone.
+        :type url: str URL of the remote repository, with credentials if any.
+        :type sparse_paths: list Folders to check out, everything if None.
+        :type proxy: str HTTP(S) proxy used for the remote.
+        :type user_name: str Author of the commits.
+        :type user_email: str Author e-mail of the commits.
+        """
+        self.path = path
+        self.url = url
+        self.sparse_paths = sparse_paths
+        self.options = []
+        if proxy:
+            self.options += ['-c', 'http.proxy=' + proxy, '-c', 'https.proxy=' + proxy]
+        if user_name:
+            self.options += ['-c', 'user.name=' + user_name]
+        if user_email:
+            self.options += ['-c', 'user.email=' + user_email]
+        self.process_count = 0
+        self.elapsed = 0.0
+        self.created = False  # The working branch was created from the source branch by the last prepare
+        self.unpushed = False  # The working branch kept local commits missing on the remote, see prepare
+        self.discarded = False  # The last prepare dropped local commits missing on the remote
+        self.returncode = 0
+
+    @classmethod
+    def from_conf(cls, conf):
+        url = conf['GIT']['url']
+        if conf.has_option('GIT', 'user') and conf['GIT']['user'] != '':
+            url = url.replace('https://', 'https://' + conf['GIT']['user'] + ':' + conf['GIT']['password'] + '@')
+        return cls(os.path.join(conf['General']['cwd'], conf['GIT']['name']), url,
+                   [conf.get('General', 'hiera_folder', fallback='hiera')], conf.get('General', 'proxy', fallback=''),
+                   conf.get('GIT', 'username', fallback=''), conf.get('GIT', 'email', fallback=''))
+
+    def git(self, args, stdin=None, cwd=None, check=True):
+        """
+        :type args: list Arguments of the git command.
+        :type stdin: bytes Data sent to the process.
+        :type check: bool Raise GitError on a non zero exit status.
+        :return: bytes The standard output.
+        """
+        start = time.time()
+        process = subprocess.Popen(['git'] + self.options + args, cwd=cwd or self.path, stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = process.communicate(stdin)
+        self.returncode = process.returncode
+        elapsed = time.time() - start
+        self.process_count += 1
+        self.elapsed += elapsed
+        metrics.record('git_' + args[0], elapsed)
+        metrics.add('git_processes')
+        if check and process.returncode != 0:
+            raise GitError('git ' + ' '.join(args) + ' failed: ' + err.decode('utf-8', 'replace').strip())
+        return out
+
+    def exists(self):
+        return os.path.exists(os.path.join(self.path, '.git', 'index')) or \
+            os.path.exists(os.path.join(self.path, '.git', 'HEAD'))
+
+    def clone(self):
+        if os.path.isdir(self.path) and not self.exists():
+            if self.path.startswith('/tmp') and len(os.path.split(self.path)) >= 2:
+                """ Want to be sure that a sensitive folder cannot be passed to the program"""
+                shutil.rmtree(self.path)
+        parent = os.path.dirname(self.path)
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+        self.git(['clone', '--depth', '1', '--no-single-branch', '--no-checkout', self.url, self.path], cwd=parent)
+        if self.sparse_paths:
+            self.git(['config', 'core.sparseCheckout', 'true'])
+            with open(os.path.join(self.path, '.git', 'info', 'sparse-checkout'), 'w') as sparse_file:
+                for sparse_path in self.sparse_paths:
+                    sparse_file.write('/' + sparse_path.strip('/') + '/\n')
+
+    def remote_branches(self, branches):
+        """
+        :return: set The branches found on the remote, in one ls-remote call.
+        """
+        out = self.git(['ls-remote', '--heads', 'origin'] + ['refs/heads/' + branch for branch in branches])
+        found = set()
+        for line in out.decode('utf-8').splitlines():
+            found.add(line.split('\t', 1)[1][len('refs/heads/'):])
+        return found
+
+    def prepare(self, src_branch, working_branch):
+        """
+        Fetches and checks out working_branch, created from src_branch when missing on the remote. Local commits of
+        working_branch left by a failed push are kept when they build on the remote branch, so that the next push
+        sends them, they are discarded when the remote branch moved in the meantime.
+        :return: bool True if working_branch was created from src_branch, discarded tells whether local commits were
+        dropped.
+        """
+        if not self.exists():
+            self.clone()
+        remote = self.remote_branches([src_branch, working_branch])
+        base_branch = working_branch if working_branch in remote else src_branch
+        self.fetch([base_branch])
+        return self.checkout(working_branch, base_branch)
+
+    def checkout(self, working_branch, base_branch, options=()):
+        """
+        Checks out working_branch at origin/base_branch, or at its local commits building on it, as described in
+        prepare. Sets created, unpushed and discarded.
+        :type options: tuple Extra options of git checkout.
+        :return: bool True if working_branch was created from another branch.
+        """
+        base_ref = 'refs/remotes/origin/' + base_branch
+        local = self.git(['rev-parse', '--verify', '--quiet', 'refs/heads/' + working_branch], check=False).strip()
+        self.unpushed = False
+        self.discarded = False
+        if local and local != self.git(['rev-parse', base_ref]).strip():
+            self.git(['merge-base', '--is-ancestor', base_ref, local.decode('ascii')], check=False)
+            if self.returncode == 0:
+                self.unpushed = True
+            else:
+                self.discarded = True
+                print('Discarding the local commits of ' + working_branch + ', origin/' + base_branch + ' moved')
+        if self.unpushed:
+            self.git(['checkout', '--force'] + list(options) + [working_branch])
+        else:
+            self.git(['checkout', '--force'] + list(options) + ['-B', working_branch, base_ref])
+        self.created = base_branch != working_branch and not self.unpushed
+        return self.created
+
+    def fetch(self, branches):
+        """
+        Shallow fetch of the branches, in one call.
+        """
+        self.git(['fetch', '--depth', '1', 'origin'] +
+                 ['+refs/heads/' + branch + ':refs/remotes/origin/' + branch for branch in branches])
+
+    def prepare_worktrees(self, worktrees):
+        """
+        Checks out each working branch in its own worktree sharing the objects of this clone, the branches of all the
+        worktrees are resolved with one ls-remote and fetched at once. Unpushed local commits are kept or discarded
+        as by prepare.
+        :type worktrees: list (path, src_branch, working_branch) tuples.
+        :return: list The GitWorkspace of each worktree, in the same order.
+        """
+        if not self.exists():
+            self.clone()
+        branches = set()
+        for path, src_branch, working_branch in worktrees:
+            branches.update([src_branch, working_branch])
+        remote = self.remote_branches(sorted(branches))
+        base_branches = [working_branch if working_branch in remote else src_branch
+                         for path, src_branch, working_branch in worktrees]
+        self.fetch(sorted(set(base_branches)))
+        self.git(['worktree', 'prune'])
+
+        workspaces = []
+        for (path, src_branch, working_branch), base_branch in zip(worktrees, base_branches):
+            worktree = GitWorkspace(path, self.url, self.sparse_paths)
+            worktree.options = self.options
+            if not os.path.exists(os.path.join(path, '.git')):
+                if not os.path.isdir(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+                self.git(['worktree', 'add', '--force', '--no-checkout', path, 'refs/remotes/origin/' + base_branch])
+                if self.sparse_paths:
+                    # Each worktree reads its own sparse-checkout file
+                    git_dir = worktree.git(['rev-parse', '--git-dir']).decode('utf-8').strip()
+                    info_dir = os.path.join(path, git_dir, 'info')
+                    if not os.path.isdir(info_dir):
+                        os.makedirs(info_dir)
+                    with open(os.path.join(info_dir, 'sparse-checkout'), 'w') as sparse_file:
+                        for sparse_path in self.sparse_paths:
+                            sparse_file.write('/' + sparse_path.strip('/') + '/\n')
+            worktree.checkout(working_branch, base_branch, ('--ignore-other-worktrees',))
+            self.process_count += worktree.process_count
+            self.elapsed += worktree.elapsed
+            worktree.process_count, worktree.elapsed = 0, 0.0
+            workspaces.append(worktree)
+        return workspaces
+
+    def stage(self, paths):
+        """
+        Stages files of the working tree with hash-object/update-index, missing files are removed from the index.
+        :type paths: list Paths relative to the repository root.
+        :return: bool True if the index changed.
+        """
+        present = [path for path in paths if os.path.exists(os.path.join(self.path, path))]
+        index_info = []
+        if present:
+            shas = self.git(['hash-object', '-w', '--'] + present).decode('utf-8').split()
+            for path, sha in zip(present, shas):
+                index_info.append('100644 ' + sha + '\t' + path)
+        for path in paths:
+            if path not in present:
+                index_info.append('0 ' + '0' * 40 + '\t' + path)
+        if not index_info:
+            return False
+        self.git(['update-index', '--index-info'], stdin=('\n'.join(index_info) + '\n').encode('utf-8'))
+        return self.has_staged_changes()
+
+    def has_staged_changes(self):
+        return self.git(['diff-index', '--cached', '--name-only', 'HEAD', '--']).strip() != b''
+
+    def commit(self, message):
+        self.git(['commit', '--quiet', '-m', message])
+
+    def push(self, branches):
+        self.git(['push', '--quiet', 'origin'] + ['refs/heads/' + branch for branch in branches])
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import hashlib
+import io
+import json
+import numbers
+import os
+from metrics import metrics
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+# Reads Hiera JSON files one resource at a time and writes them incrementally, the same way json.dump(indent=4,
+# sort_keys=True) would, leaving the file untouched when its content would not change.
+
+chunk_size = 64 * 1024
+whitespace = ' \t\n\r'
+number_chars = '0123456789+-.eE'
+
+
+class _ObjectReader(object):
+    """
+    Minimal pull parser walking the members of JSON objects, the values of the members are decoded one at a time.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        data = self.fileobj.read(chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        if self.pos > chunk_size:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        self.buffer += data
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in whitespace:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError('Expecting ' + repr(char) + ' at offset ' + str(self.pos))
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number cut by the end of the buffer (1. of 1.5) decodes fine, only trust one followed by a
+                # character that cannot continue it
+                if self.eof or not isinstance(value, numbers.Number) or isinstance(value, bool) or \
+                        (end < len(self.buffer) and self.buffer[end] not in number_chars):
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def members(self):
+        """
+        :return: generator of the keys of the object starting at the current position, the caller must consume the
+        value (value() or members()) before asking for the next key.
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect('}')
+            return
+
+
+def iter_resources(filename, root_key, wrapped=None):
+    """
+    Iterates over the resources of a Hiera file without loading it whole, the resources are the members of root_key
+    if the file has it, the top level members otherwise.
+    :type wrapped: list Set to [True] when the file has root_key, [False] otherwise, once the iteration is over.
+    :return: generator of (resource title, resource) tuples.
+    """
+    with io.open(filename, encoding='utf-8') as json_file:
+        reader = _ObjectReader(json_file)
+        if reader.peek() != '{':
+            if wrapped is not None:
+                wrapped[:] = [False]
+            return
+        others = []
+        found = False
+        for key in reader.members():
+            if key == root_key and reader.peek() == '{':
+                found = True
+                for title in reader.members():
+                    yield title, reader.value()
+            else:
+                others.append((key, reader.value()))
+        if wrapped is not None:
+            wrapped[:] = [found]
+        if not found:
+            for key, value in others:
+                yield key, value
+
+
+def read_resources(filename, root_key):
+    """
+    :return: tuple The resources dict, and True if they were wrapped under root_key.
+    """
+    wrapped = [False]
+    resources = dict(iter_resources(filename, root_key, wrapped))
+    return resources, wrapped[0]
+
+
+def file_digest(filename):
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as existing_file:
+        while True:
+            data = existing_file.read(chunk_size)
+            if not data:
+                break
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def write_stream(filename, chunks):
+    """
+    Writes text chunks to a temporary file, which only replaces filename if the content differs.
+    :type chunks: iterable Text chunks, as produced by an encoder or an emitter.
+    :return: bool True if filename was written.
+    """
+    digest = hashlib.sha1()
+    size = 0
+    tmp_file = filename + '.' + str(os.getpid())
+    try:
+        with open(tmp_file, 'wb') as outfile:
+            for chunk in chunks:
+                chunk = chunk.encode('utf-8')
+                digest.update(chunk)
+                outfile.write(chunk)
+                size += len(chunk)
+        if os.path.exists(filename) and file_digest(filename) == digest.hexdigest():
+            metrics.add('files_unchanged')
+            return False
+        os.rename(tmp_file, filename)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    metrics.add('files_written')
+    metrics.add('bytes_written', size)
+    return True
+
+
+def write_json(filename, data):
+    """
+    Encodes data chunk by chunk with write_stream.
+    :return: bool True if filename was written.
+    """
+    encoder = json.JSONEncoder(indent=4, sort_keys=True, separators=(',', ': '))
+    return write_stream(filename, encoder.iterencode(data))
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import json
+import os
+import socket
+import time
+from contextlib import contextmanager
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+try:
+    cpu_time = time.process_time
+except AttributeError:  # Python 2
+    cpu_time = time.clock
+
+metric_prefix = 'update_with_puppet_'
+
+
+class Metrics(object):
+    """
+    Collects per stage wall/CPU time and counters of a run, written as one JSON line and/or a Prometheus textfile
+    collector file. Nothing is written until configured.
+    """
+
+    def __init__(self):
+        self.jsonl_file = None
+        self.textfile = None
+        self.program = None
+        self.reset()
+
+    def reset(self):
+        """
+        Starts a new run, for the processes doing several.
+        """
+        self.stages = []
+        self.counters = {}
+        self.started = time.time()
+
+    def configure(self, conf, program):
+        """
+        :type conf: ConfigParser Reads the [Metrics] section.
+        :type program: str Name of the entry point, added to every record.
+        """
+        self.program = program
+        if conf.has_option('Metrics', 'enabled') and conf.getboolean('Metrics', 'enabled'):
+            self.jsonl_file = conf.get('Metrics', 'jsonl_file', fallback='') or None
+            self.textfile = conf.get('Metrics', 'textfile', fallback='') or None
+
+    @property
+    def enabled(self):
+        return bool(self.jsonl_file or self.textfile)
+
+    @contextmanager
+    def stage(self, name):
+        wall_start = time.time()
+        cpu_start = cpu_time()
+        try:
+            yield
+        finally:
+            self.record(name, time.time() - wall_start, cpu_time() - cpu_start)
+
+    def record(self, name, wall, cpu=0.0):
+        self.stages.append({'stage': name, 'wall': round(wall, 6), 'cpu': round(cpu, 6)})
+
+    def add(self, counter, value=1):
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def totals(self):
+        """
+        :return: dict Stage name to the summed (wall, cpu) time, stages can run more than once.
+        """
+        totals = {}
+        for record in self.stages:
+            wall, cpu = totals.get(record['stage'], (0.0, 0.0))
+            totals[record['stage']] = (wall + record['wall'], cpu + record['cpu'])
+        return totals
+
+    def write_jsonl(self, filename):
+        record = {'timestamp': time.time(), 'host': socket.getfqdn(), 'program': self.program,
+                  'duration': round(time.time() - self.started, 6), 'stages': self.stages, 'counters': self.counters}
+        with open(filename, 'a') as jsonl_file:
+            jsonl_file.write(json.dumps(record, sort_keys=True) + '\n')
+
+    def write_textfile(self, filename):
+        labels = '{program="' + (self.program or '') + '"'
+        totals = self.totals()
+        lines = []
+        for position, (kind, description) in enumerate((('wall', 'Wall'), ('cpu', 'CPU'))):
+            name = metric_prefix + 'stage_' + kind + '_seconds'
+            lines.append('# HELP ' + name + ' ' + description + ' time spent in a stage during the last run.')
+            lines.append('# TYPE ' + name + ' gauge')
+            for stage in sorted(totals):
+                lines.append(name + labels + ',stage="' + stage + '"} ' + repr(totals[stage][position]))
+        for counter in sorted(self.counters):
+            lines.append('# TYPE ' + metric_prefix + counter + ' gauge')
+            lines.append(metric_prefix + counter + labels + '} ' + repr(self.counters[counter]))
+        lines.append('# TYPE ' + metric_prefix + 'last_run_timestamp_seconds gauge')
+        lines.append(metric_prefix + 'last_run_timestamp_seconds' + labels + '} ' + repr(time.time()))
+        tmp_file = filename + '.' + str(os.getpid())  # The collector must never read a partial file
+        with open(tmp_file, 'w') as prom_file:
+            prom_file.write('\n'.join(lines) + '\n')
+        os.rename(tmp_file, filename)
+
+    def emit(self):
+        try:
+            if self.jsonl_file:
+                self.write_jsonl(self.jsonl_file)
+            if self.textfile:
+                self.write_textfile(self.textfile)
+        except (IOError, OSError) as e:
+            print('Could not write metrics: ' + str(e))
+
+
+metrics = Metrics()
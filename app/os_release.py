@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import os
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+# Distribution detection from /etc/os-release, read once per process. platform.linux_distribution() is gone since
+# Python 3.8 and only used on hosts without os-release (CentOS 6).
+
+os_release_paths = ['/etc/os-release', '/usr/lib/os-release']
+supported_dist_ids = frozenset(['centos', 'debian', 'fedora', 'rhel', 'suse', 'ubuntu'])
+
+_os_release = None
+
+
+def parse_os_release(lines):
+    """
+    :type lines: iterable Lines of an os-release file, KEY=value with shell quoting.
+    :return: dict
+    """
+    release = {}
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#') or '=' not in line:
+            continue
+        key, value = line.split('=', 1)
+        quote = value[:1]
+        if len(value) >= 2 and quote in '"\'' and value[-1] == quote:
+            value = value[1:-1]
+            if quote == '"':
+                for escaped in ('\\"', '\\$', '\\`', '\\\\'):
+                    value = value.replace(escaped, escaped[1])
+        release[key] = value
+    return release
+
+
+def os_release():
+    """
+    :return: dict The fields of os-release, memoized.
+    """
+    global _os_release
+    if _os_release is None:
+        _os_release = {}
+        for path in os_release_paths:
+            if os.path.exists(path):
+                with open(path) as release_file:
+                    _os_release = parse_os_release(release_file)
+                break
+        if not _os_release:
+            try:
+                import platform
+                name, version, codename = platform.linux_distribution()
+                _os_release = {'NAME': name, 'VERSION_ID': version, 'VERSION_CODENAME': codename,
+                               'ID': name.split()[0].lower() if name else ''}
+            except (AttributeError, ImportError):
+                pass
+    return _os_release
+
+
+def get_linux_dist():
+    """
+    :return: tuple (name, version, codename), like platform.linux_distribution() did.
+    """
+    release = os_release()
+    return release.get('NAME', ''), release.get('VERSION_ID', ''), release.get('VERSION_CODENAME', '')
+
+
+def dist_ids():
+    """
+    :return: frozenset The ID of the distribution and the IDs it is like, ex: centos, rhel and fedora on CentOS.
+    """
+    release = os_release()
+    return frozenset([release.get('ID', '')] + release.get('ID_LIKE', '').split()) - frozenset([''])
+
+
+def major_version():
+    version = os_release().get('VERSION_ID', '').split('.')[0]
+    return int(version) if version.isdigit() else 0
+
+
+def is_supported():
+    return bool(dist_ids() & supported_dist_ids)
+
+
+def use_dnf():
+    """
+    Fedora 23 and the Enterprise Linux 8 family replaced yum with dnf.
+    """
+    ids = dist_ids()
+    if os_release().get('ID') == 'fedora':
+        return major_version() >= 23
+    return 'fedora' in ids and major_version() >= 8
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import base64
+import json
+import os
+import socket
+import time
+from metrics import metrics
+
+try:
+    import http.client as httplib
+    from urllib.parse import urlencode, urljoin, urlparse
+except ImportError:  # Python 2
+    import httplib
+    from urllib import urlencode
+    from urlparse import urljoin, urlparse
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+etag_cache_file = 'pr_etags.json'
+max_cached_responses = 100
+retry_status = (429, 500, 502, 503, 504)
+retry_status_unsafe = (429, 503)  # Not processed by the server, safe to resend a POST
+
+
+class PRError(Exception):
+    pass
+
+
+class BitbucketClient(object):
+    """
+    Bitbucket pull request API client keeping its connections open between requests. GET responses are cached with
+    their ETag so unchanged lookups are answered with 304, failed requests are retried with exponential backoff.
+    """
+
+    def __init__(self, api_url, user, password, proxy='', cache_dir=None, retries=3, backoff=0.5, timeout=30):
+        """
+        :type api_url: str The pullrequests endpoint of the repository.
+        :type proxy: str HTTP(S) proxy URL, none if empty.
+        :type cache_dir: str Folder keeping the ETag cache, nothing is cached if None.
+        :type retries: int How many times a failed request is resent.
+        :type backoff: float First delay between two attempts in seconds, doubled at each attempt.
+        """
+        self.api_url = api_url.strip()
+        credentials = '%s:%s' % (user.strip(), password.strip())
+        self.authorization = 'Basic ' + base64.b64encode(credentials.encode('utf-8')).decode('ascii')
+        self.proxy = urlparse(proxy) if proxy else None
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.connections = {}
+        self.cache_path = os.path.join(cache_dir, etag_cache_file) if cache_dir else None
+        self.etags = {}
+        if self.cache_path and os.path.exists(self.cache_path):
+            try:
+                with open(self.cache_path) as cache_file:
+                    self.etags = json.load(cache_file)
+            except ValueError:
+                self.etags = {}
+
+    @classmethod
+    def from_conf(cls, conf):
+        user = conf.get('GIT', 'user', fallback='') or conf.get('GIT', 'email', fallback='')
+        cache_dir = os.path.join(conf['General']['cwd'], '.cache')
+        return cls(conf['PR']['api_url'], user, conf['GIT']['password'], conf.get('General', 'proxy', fallback=''),
+                   cache_dir, conf.getint('PR', 'retries', fallback=3), conf.getfloat('PR', 'backoff', fallback=0.5))
+
+    def _connection(self, scheme, netloc):
+        key = (scheme, netloc)
+        if key not in self.connections:
+            connection_class = httplib.HTTPSConnection if scheme == 'https' else httplib.HTTPConnection
+            if self.proxy:
+                connection = connection_class(self.proxy.hostname, self.proxy.port, timeout=self.timeout)
+                if scheme == 'https':
+                    host, _, port = netloc.partition(':')
+                    connection.set_tunnel(host, int(port) if port else None)
+            else:
+                connection = connection_class(netloc, timeout=self.timeout)
+            self.connections[key] = connection
+        return self.connections[key]
+
+    def close(self):
+        for connection in self.connections.values():
+            connection.close()
+        self.connections = {}
+        self.save_cache()
+
+    def save_cache(self):
+        if not self.cache_path:
+            return
+        if not os.path.isdir(os.path.dirname(self.cache_path)):
+            os.makedirs(os.path.dirname(self.cache_path))
+        tmp_path = self.cache_path + '.' + str(os.getpid())
+        with open(tmp_path, 'w') as cache_file:
+            json.dump(self.etags, cache_file)
+        os.rename(tmp_path, self.cache_path)
+
+    def request(self, method, url, body=None):
+        """
+        :return: tuple The HTTP status and the decoded JSON body, None if empty.
+        """
+        parsed = urlparse(url)
+        path = parsed.path + ('?' + parsed.query if parsed.query else '')
+        if self.proxy and parsed.scheme == 'http':
+            path = url
+        headers = {'Authorization': self.authorization, 'Accept': 'application/json', 'Connection': 'keep-alive'}
+        if body is not None:
+            body = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        if method == 'GET' and url in self.etags:
+            headers['If-None-Match'] = self.etags[url]['etag']
+
+        attempt = 0
+        while True:
+            connection = self._connection(parsed.scheme, parsed.netloc)
+            connected = False
+            try:
+                with metrics.stage('http_' + method.lower()):
+                    if connection.sock is None:
+                        connection.connect()
+                    connected = True
+                    connection.request(method, path, body, headers)
+                    response = connection.getresponse()
+                    data = response.read()
+                metrics.add('http_requests')
+            except (socket.error, httplib.HTTPException) as e:
+                connection.close()  # Reconnects on the next attempt, the server may have closed the idle connection
+                del self.connections[(parsed.scheme, parsed.netloc)]
+                # Once connected the server may have processed a POST whose answer got lost, resending it could open
+                # the same pull request twice
+                if attempt >= self.retries or (connected and method != 'GET'):
+                    raise PRError(method + ' ' + url + ' failed: ' + str(e))
+                self._wait(attempt, None)
+                attempt += 1
+                continue
+
+            retryable = retry_status if method == 'GET' else retry_status_unsafe
+            if response.status in retryable and attempt < self.retries:
+                self._wait(attempt, response.getheader('Retry-After'))
+                attempt += 1
+                continue
+            break
+
+        if response.status == 304 and url in self.etags:
+            metrics.add('http_not_modified')
+            return 200, self.etags[url]['body']
+        payload = json.loads(data.decode('utf-8')) if data else None
+        if method == 'GET' and response.status == 200 and response.getheader('ETag'):
+            if len(self.etags) >= max_cached_responses and url not in self.etags:
+                self.etags.pop(next(iter(self.etags)))
+            self.etags[url] = {'etag': response.getheader('ETag'), 'body': payload}
+        return response.status, payload
+
+    def _wait(self, attempt, retry_after):
+        delay = self.backoff * (2 ** attempt)
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, int(retry_after))
+        time.sleep(delay)
+
+    def find_open_pr(self, title):
+        """
+        Looks up an open pull request by title with server side filtering, following the pages of results.
+        :return: dict The pull request, None if not found.
+        """
+        query = 'title="' + title.replace('\\', '\\\\').replace('"', '\\"') + '" AND state="OPEN"'
+        url = self.api_url + '?' + urlencode([('q', query), ('pagelen', 50)])
+        while url:
+            status, page = self.request('GET', url)
+            if status != 200:
+                raise PRError('PR lookup returned HTTP ' + str(status))
+            for pull_request in page.get('values', []):
+                if pull_request.get('title') == title:
+                    return pull_request
+            url = urljoin(url, page['next']) if page.get('next') else None
+        return None
+
+    def create_pr(self, payload):
+        status, response = self.request('POST', self.api_url, payload)
+        if status not in (200, 201):
+            raise PRError('PR creation returned HTTP ' + str(status) + ': ' + json.dumps(response))
+        return response
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+# Package providers, selected by [Package] backend. A provider is called with the repositories filter and whether to
+# clean the metadata and returns the packages to update as dicts with name, repo and version, its tool names the
+# installer of the bundle Exec and installed() lists the installed packages. Each backend imports its package manager
+# or metadata parser only when queried.
+
+
+class Installer(object):
+    """
+    Shapes the Exec installing a bundle with one package manager.
+    """
+
+    def __init__(self, command, spec, arch_spec, unless, attributes=None):
+        """
+        :type command: str Install command, the package specs are appended.
+        :type spec: str Format of a package spec from its name and version.
+        :type arch_spec: str Format of a package spec from its name, version and arch, None if multilib is not handled.
+        :type unless: str Format of the command telling whether a package version is installed.
+        :type attributes: dict Other attributes of the Exec.
+        """
+        self.command = command
+        self.spec = spec
+        self.arch_spec = arch_spec
+        self.unless = unless
+        self.attributes = attributes or {}
+
+    def package_specs(self, name, version, archs=None):
+        """
+        :type archs: list Install these architectures of the package, the default one if None.
+        """
+        if archs and self.arch_spec:
+            return [self.arch_spec.format(name=name, version=version, arch=arch) for arch in archs]
+        return [self.spec.format(name=name, version=version)]
+
+    def exec_resource(self, specs, name, version):
+        """
+        :type specs: list Package specs of the bundle members.
+        :type name: str A member of the bundle, its version being installed means the bundle is.
+        """
+        resource = {'command': ' '.join([self.command] + specs), 'path': '/bin:/usr/bin/',
+                    'unless': self.unless.format(name=name, version=version)}
+        resource.update(self.attributes)
+        return resource
+
+
+installers = {
+    'yum': Installer('yum -y install', '{name}-{version}', '{name}-{version}.{arch}', 'rpm -q {name}-{version}'),
+    'dnf': Installer('dnf -y install', '{name}-{version}', '{name}-{version}.{arch}', 'rpm -q {name}-{version}'),
+    'zypper': Installer('zypper -n install', '{name}={version}', '{name}.{arch}={version}',
+                        'rpm -q {name}-{version}'),
+    'apt': Installer('apt-get -y install', '{name}={version}', None,
+                     "test \"$(dpkg-query -W -f='${{Version}}' {name})\" = '{version}'",
+                     {'environment': ['DEBIAN_FRONTEND=noninteractive'], 'provider': 'shell'}),
+}
+
+# Package cache and package database of each backend, read by the update cache and the daemon
+backend_paths = {'yum': ('/var/cache/yum', '/var/lib/rpm'), 'repodata': ('/var/cache/yum', '/var/lib/rpm'),
+                 'zypper': ('/var/cache/zypp/raw', '/var/lib/rpm'), 'apt': ('/var/lib/apt/lists', '/var/lib/dpkg')}
+dnf_cache_dir = '/var/cache/dnf'  # Replaces the yum cache folder when use_dnf()
+
+
+def split_repos(repos_filter):
+    """
+    :type repos_filter: str Comma separated repository ids.
+    :return: list The repository ids, in the configured order.
+    """
+    return [repo.strip() for repo in repos_filter.split(',') if repo.strip()]
+
+
+def query_yum(repos_filter, clean_metadata=True):
+    from os_release import use_dnf
+    repos = split_repos(repos_filter)
+    if use_dnf():
+        import dnf
+        pkg_provider = dnf.Base()
+        if clean_metadata:
+            pkg_provider.cleanMetadata()
+        pkg_provider.read_all_repos()
+        pkg_provider.fill_sack()
+        package_list = list(pkg_provider.sack.query().upgrades())
+    else:
+        import yum
+        pkg_provider = yum.YumBase()
+        pkg_provider.setCacheDir()
+        if clean_metadata:
+            pkg_provider.cleanMetadata()
+        if repos:
+            for repo in repos:
+                pkg_provider.repos.enableRepo(repo)
+            pkg_provider.repos.doSetup()
+        package_list = pkg_provider.doPackageLists(pkgnarrow='updates', patterns='', ignore_case=True)
+    return clean_package_list(package_list, repos)
+
+
+def clean_package_list(package_list, repos):
+    """
+    :type package_list: iterable Package objects of yum or dnf, with name, version, release and repo.id.
+    :type repos: list Repositories to keep, in the configured order, all if empty.
+    :return: list The packages as dicts with name, repo and version, sorted by repository then name.
+    """
+    enabled_repos = frozenset(repos)
+    clean_list = []
+    try:
+        for rpm in package_list:
+            if not enabled_repos or rpm.repo.id in enabled_repos:
+                clean_list.append({'name': rpm.name, 'repo': rpm.repo.id, 'version': rpm.version + '-' + rpm.release})
+    except:
+        print('Have you thought about exporting the http_proxy/https_proxy ENV?')
+
+    # Deterministic output whatever order the provider resolved the repositories in
+    repo_order = dict((repo, position) for position, repo in enumerate(repos))
+    clean_list.sort(key=lambda pkg: (repo_order.get(pkg['repo'], len(repos)), pkg['repo'], pkg['name']))
+    return clean_list
+
+
+class Provider(object):
+    """
+    Base of the package providers, a subclass is called as described above.
+    """
+    tool = 'yum'
+    installed_list = None
+    dependencies = None  # Set by the providers reading the primary metadata, see repodata.query_repodata
+
+    def installed(self):
+        """
+        :return: frozenset (name, version) of the installed packages, versions written as the Package resources ensure
+        them. Read from the rpmdb, or the 'rpm -qa' dump set as installed_list.
+        """
+        from repodata import read_installed
+        return frozenset((name, version + '-' + release) for (name, arch), evrs in
+                         read_installed(self.installed_list).items() for epoch, version, release in evrs)
+
+
+class YumProvider(Provider):
+    """
+    Asks yum, or dnf on the Fedora releases shipping it.
+    """
+
+    def __call__(self, repos_filter, clean_metadata):
+        from os_release import use_dnf
+        self.tool = 'dnf' if use_dnf() else 'yum'
+        return query_yum(repos_filter, clean_metadata)
+
+
+class RepodataProvider(Provider):
+    """
+    Reads the rpm-md repository metadata cached by the package manager and the rpmdb, see repodata.query_repodata.
+    """
+
+    def __init__(self, repodata_dir, installed_list=None, parallelism=1, read_dependencies=False):
+        """
+        :type read_dependencies: bool Keeps the dependencies of the updates found in dependencies, for auto_bundle.
+        """
+        self.repodata_dir = repodata_dir
+        self.installed_list = installed_list
+        self.parallelism = parallelism
+        self.read_dependencies = read_dependencies
+
+    def __call__(self, repos_filter, clean_metadata):
+        from repodata import query_repodata
+        self.dependencies = {} if self.read_dependencies else None
+        return query_repodata(repos_filter, self.repodata_dir, self.installed_list, self.parallelism,
+                              self.dependencies)
+
+
+class ZypperProvider(RepodataProvider):
+    """
+    zypper keeps the rpm-md metadata of each repository under /var/cache/zypp/raw/<alias>.
+    """
+    tool = 'zypper'
+
+
+class AptProvider(Provider):
+    """
+    Reads the package lists downloaded by apt and the dpkg status file, see aptdata.query_apt.
+    """
+    tool = 'apt'
+
+    def __init__(self, lists_dir, status_file=None):
+        self.lists_dir = lists_dir
+        self.status_file = status_file
+
+    def __call__(self, repos_filter, clean_metadata):
+        from aptdata import query_apt
+        return query_apt(repos_filter, self.lists_dir, self.status_file)
+
+    def installed(self):
+        from aptdata import read_status
+        return frozenset((name, version) for (name, arch), versions in read_status(self.status_file).items()
+                         for version in versions)
+
+
+class ListProvider(Provider):
+    """
+    Answers with packages already queried, ex: by the parent process of a pool.
+    """
+
+    def __init__(self, packages, tool='yum', source=None):
+        """
+        :type source: Provider The provider of the backend the packages were queried from, lists the installed
+        packages. The rpmdb is read if None.
+        """
+        self.packages = packages
+        self.tool = tool
+        self.source = source
+
+    def __call__(self, repos_filter, clean_metadata):
+        return list(self.packages)
+
+    def installed(self):
+        if self.source is None:
+            return Provider.installed(self)
+        return self.source.installed()
+
+
+def get_backend(conf):
+    return conf.get('Package', 'backend', fallback='yum') or 'yum'
+
+
+def get_repodata_dir(conf):
+    """
+    :return: str The package cache folder, dnf keeps its metadata in /var/cache/dnf on the releases shipping it.
+    """
+    backend = get_backend(conf)
+    default = backend_paths.get(backend, backend_paths['yum'])[0]
+    if backend in ('yum', 'repodata'):
+        from os_release import use_dnf
+        if use_dnf():
+            default = dnf_cache_dir
+    return conf.get('Package', 'repodata_dir', fallback='') or default
+
+
+def get_rpmdb_dir(conf):
+    """
+    :return: str The package database folder, fingerprinted by the update cache.
+    """
+    default = backend_paths.get(get_backend(conf), backend_paths['yum'])[1]
+    return conf.get('Cache', 'rpmdb_dir', fallback='') or default
+
+
+def get_provider(conf):
+    """
+    :type conf: ConfigParser The configuration, [Package] backend selects the provider.
+    :return: Provider
+    """
+    backend = get_backend(conf)
+    installed_list = conf.get('Package', 'installed_list', fallback='') or None
+    parallelism = conf.getint('Package', 'parallelism', fallback=1)
+    auto_bundle = conf.getboolean('Package', 'auto_bundle', fallback=False)
+    if backend == 'repodata':
+        return RepodataProvider(get_repodata_dir(conf), installed_list, parallelism, auto_bundle)
+    if backend == 'zypper':
+        return ZypperProvider(get_repodata_dir(conf), installed_list, parallelism, auto_bundle)
+    if backend == 'apt':
+        return AptProvider(get_repodata_dir(conf), installed_list)
+    if backend != 'yum':
+        raise ValueError('Unknown package backend ' + backend)
+    provider = YumProvider()
+    provider.installed_list = installed_list
+    return provider
@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import bz2
+import gzip
+import os
+import re
+import sqlite3
+import subprocess
+import xml.etree.ElementTree as ElementTree
+from version_compare import compute_upgrades
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+# Computes the available updates straight from the repository metadata cached on disk (repomd.xml, primary.sqlite or
+# primary.xml.gz) and the rpmdb, without loading the yum/dnf object graph.
+
+repo_ns = '{http://linux.duke.edu/metadata/repo}'
+common_ns = '{http://linux.duke.edu/metadata/common}'
+rpm_ns = '{http://linux.duke.edu/metadata/rpm}'
+provides_path = common_ns + 'format/' + rpm_ns + 'provides/' + rpm_ns + 'entry'
+requires_path = common_ns + 'format/' + rpm_ns + 'requires/' + rpm_ns + 'entry'
+rpm_qa_format = '%{NAME} %{EPOCHNUM} %{VERSION} %{RELEASE} %{ARCH}\\n'
+dnf_cache_suffix = re.compile(r'-[0-9a-f]{16}$')
+
+
+def find_repos(repodata_dir):
+    """
+    Finds the repositories cached under repodata_dir, handles the yum (<repo>/repomd.xml), dnf
+    (<repo>-<hash>/repodata/repomd.xml) and plain (<repo>/repodata/repomd.xml) layouts.
+    :type repodata_dir: str The package provider cache folder, ex: /var/cache/yum
+    :return: dict Repository id to the folder holding its metadata.
+    """
+    repos = {}
+    for root, dirs, files in os.walk(repodata_dir):
+        if 'repomd.xml' in files:
+            repo_dir = root
+            if os.path.basename(root) == 'repodata':
+                repo_dir = os.path.dirname(root)
+            repo_id = dnf_cache_suffix.sub('', os.path.basename(repo_dir))
+            repos[repo_id] = repo_dir
+            dirs[:] = []
+    return repos
+
+
+def parse_repomd(repo_dir):
+    """
+    :return: dict With the metadata 'revision' and, per data type, its 'location' and 'checksum'.
+    """
+    repomd_path = os.path.join(repo_dir, 'repodata', 'repomd.xml')
+    if not os.path.exists(repomd_path):
+        repomd_path = os.path.join(repo_dir, 'repomd.xml')
+    repomd = {'revision': None, 'data': {}}
+    tree = ElementTree.parse(repomd_path)
+    revision = tree.find(repo_ns + 'revision')
+    if revision is not None:
+        repomd['revision'] = revision.text
+    for data in tree.findall(repo_ns + 'data'):
+        location = data.find(repo_ns + 'location')
+        checksum = data.find(repo_ns + 'checksum')
+        repomd['data'][data.get('type')] = {'location': location.get('href') if location is not None else None,
+                                            'checksum': checksum.text if checksum is not None else None}
+    return repomd
+
+
+def locate_data(repo_dir, repomd, data_type):
+    """
+    Resolves the local copy of a metadata file, yum and dnf do not keep the relative location used on the mirror.
+    """
+    if data_type not in repomd['data'] or not repomd['data'][data_type]['location']:
+        return None
+    location = repomd['data'][data_type]['location']
+    for candidate in [os.path.join(repo_dir, location), os.path.join(repo_dir, 'repodata', os.path.basename(location)),
+                      os.path.join(repo_dir, os.path.basename(location))]:
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def open_compressed(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.bz2'):
+        return bz2.BZ2File(path, 'rb')
+    if path.endswith('.xz'):
+        import lzma
+        return lzma.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def package_deps(elem):
+    """
+    :type elem: Element A package of primary.xml.
+    :return: tuple The list of provided names, the list of strictly (=) required names.
+    """
+    return ([entry.get('name') for entry in elem.iterfind(provides_path)],
+            [entry.get('name') for entry in elem.iterfind(requires_path) if entry.get('flags') == 'EQ'])
+
+
+def iter_primary_xml(path, wanted=None, dependencies=None):
+    """
+    Streams the packages of a primary.xml(.gz) file, each element is released once read.
+    :type wanted: set Package names to keep, all if None.
+    :type dependencies: dict Filled with (name, version-release) to the package_deps of each package kept, if set.
+    :return: generator of (name, arch, (epoch, version, release)) tuples.
+    """
+    with open_compressed(path) as xml_file:
+        context = ElementTree.iterparse(xml_file, events=('start', 'end'))
+        root = None
+        for event, elem in context:
+            if root is None:
+                root = elem
+            if event != 'end' or elem.tag != common_ns + 'package':
+                continue
+            name = elem.findtext(common_ns + 'name')
+            if wanted is None or name in wanted:
+                version = elem.find(common_ns + 'version')
+                if dependencies is not None:
+                    dependencies[(name, version.get('ver') + '-' + version.get('rel'))] = package_deps(elem)
+                yield name, elem.findtext(common_ns + 'arch'), (version.get('epoch'), version.get('ver'),
+                                                                version.get('rel'))
+            root.clear()
+
+
+def sqlite_deps(connection, keys):
+    """
+    :type keys: dict pkgKey to the (name, version-release) of the package.
+    :return: dict (name, version-release) to the list of provided names and the list of strictly required names.
+    """
+    provides = dict((pkg_key, []) for pkg_key in keys)
+    requires = dict((pkg_key, []) for pkg_key in keys)
+    for pkg_key, name in connection.execute('SELECT pkgKey, name FROM provides'):
+        if pkg_key in provides:
+            provides[pkg_key].append(name)
+    for pkg_key, name in connection.execute("SELECT pkgKey, name FROM requires WHERE flags = 'EQ'"):
+        if pkg_key in requires:
+            requires[pkg_key].append(name)
+    return dict((package, (provides[pkg_key], requires[pkg_key])) for pkg_key, package in keys.items())
+
+
+def iter_primary_sqlite(path, wanted=None, dependencies=None):
+    """
+    :type wanted: set Package names to keep, all if None.
+    :type dependencies: dict Filled as by iter_primary_xml, if set.
+    :return: generator of (name, arch, (epoch, version, release)) tuples.
+    """
+    connection = sqlite3.connect(path)
+    try:
+        keys = {}
+        cursor = connection.execute('SELECT pkgKey, name, arch, epoch, version, release FROM packages')
+        for pkg_key, name, arch, epoch, version, release in cursor:
+            if wanted is None or name in wanted:
+                keys[pkg_key] = (name, version + '-' + release)
+                yield name, arch, (epoch, version, release)
+        if dependencies is not None:
+            dependencies.update(sqlite_deps(connection, keys))
+    finally:
+        connection.close()
+
+
+def iter_repo_packages(repo_dir, wanted=None, dependencies=None):
+    """
+    Prefers an uncompressed primary sqlite database when the package provider left one in its cache, falls back on
+    streaming primary.xml.
+    """
+    repomd = parse_repomd(repo_dir)
+    sqlite_path = os.path.join(repo_dir, 'gen', 'primary_db.sqlite')
+    if not os.path.exists(sqlite_path):
+        sqlite_path = locate_data(repo_dir, repomd, 'primary_db')
+    if sqlite_path and sqlite_path.endswith('.sqlite'):
+        return iter_primary_sqlite(sqlite_path, wanted, dependencies)
+    xml_path = locate_data(repo_dir, repomd, 'primary')
+    if xml_path:
+        return iter_primary_xml(xml_path, wanted, dependencies)
+    raise IOError('No primary metadata found in ' + repo_dir)
+
+
+def iter_primary_deps_xml(path, wanted):
+    """
+    Streams the provides and the strict (=) requires of the wanted packages of a primary.xml(.gz) file.
+    :type wanted: dict Package name to the version-release to keep.
+    :return: generator of (name, list of provided names, list of strictly required names) tuples.
+    """
+    with open_compressed(path) as xml_file:
+        context = ElementTree.iterparse(xml_file, events=('start', 'end'))
+        root = None
+        for event, elem in context:
+            if root is None:
+                root = elem
+            if event != 'end' or elem.tag != common_ns + 'package':
+                continue
+            name = elem.findtext(common_ns + 'name')
+            version = elem.find(common_ns + 'version')
+            if name in wanted and wanted[name] == version.get('ver') + '-' + version.get('rel'):
+                provides, requires = package_deps(elem)
+                yield name, provides, requires
+            root.clear()
+
+
+def iter_primary_deps_sqlite(path, wanted):
+    """
+    :type wanted: dict Package name to the version-release to keep.
+    :return: generator of (name, list of provided names, list of strictly required names) tuples.
+    """
+    connection = sqlite3.connect(path)
+    try:
+        keys = {}
+        for pkg_key, name, version, release in connection.execute('SELECT pkgKey, name, version, release '
+                                                                  'FROM packages'):
+            if name in wanted and wanted[name] == version + '-' + release:
+                keys[pkg_key] = (name, wanted[name])
+        for (name, version), (provides, requires) in sqlite_deps(connection, keys).items():
+            yield name, provides, requires
+    finally:
+        connection.close()
+
+
+def iter_repo_deps(repo_dir, wanted):
+    """
+    Same metadata selection as iter_repo_packages.
+    """
+    repomd = parse_repomd(repo_dir)
+    sqlite_path = os.path.join(repo_dir, 'gen', 'primary_db.sqlite')
+    if not os.path.exists(sqlite_path):
+        sqlite_path = locate_data(repo_dir, repomd, 'primary_db')
+    if sqlite_path and sqlite_path.endswith('.sqlite'):
+        return iter_primary_deps_sqlite(sqlite_path, wanted)
+    xml_path = locate_data(repo_dir, repomd, 'primary')
+    if xml_path:
+        return iter_primary_deps_xml(xml_path, wanted)
+    raise IOError('No primary metadata found in ' + repo_dir)
+
+
+def parse_rpm_qa(lines):
+    """
+    :type lines: iterable Lines as printed by rpm -qa --qf using rpm_qa_format.
+    :return: dict (name, arch) to the list of installed (epoch, version, release).
+    """
+    installed = {}
+    for line in lines:
+        fields = line.split()
+        if len(fields) != 5:
+            continue
+        installed.setdefault((fields[0], fields[4]), []).append((fields[1], fields[2], fields[3]))
+    return installed
+
+
+def read_installed(installed_file=None):
+    """
+    :type installed_file: str An 'rpm -qa' dump using rpm_qa_format, the rpmdb is queried if None.
+    """
+    if installed_file:
+        with open(installed_file) as dump:
+            return parse_rpm_qa(dump)
+    output = subprocess.Popen(['rpm', '-qa', '--qf', rpm_qa_format], stdout=subprocess.PIPE).communicate()[0]
+    return parse_rpm_qa(output.decode('utf-8').splitlines())
+
+
+def read_repo(repo_id, repo_dir, wanted, dependencies=None):
+    return [(name, arch, evr, repo_id) for name, arch, evr in iter_repo_packages(repo_dir, wanted, dependencies)]
+
+
+def read_repos(repos, repo_ids, wanted, parallelism=1, dependencies=None):
+    """
+    Parses the metadata of each repository, up to parallelism at once.
+    :type repos: dict Repository id to the folder holding its metadata.
+    :type repo_ids: list Repositories to read.
+    :type wanted: set Package names to keep.
+    :type dependencies: dict Filled with repository id to the dependencies of its packages kept, see iter_primary_xml.
+    :return: list Per repository lists of (name, arch, (epoch, version, release), repo id), in repo_ids order.
+    """
+    if dependencies is not None:
+        for repo_id in repo_ids:
+            dependencies[repo_id] = {}
+
+    def read(repo_id):
+        return read_repo(repo_id, repos[repo_id], wanted, dependencies[repo_id] if dependencies is not None else None)
+
+    if parallelism > 1 and len(repo_ids) > 1:
+        try:
+            from concurrent.futures import ThreadPoolExecutor
+        except ImportError:  # Python 2 without the 'futures' backport
+            ThreadPoolExecutor = None
+        if ThreadPoolExecutor:
+            with ThreadPoolExecutor(max_workers=min(parallelism, len(repo_ids))) as executor:
+                return list(executor.map(read, repo_ids))
+    return [read(repo_id) for repo_id in repo_ids]
+
+
+def query_repodata(repos_filter, repodata_dir, installed_file=None, parallelism=1, dependencies=None):
+    """
+    Offline equivalent of providers.query_yum.
+    :type repos_filter: str Comma separated repository ids, all cached repositories if empty.
+    :type repodata_dir: str The package provider cache folder.
+    :type installed_file: str Optional 'rpm -qa' dump used instead of the rpmdb.
+    :type parallelism: int How many repositories are parsed concurrently.
+    :type dependencies: dict Filled with (repo id, name, version-release) to the provided names and the strictly
+    required names of each update found, if set. Read in the same pass, see transaction_groups.read_dependencies.
+    """
+    installed = read_installed(installed_file)
+    wanted = frozenset(name for name, arch in installed)
+    repos = find_repos(repodata_dir)
+    if repos_filter:
+        repo_ids = [repo_id.strip() for repo_id in repos_filter.split(',') if repo_id.strip() in repos]
+    else:
+        repo_ids = sorted(repos)
+
+    repo_deps = {} if dependencies is not None else None
+    # Merged in repo_ids order, on equal versions the first repository listed wins
+    upgrades = compute_upgrades(installed, (pkg for repo_pkgs in read_repos(repos, repo_ids, wanted, parallelism,
+                                                                            repo_deps)
+                                            for pkg in repo_pkgs))
+    clean_list = []
+    for name, arch in sorted(upgrades):
+        evr, repo_id = upgrades[(name, arch)]
+        version = evr[1] + '-' + evr[2]
+        clean_list.append({'name': name, 'repo': repo_id, 'version': version})
+        if repo_deps is not None and (name, version) in repo_deps[repo_id]:
+            # Only the updates are kept, not every version read from the metadata
+            dependencies[(repo_id, name, version)] = repo_deps[repo_id][(name, version)]
+    return clean_list
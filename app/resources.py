@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import json
+import re
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+# Emitters writing the Hiera hash built by generate_list as Hiera JSON, Hiera YAML or a Puppet manifest, straight from
+# its dicts. Emitters are generators of text chunks.
+
+resource_reference = re.compile(r'^([A-Za-z][\w:]*)\[(.*)\]$')
+
+
+def hiera_sections(resources, root_key):
+    """
+    :type resources: dict The Hiera hash as built by generate_list, wrapped under root_key or not.
+    :return: tuple The Package resources, the Exec resources and whether packages are wrapped under root_key.
+    """
+    if root_key in resources:
+        return resources[root_key], resources.get('execs') or {}, True
+    return resources, {}, False
+
+
+def attributes(resource):
+    """
+    :return: list The (name, value) of the set attributes, sorted by name.
+    """
+    return sorted((name, value) for name, value in resource.items() if value is not None)
+
+
+def emit_json(resources, root_key):
+    """
+    Same output as json.dump(indent=4, sort_keys=True) of the Hiera hash.
+    """
+    encoder = json.JSONEncoder(indent=4, sort_keys=True, separators=(',', ': '))
+    return encoder.iterencode(resources)
+
+
+def _yaml_value(value, indent):
+    if isinstance(value, list) and value:
+        return ''.join('\n' + indent + '- ' + _yaml_flow(item) for item in value)
+    return ' ' + _yaml_flow(value)
+
+
+def _yaml_flow(value):
+    if isinstance(value, dict):
+        return '{' + ', '.join(json.dumps(key) + ': ' + _yaml_flow(value[key]) for key in sorted(value)) + '}'
+    if isinstance(value, list):
+        return '[' + ', '.join(_yaml_flow(item) for item in value) + ']'
+    return json.dumps(value)  # JSON scalars are valid YAML flow scalars
+
+
+def _yaml_resources(resources, indent):
+    for title in sorted(resources):
+        resource_attributes = attributes(resources[title])
+        yield indent + json.dumps(title) + (':\n' if resource_attributes else ': {}\n')
+        for name, value in resource_attributes:
+            yield indent + '  ' + name + ':' + _yaml_value(value, indent + '    ') + '\n'
+
+
+def emit_yaml(resources, root_key):
+    packages, execs, wrapped = hiera_sections(resources, root_key)
+    yield '---\n'
+    if not wrapped:
+        if not packages:
+            yield '{}\n'
+        for chunk in _yaml_resources(packages, ''):
+            yield chunk
+        return
+    sections = [(root_key, packages)]
+    if execs:
+        sections.append(('execs', execs))
+    for key, section in sorted(sections, key=lambda section: section[0]):
+        yield json.dumps(key) + (':\n' if section else ': {}\n')
+        for chunk in _yaml_resources(section, '  '):
+            yield chunk
+
+
+def _pp_string(value):
+    return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+
+def _pp_value(name, value):
+    if isinstance(value, list):
+        return '[' + ', '.join(_pp_value(name, item) for item in value) + ']'
+    if isinstance(value, dict):
+        return '{ ' + ', '.join(_pp_string(key) + ' => ' + _pp_value(key, value[key]) for key in sorted(value)) + ' }'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return str(value)
+    if name in ('require', 'before', 'notify', 'subscribe'):
+        reference = resource_reference.match(value)
+        if reference:
+            return '::'.join(part.capitalize() for part in reference.group(1).split('::')) + '[' + \
+                _pp_string(reference.group(2)) + ']'
+    return _pp_string(value)
+
+
+def emit_pp(resources, root_key, class_name=''):
+    """
+    :type class_name: str Declare the resources in this class, at top scope if empty.
+    """
+    packages, execs, wrapped = hiera_sections(resources, root_key)
+    indent = ''
+    yield '# Generated by update-with-puppet\n'
+    if class_name:
+        yield 'class ' + class_name + ' {\n'
+        indent = '  '
+    for puppet_type, section in (('exec', execs), ('package', packages)):
+        for title in sorted(section):
+            yield '\n' + indent + puppet_type + ' { ' + _pp_string(title) + ':\n'
+            for name, value in attributes(section[title]):
+                yield indent + '  ' + name + ' => ' + _pp_value(name, value) + ',\n'
+            yield indent + '}\n'
+    if class_name:
+        yield '}\n'
+
+
+emitters = {'json': emit_json, 'yaml': emit_yaml, 'pp': emit_pp}
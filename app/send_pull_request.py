@@ -2,29 +2,17 @@
 
 from __future__ import print_function
 import argparse
-import base64
 import datetime
 import json
-import os
-import sys
+from metrics import metrics
+from pr_client import BitbucketClient, PRError
 
 __author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
 __copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
 __license__ = "GPL version 3"
 
 
-def create_pr(repo_url, repo_email, repo_pwd, https_proxy, work_branch, dest_branch, description, reviewers, title,
-              git_account, git_repo_name):
-    # Nasty way of handling Python 2/3 when 'requests' isn't installed.
-    try:
-        from urllib.request import urlopen, Request
-        from urllib.error import HTTPError
-    except ImportError:
-        from urllib2 import urlopen, Request, HTTPError
-
-    if https_proxy:
-        os.environ['https_proxy'] = https_proxy
-
+def build_pr_payload(work_branch, dest_branch, description, reviewers, title, git_account, git_repo_name):
     json_reviewers = {'reviewers': []}
     if len(reviewers) > 0:
         if ',' in reviewers:
@@ -38,21 +26,53 @@ def create_pr(repo_url, repo_email, repo_pwd, https_proxy, work_branch, dest_bra
                           'repository': {'full_name': git_account + '/' + git_repo_name}},
                'destination': {'branch': {'name': dest_branch}}, 'close_source_branch': True}
     json_pr.update(json_reviewers)
+    return json_pr
+
 
+def send_payload(client, json_pr):
     # https://confluence.atlassian.com/bitbucket/pullrequests-resource-423626332.html
     # As per https://developer.atlassian.com/bitbucket/api/2/reference/meta/authentication
     # without 2 factor auth we can use HTTP Basic Auth
     try:
-        b64auth = base64.b64encode('%s:%s' % (repo_email.strip(), repo_pwd.strip()))
-        request = Request(repo_url.strip(), data=json.dumps(json_pr))
-        request.add_header("Authorization", "Basic %s" % b64auth)
-        request.add_header('Content-Type', 'application/json')
-        response = urlopen(request).read()
-    except Exception as e:
+        with metrics.stage('pr_create'):
+            return client.create_pr(json_pr)
+    except PRError as e:
         print(str(e))
         print(json.dumps(json_pr, indent=4, sort_keys=True))
 
 
+def create_pr(repo_url, repo_email, repo_pwd, https_proxy, work_branch, dest_branch, description, reviewers, title,
+              git_account, git_repo_name):
+    client = BitbucketClient(repo_url, repo_email, repo_pwd, https_proxy)
+    try:
+        return send_payload(client, build_pr_payload(work_branch, dest_branch, description, reviewers, title,
+                                                     git_account, git_repo_name))
+    finally:
+        client.close()
+
+
+def create_pr_from_conf(conf, working_branch, client):
+    """
+    :type client: BitbucketClient Reused from the lookup of existing pull requests.
+    """
+    return send_payload(client, build_pr_payload(working_branch, conf['GIT']['dest_branch'], conf['PR']['description'],
+                                                 conf['PR']['reviewers'], conf['PR']['title'],
+                                                 conf['GIT']['account_name'], conf['GIT']['repo_name']))
+
+
+def main(conf):
+    metrics.configure(conf, 'send_pull_request')
+    if conf['GIT']['work_branch'] != '':
+        working_branch = conf['GIT']['work_branch'] + '_' + conf['GIT']['src_branch']
+    else:
+        working_branch = 'OS_Update_' + datetime.datetime.now().strftime("%B_%Y") + '_' + conf['GIT']['src_branch']
+
+    client = BitbucketClient.from_conf(conf)
+    create_pr_from_conf(conf, working_branch, client)
+    client.close()
+    metrics.emit()
+
+
 if __name__ == '__main__':
     try:
         from configparser import ConfigParser
@@ -66,12 +86,4 @@ if __name__ == '__main__':
 
     with open(args.conf_file, 'r') as conf_file:
         conf.read_file(conf_file)
-
-    if conf['GIT']['work_branch'] != '':
-        working_branch = conf['GIT']['work_branch'] + '_' + conf['GIT']['src_branch']
-    else:
-        working_branch = 'OS_Update_' + datetime.datetime.now().strftime("%B_%Y") + '_' + conf['GIT']['src_branch']
-
-    create_pr(conf['PR']['api_url'], conf['GIT']['email'], conf['GIT']['password'], conf['General']['proxy'],
-              working_branch, conf['GIT']['dest_branch'], conf['PR']['description'],
-              conf['PR']['reviewers'], conf['PR']['title'], conf['GIT']['account_name'], conf['GIT']['repo_name'])
+    main(conf)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import hashlib
+import json
+import os
+from hiera_io import write_json
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+# Optional sharded layout of the Hiera file: instead of <hiera_folder>/<file>, the resources are spread over
+# <hiera_folder>/<file stem>.d/<shard>.json so that a run only reads and rewrites the shards holding updated resources.
+# A bundle and its members always share a shard. With the 'hash' strategy a resource goes to the shard named after the
+# first hex digits of the SHA-1 of its title (of its bundle name for bundle members), with 'bundle' every bundle gets
+# its own shard and the other resources are hashed. The .index.json file of the folder records the layout and the
+# number of resources of each shard, Hiera 5 reads the shards with a 'globs' hierarchy level and a deep merge of both
+# root_key and 'execs', the Exec of a bundle being written to the shard of its members.
+
+strategies = ('hash', 'bundle')
+index_file = '.index.json'
+format_version = 1
+default_prefix_length = 2
+
+
+def shard_folder(working_file):
+    return os.path.splitext(working_file)[0] + '.d'
+
+
+def shard_path(folder, shard):
+    return os.path.join(folder, shard + '.json')
+
+
+def hiera_exists(working_file):
+    """
+    :return: bool True if the Hiera file, or its sharded layout, exists.
+    """
+    return os.path.exists(working_file) or os.path.exists(index_path(shard_folder(working_file)))
+
+
+class ShardLayout(object):
+    """
+    Assigns a resource title to its shard.
+    """
+
+    def __init__(self, strategy, prefix_length=default_prefix_length, package_bundle=None):
+        """
+        :type strategy: str One of strategies.
+        :type prefix_length: int Hex digits of the hash naming a shard, 2 gives up to 256 hashed shards.
+        :type package_bundle: BundleIndex The static bundles, None if not bundling.
+        """
+        if strategy not in strategies:
+            raise ValueError('Unknown shard strategy ' + strategy)
+        self.strategy = strategy
+        self.prefix_length = prefix_length
+        self.package_bundle = package_bundle
+
+    def key(self):
+        """
+        :return: dict What the shard of a resource depends on, a change means the resources must be re-sharded.
+        """
+        bundles = ''
+        if self.package_bundle is not None and len(self.package_bundle):
+            bundles = hashlib.sha1(json.dumps([sorted(self.package_bundle.exact.items()), self.package_bundle.patterns],
+                                              sort_keys=True).encode('utf-8')).hexdigest()
+        return {'strategy': self.strategy, 'prefix_length': self.prefix_length, 'bundles': bundles}
+
+    def shard(self, title):
+        bundle = self.package_bundle.lookup(title) if self.package_bundle is not None else None
+        if bundle is not None and self.strategy == 'bundle':
+            return 'bundle_' + bundle
+        return hashlib.sha1((bundle or title).encode('utf-8')).hexdigest()[:self.prefix_length]
+
+    def partition(self, resources):
+        """
+        :type resources: dict Package resources, not wrapped.
+        :return: dict Shard name to its resources.
+        """
+        shards = {}
+        for title, resource in resources.items():
+            shards.setdefault(self.shard(title), {})[title] = resource
+        return shards
+
+
+def index_path(folder):
+    return os.path.join(folder, index_file)
+
+
+def load_index(folder):
+    """
+    :return: dict The index of the sharded folder, None if there is none.
+    """
+    path = index_path(folder)
+    if not os.path.exists(path):
+        return None
+    with open(path) as index:
+        content = json.load(index)
+    if content.get('version') != format_version:
+        return None
+    return content
+
+
+def new_index(layout, wrapped):
+    return {'version': format_version, 'layout': layout.key(), 'wrapped': wrapped, 'shards': {}}
+
+
+def write_index(folder, index):
+    """
+    :return: bool True if the index file was written.
+    """
+    return write_json(index_path(folder), index)
+
+
+def read_shard(folder, shard, root_key):
+    """
+    :return: dict The Package resources of the shard, empty if it does not exist.
+    """
+    path = shard_path(folder, shard)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as shard_file:
+        content = json.load(shard_file)  # Shards are small, the streaming reader would only be slower
+    return content.get(root_key, content) if isinstance(content, dict) else {}
+
+
+def resource_count(folder):
+    """
+    :return: int The number of Package resources over all the shards, from the index.
+    """
+    index = load_index(folder)
+    if index is None:
+        return 0
+    return sum(index['shards'].values())
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import json
+import mmap
+import os
+import struct
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+# State of the previous run: the Package resources it computed, in a binary file read through mmap. The next run only
+# handles the resources added, changed or removed since. The resources only describe the working branch they were
+# written to, the snapshot is removed whenever that branch is created again from the source branch.
+#
+# Layout: header, then the resources sorted by title as 'title\tjson\n' lines.
+
+snapshot_file = 'snapshot.bin'
+magic = b'UWPS'
+format_version = 2
+header = struct.Struct('<4sHHIQ')  # magic, version, reserved, resource count, resource section size
+
+
+def snapshot_path(conf):
+    return os.path.join(conf['General']['cwd'], '.cache', snapshot_file)
+
+
+def remove_snapshot(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _encode(resource):
+    return json.dumps(resource, sort_keys=True, separators=(',', ':'))
+
+
+class Delta(object):
+    """
+    Resources added, changed and removed since the previous run, removed maps a title to its previous resource.
+    """
+    __slots__ = ('added', 'changed', 'removed')
+
+    def __init__(self):
+        self.added = {}
+        self.changed = {}
+        self.removed = {}
+
+    def __len__(self):
+        return len(self.added) + len(self.changed) + len(self.removed)
+
+
+class Snapshot(object):
+    """
+    Read-only view of a snapshot file, nothing is decoded until asked for.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, mmap.error):
+            self.file.close()
+            raise ValueError('Empty snapshot ' + path)
+        fields = header.unpack_from(self.map, 0)
+        if fields[0] != magic or fields[1] != format_version:
+            self.close()
+            raise ValueError('Not a snapshot ' + path)
+        self.resource_count = fields[3]
+        self.resource_start = header.size
+        self.end = self.resource_start + fields[4]
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def iter_encoded(self):
+        """
+        :return: generator of (title, encoded resource) tuples, in title order.
+        """
+        position = self.resource_start
+        while position < self.end:
+            line_end = self.map.find(b'\n', position, self.end)
+            title, encoded = self.map[position:line_end].decode('utf-8').split('\t', 1)
+            yield title, encoded
+            position = line_end + 1
+
+
+def load_snapshot(path):
+    """
+    :return: Snapshot None if there is no usable snapshot at path.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        return Snapshot(path)
+    except (ValueError, struct.error):
+        return None
+
+
+def write_snapshot(path, resources):
+    """
+    :type resources: dict Package resources, not wrapped under the root key.
+    """
+    resource_section = ''.join(title + '\t' + _encode(resources[title]) + '\n'
+                               for title in sorted(resources)).encode('utf-8')
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    tmp_path = path + '.' + str(os.getpid())
+    with open(tmp_path, 'wb') as snapshot:
+        snapshot.write(header.pack(magic, format_version, 0, len(resources), len(resource_section)))
+        snapshot.write(resource_section)
+    os.rename(tmp_path, path)
+
+
+def diff(previous, resources):
+    """
+    Walks the previous resources and the new ones side by side, both in title order.
+    :type previous: Snapshot None if there was no previous run.
+    :type resources: dict Package resources, not wrapped under the root key.
+    :return: Delta
+    """
+    delta = Delta()
+    titles = sorted(resources)
+    old = previous.iter_encoded() if previous is not None else iter(())
+    old_title, old_encoded = next(old, (None, None))
+    for title in titles:
+        while old_title is not None and old_title < title:
+            delta.removed[old_title] = json.loads(old_encoded)
+            old_title, old_encoded = next(old, (None, None))
+        if old_title == title:
+            if old_encoded != _encode(resources[title]):
+                delta.changed[title] = resources[title]
+            old_title, old_encoded = next(old, (None, None))
+        else:
+            delta.added[title] = resources[title]
+    while old_title is not None:
+        delta.removed[old_title] = json.loads(old_encoded)
+        old_title, old_encoded = next(old, (None, None))
+    return delta
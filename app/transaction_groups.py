@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+from repodata import find_repos, iter_repo_deps
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+# Groups the pending updates which must be installed in the same transaction: packages linked by a strict (=) Requires
+# and the members of a same static bundle end up in one component, bundled as a single Exec.
+
+auto_prefix = 'auto_'
+
+
+class UnionFind(object):
+    """
+    Disjoint sets of hashable items, with path halving and union by size.
+    """
+    __slots__ = ('parent', 'size')
+
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def find(self, item):
+        parent = self.parent
+        if item not in parent:
+            parent[item] = item
+            self.size[item] = 1
+            return item
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, item_a, item_b):
+        root_a = self.find(item_a)
+        root_b = self.find(item_b)
+        if root_a == root_b:
+            return root_a
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size[root_b]
+        return root_a
+
+    def components(self):
+        """
+        :return: dict Root item to the list of items of its set.
+        """
+        components = {}
+        for item in self.parent:
+            components.setdefault(self.find(item), []).append(item)
+        return components
+
+
+class TransactionGroups(object):
+    """
+    Maps a package resource title to the bundle it is installed with, same interface as BundleIndex.
+    """
+    __slots__ = ('groups',)
+
+    def __init__(self, groups):
+        """
+        :type groups: dict Resource title to bundle name.
+        """
+        self.groups = groups
+
+    def lookup(self, pkg_name):
+        return self.groups.get(pkg_name)
+
+    def __len__(self):
+        return len(self.groups)
+
+
+def read_dependencies(pkg_list, repodata_dir, known=None):
+    """
+    :type pkg_list: list Packages as returned by query_yum, with their name, repo and version.
+    :type known: dict (repo, name, version) to the provided and strictly required names, as kept by the package
+    provider while reading the metadata. Only the packages missing from it are read from repodata_dir.
+    :return: tuple Provided name to the pending package names providing it, pending package name to its strictly
+    required names.
+    """
+    known = known or {}
+    found = []
+    wanted_by_repo = {}
+    for pkg in pkg_list:
+        key = (pkg['repo'], pkg['name'], pkg['version'])
+        if key in known:
+            found.append((pkg['name'],) + tuple(known[key]))
+        else:
+            wanted_by_repo.setdefault(pkg['repo'], {})[pkg['name']] = pkg['version']
+    if wanted_by_repo:
+        repos = find_repos(repodata_dir)
+        for repo_id in sorted(wanted_by_repo):
+            if repo_id in repos:
+                found.extend(iter_repo_deps(repos[repo_id], wanted_by_repo[repo_id]))
+    providers = {}
+    requires = {}
+    for name, provided, required in found:
+        for capability in provided:
+            providers.setdefault(capability, set()).add(name)
+        if required:
+            requires[name] = required
+    return providers, requires
+
+
+def group_packages(pkg_names, providers, requires, package_bundle=None):
+    """
+    :type pkg_names: dict Resource title of the pending updates to their package name, they differ for the packages
+    installed in several versions, ex: kernel-<version>.
+    :type providers: dict Provided name to the pending package names providing it.
+    :type requires: dict Pending package name to its strictly required names.
+    :type package_bundle: BundleIndex Static bundles, looked up by resource title as bundle_package does. They take
+    precedence when naming a component.
+    :return: TransactionGroups The resource titles sharing a component with at least one other, or in a static bundle.
+    """
+    sets = UnionFind()
+    static = {}
+    bundle_members = {}
+    for title, name in sorted(pkg_names.items()):
+        sets.find(name)
+        bundle = package_bundle.lookup(title) if package_bundle is not None else None
+        if bundle is not None:
+            static[name] = bundle
+            if bundle in bundle_members:
+                sets.union(bundle_members[bundle], name)
+            else:
+                bundle_members[bundle] = name
+    for name, required in requires.items():
+        if name not in sets.parent:
+            continue
+        for capability in required:
+            for provider in providers.get(capability, ()):
+                if provider != name and provider in sets.parent:  # Installed packages stay out of the groups
+                    sets.union(name, provider)
+
+    component_bundles = {}
+    for root, members in sets.components().items():
+        bundles = sorted(static[member] for member in members if member in static)
+        if bundles:
+            component_bundles[root] = bundles[0]
+        elif len(members) > 1:
+            component_bundles[root] = auto_prefix + min(members)
+    groups = {}
+    for title, name in pkg_names.items():
+        bundle = component_bundles.get(sets.find(name))
+        if bundle is not None:
+            groups[title] = bundle
+    return TransactionGroups(groups)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import hashlib
+import os
+import time
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+# Caches the computed list of updates keyed by the repository metadata revisions and an rpmdb fingerprint, so a run
+# where neither changed can stop before querying the package provider. Next to the entries, the summary file holds the
+# creation time and package count of the last stored list: cli.py check reads it, json and the repodata parser are only
+# imported by the functions needing them so that the check starts fast.
+
+cache_folder = 'update_list'
+default_ttl = 3600
+default_max_size = 10 * 1024 * 1024
+summary_file = 'latest'
+
+
+def repo_metadata_key(repodata_dir, repos_filter):
+    """
+    :type repodata_dir: str The package provider cache folder.
+    :type repos_filter: str Comma separated repository ids, all cached repositories if empty.
+    """
+    from repodata import find_repos, parse_repomd
+    digest = hashlib.sha1()
+    repos = find_repos(repodata_dir) if os.path.isdir(repodata_dir) else {}
+    wanted = set(repo_id.strip() for repo_id in repos_filter.split(',')) if repos_filter else None
+    for repo_id in sorted(repos):
+        if wanted is not None and repo_id not in wanted:
+            continue
+        try:
+            repomd = parse_repomd(repos[repo_id])
+        except Exception:
+            continue
+        digest.update(('%s:%s' % (repo_id, repomd['revision'])).encode('utf-8'))
+        for data_type in sorted(repomd['data']):
+            digest.update(('%s=%s' % (data_type, repomd['data'][data_type]['checksum'])).encode('utf-8'))
+    if not repos:
+        digest.update(rpmdb_fingerprint(repodata_dir).encode('utf-8'))  # apt keeps its package lists in one folder
+    return digest.hexdigest()
+
+
+def rpmdb_fingerprint(rpmdb_dir='/var/lib/rpm'):
+    digest = hashlib.sha1()
+    if os.path.isdir(rpmdb_dir):
+        for name in sorted(os.listdir(rpmdb_dir)):
+            stat = os.stat(os.path.join(rpmdb_dir, name))
+            digest.update(('%s:%d:%d' % (name, stat.st_size, int(stat.st_mtime))).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def compute_key(repodata_dir, repos_filter, rpmdb_dir='/var/lib/rpm'):
+    return repo_metadata_key(repodata_dir, repos_filter) + '-' + rpmdb_fingerprint(rpmdb_dir)
+
+
+def _entries(cache_dir):
+    folder = os.path.join(cache_dir, cache_folder)
+    if not os.path.isdir(folder):
+        return []
+    entries = []
+    for name in os.listdir(folder):
+        if name.endswith('.json'):
+            path = os.path.join(folder, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+    return sorted(entries)
+
+
+def evict(cache_dir, ttl=default_ttl, max_size=default_max_size):
+    """
+    Removes the entries older than ttl seconds, then the oldest ones until the cache fits in max_size bytes.
+    """
+    now = time.time()
+    kept = []
+    for mtime, size, path in _entries(cache_dir):
+        if now - mtime > ttl:
+            os.remove(path)
+        else:
+            kept.append((mtime, size, path))
+    total_size = sum(size for mtime, size, path in kept)
+    for mtime, size, path in kept:
+        if total_size <= max_size:
+            break
+        os.remove(path)
+        total_size -= size
+
+
+def has_fresh_entry(cache_dir, ttl=default_ttl):
+    """
+    Tells if any list was computed in the last ttl seconds, the package metadata is only cleaned when none was.
+    """
+    now = time.time()
+    return any(now - mtime <= ttl for mtime, size, path in _entries(cache_dir))
+
+
+def lookup(cache_dir, key, ttl=default_ttl):
+    """
+    :return: list The cached clean_list, None when missing or expired.
+    """
+    import json
+    path = os.path.join(cache_dir, cache_folder, key + '.json')
+    try:
+        if time.time() - os.stat(path).st_mtime > ttl:
+            return None
+        with open(path) as json_file:
+            return json.load(json_file)['clean_list']
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+
+
+def latest(cache_dir, ttl=default_ttl):
+    """
+    :return: list The most recently cached clean_list, None when missing or expired.
+    """
+    import json
+    entries = _entries(cache_dir)
+    if not entries or time.time() - entries[-1][0] > ttl:
+        return None
+    try:
+        with open(entries[-1][2]) as json_file:
+            return json.load(json_file)['clean_list']
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+
+
+def latest_summary(cache_dir, ttl=default_ttl):
+    """
+    :return: tuple (created, count) of the most recently cached clean_list, None when missing or expired.
+    """
+    try:
+        with open(os.path.join(cache_dir, cache_folder, summary_file)) as latest_file:
+            created, count = latest_file.read().split()
+        summary = float(created), int(count)
+    except (IOError, OSError, ValueError):
+        entries = _entries(cache_dir)  # Cache written before the summary file
+        clean_list = latest(cache_dir, ttl)
+        summary = (entries[-1][0], len(clean_list)) if clean_list is not None else None
+    if summary is None or time.time() - summary[0] > ttl:
+        return None
+    return summary
+
+
+def store(cache_dir, key, clean_list, ttl=default_ttl, max_size=default_max_size):
+    import json
+    folder = os.path.join(cache_dir, cache_folder)
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    created = time.time()
+    for name in (key + '.json', summary_file):
+        path = os.path.join(folder, name)
+        tmp_path = path + '.' + str(os.getpid())
+        with open(tmp_path, 'w') as tmp_file:
+            if name == summary_file:
+                tmp_file.write('%f %d\n' % (created, len(clean_list)))
+            else:
+                json.dump({'key': key, 'created': created, 'clean_list': clean_list}, tmp_file)
+        os.rename(tmp_path, path)
+    evict(cache_dir, ttl, max_size)
@@ -2,130 +2,136 @@
 
 from __future__ import print_function
 import argparse
-import base64
 import datetime
-import json
 import os
-import platform
-import shutil
 import socket
-import subprocess
 import sys
+import time
+import generate_list
+from git_workspace import GitError, GitWorkspace
+from hiera_io import iter_resources
+from metrics import metrics
+from os_release import get_linux_dist, is_supported
+from pr_client import BitbucketClient, PRError
+from send_pull_request import create_pr_from_conf
+from shards import hiera_exists, index_file, resource_count, shard_folder
+from snapshot import remove_snapshot, snapshot_path
+from updateinfo import index_from_conf
 
 __author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
 __copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
 __license__ = "GPL version 3"
 
 # See https://access.redhat.com/solutions/27943
-pkg_requiring_reboot = ['glibc', 'hal', 'kernel', 'kernel-firmware', 'linux-firmware', 'systemd', 'udev']
+pkg_requiring_reboot = frozenset(['glibc', 'hal', 'kernel', 'kernel-firmware', 'linux-firmware', 'systemd', 'udev'])
 
 
-def get_linux_dist():
-    if sys.version_info[0] >= 3 and sys.version_info[1] > 6:
-        raise NotImplementedError  # 'distro' module returns different names
-    else:
-        return platform.linux_distribution()
+def package_version(title, resource):
+    """
+    :type title: str The title of a Package resource, see generate_list.resource_title.
+    :return: tuple The package name and the version it ensures, taken from the title for the packages in
+    multi_ver_pkg, ensured as installed.
+    """
+    if resource.get('ensure') == 'installed':
+        for name in sorted(generate_list.multi_ver_pkg, key=len, reverse=True):
+            if title.startswith(name + '-') and title[len(name) + 1:len(name) + 2].isdigit():
+                return name, title[len(name) + 1:]
+    return title, resource.get('ensure')
 
 
-def parse_hiera(filename, root_key):
-    pkg_count = 0
-    pkg_with_reboot = False
-    with open(filename) as json_file:
-        json_hiera = json.load(json_file)
-        packages = {}
-        if not json_hiera and root_key in json_hiera:
-            packages = json_hiera[root_key]
-        elif not json_hiera and root_key not in json_hiera:
-            packages = json_hiera
-
-        for pkg in packages:
-            pkg_count += 1
-            if pkg in pkg_requiring_reboot:
-                pkg_with_reboot = True
+def requires_reboot(pkg, resource, updateinfo=None):
+    """
+    :type updateinfo: UpdateInfoIndex Also flags the packages whose advisory suggests a reboot.
+    """
+    name, version = package_version(pkg, resource)
+    return name in pkg_requiring_reboot or \
+        (updateinfo is not None and updateinfo.reboot_suggested(name, version))
 
-    return pkg_count, pkg_with_reboot
 
+def advisory_index(conf):
+    """
+    :return: UpdateInfoIndex Read from its cache once built for the current metadata revision, None when the
+    repositories ship no updateinfo.
+    """
+    return index_from_conf(conf) or None
 
-if __name__ == '__main__':
-    try:
-        from configparser import ConfigParser
-    except ImportError:
-        print("Python 3's configparser or its backport to Python 2 is needed")  # ver. < 3.0
-    conf = ConfigParser()
-
-    support_distros = ['CentOS Linux', 'Fedora', 'Red Hat Enterprise Linux Server']
-    if platform.system() != 'Linux' or get_linux_dist()[0] not in support_distros:
-        raise OSError('This OS is not supported')
-    default_file_name = get_linux_dist()[0] + '_' + get_linux_dist()[1] + '.json'
 
-    parser = argparse.ArgumentParser(description='Setup workplace for GIT interaction')
-    parser.add_argument('-c', '--conf-file', dest='conf_file', help='Configuration file', required=True)
-    args = parser.parse_args()
+def parse_hiera(filename, root_key, updateinfo=None):
+    pkg_count = 0
+    pkg_with_reboot = False
+    for pkg, resource in iter_resources(filename, root_key):
+        pkg_count += 1
+        if not pkg_with_reboot and requires_reboot(pkg, resource, updateinfo):
+            pkg_with_reboot = True
 
-    with open(args.conf_file, 'r') as conf_file:
-        conf.read_file(conf_file)
+    return pkg_count, pkg_with_reboot
 
-    local_repo_exists = False
-    local_repo_path = os.path.join(conf['General']['cwd'], conf['GIT']['name'])
-    if os.path.isdir(os.path.join(local_repo_path)):
-        if os.path.exists(os.path.join(local_repo_path, '.git', 'index')):
-            local_repo_exists = True
-        else:
-            path_split = os.path.split(local_repo_path)
-            if local_repo_path.startswith('/tmp') and len(path_split) >= 2:
-                """ Want to be sure that a sensitive folder cannot be passed to the program"""
-                shutil.rmtree(local_repo_path)
 
-    cmd_out = subprocess.PIPE
-    if conf['General']['proxy'] != '':
-        print(subprocess.Popen(['git', 'config', '--global', 'http.proxy', conf['General']['proxy']],
-                               cwd=conf['General']['cwd'], stdout=cmd_out).communicate()[0])
-        print(subprocess.Popen(['git', 'config', '--global', 'https.proxy', conf['General']['proxy']],
-                               cwd=conf['General']['cwd'], stdout=cmd_out).communicate()[0])
-        os.environ['https_proxy'] = conf['General']['proxy']
+def describe_delta(delta):
+    """
+    :type delta: snapshot.Delta The changes made by generate_list in snapshot mode.
+    :return: str The counts for the commit message, empty if nothing changed.
+    """
+    counts = []
+    for label, resources in (('added', delta.added), ('updated', delta.changed), ('removed', delta.removed)):
+        if resources:
+            counts.append(label + ' ' + str(len(resources)))
+    if not counts:
+        return ''
+    return ', '.join(counts).capitalize() + ' packages to update on ' + socket.getfqdn()
 
-    if not local_repo_exists:
-        assembled_git_url = conf['GIT']['url'].replace('https://', 'https://' + conf['GIT']['user'] + ':' +
-                                                       conf['GIT']['password'] + '@')
-        print(subprocess.Popen(['git', 'clone', assembled_git_url],
-                               cwd=conf['General']['cwd'], stdout=cmd_out).communicate()[0])
 
+def get_working_branch(conf):
     if conf['GIT']['work_branch'] != '':
-        working_branch = conf['GIT']['work_branch'] + '_' + conf['GIT']['src_branch']
-    else:
-        working_branch = 'OS_Update_' + datetime.datetime.now().strftime("%B_%Y") + '_' + conf['GIT']['src_branch']
-    print(subprocess.Popen(['git', 'checkout', conf['GIT']['src_branch']],
-                           cwd=local_repo_path, stdout=cmd_out).communicate()[0])
-    print(subprocess.Popen(['git', 'checkout', working_branch], cwd=local_repo_path, stdout=cmd_out).communicate()[0])
-    branches = subprocess.Popen(['git', 'branch'], cwd=local_repo_path, stdout=cmd_out).communicate()[0].split('\n')
-    for i, v in enumerate(branches):
-        branches[i] = v.strip('*').strip()
-
-    new_branch = False
-    if working_branch not in branches:
-        new_branch = True
-
-    if new_branch:
-        print(subprocess.Popen(['git', 'checkout', '-b', working_branch, conf['GIT']['src_branch']],
-                               cwd=local_repo_path, stdout=cmd_out).communicate()[0])
+        return conf['GIT']['work_branch'] + '_' + conf['GIT']['src_branch']
     else:
-        print(subprocess.Popen(['git', 'checkout', working_branch],
-                               cwd=local_repo_path, stdout=cmd_out).communicate()[0])
-        print(subprocess.Popen(['git', 'pull'], cwd=local_repo_path, stdout=cmd_out).communicate()[0])
+        return 'OS_Update_' + datetime.datetime.now().strftime("%B_%Y") + '_' + conf['GIT']['src_branch']
+
 
-    working_file = os.path.join(local_repo_path, 'hiera', conf['General']['file'])
-    generate_list = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'generate_list.py')
-    generate_list_cmd = ['python', generate_list, '-c', args.conf_file]
+def pr_exists(conf, client):
+    """
+    :type client: BitbucketClient
+    :return: bool True if an open pull request has the configured title.
+    """
+    with metrics.stage('pr_lookup'):
+        return client.find_open_pr(conf['PR']['title']) is not None
 
+
+def generate(conf, working_file, working_branch, provider=None):
+    """
+    Runs generate_list and describes the changes it made to working_file.
+    :type provider: function Replaces the configured package provider, see generate_list.get_provider.
+    :return: str The commit message.
+    """
     commit_message = working_branch + ' from ' + socket.getfqdn()
     existing_pkg_count = 0
+    snapshot_mode = conf.has_option('Package', 'snapshot') and conf.getboolean('Package', 'snapshot')
+    sharded = conf.get('Package', 'shards', fallback='') != ''
 
-    if os.path.exists(working_file):
+    if sharded:
+        existing_pkg_count = resource_count(shard_folder(working_file))
+    elif os.path.exists(working_file) and not snapshot_mode:
         existing_pkg_count = parse_hiera(working_file, conf['Package']['root_key'])[0]
-    print(subprocess.Popen(generate_list_cmd, cwd=conf['General']['cwd'], stdout=cmd_out).communicate()[0])
-
-    if os.path.exists(working_file):
-        latest_pkg_parsed = parse_hiera(working_file, conf['Package']['root_key'])
+    with metrics.stage('generate_list'):
+        generate_list.run(conf, provider)
+
+    if generate_list.last_delta is not None:
+        delta = generate_list.last_delta
+        commit_message = describe_delta(delta) or commit_message
+        updateinfo = advisory_index(conf)
+        if any(requires_reboot(pkg, resource, updateinfo) for resources in (delta.added, delta.changed)
+               for pkg, resource in resources.items()):
+            commit_message += ', system restart recommended'
+    elif sharded or (os.path.exists(working_file) and not snapshot_mode):
+        if sharded:
+            # Only the shards written may hold new updates, the others were not touched
+            updateinfo = advisory_index(conf)
+            latest_pkg_parsed = (resource_count(shard_folder(working_file)),
+                                 any(parse_hiera(path, conf['Package']['root_key'], updateinfo)[1]
+                                     for path in generate_list.last_paths
+                                     if os.path.exists(path) and os.path.basename(path) != index_file))
+        else:
+            latest_pkg_parsed = parse_hiera(working_file, conf['Package']['root_key'], advisory_index(conf))
         if existing_pkg_count == 0 and latest_pkg_parsed[0] > 0:
             commit_message = 'Found ' + str(latest_pkg_parsed[0]) + ' packages to update on ' + socket.getfqdn()
         elif 0 < existing_pkg_count < latest_pkg_parsed[0]:
@@ -134,42 +140,109 @@ if __name__ == '__main__':
 
         if latest_pkg_parsed[1]:
             commit_message += ', system restart recommended'
-
-    print(subprocess.Popen(['git', 'config', '--global', 'user.name', conf['GIT']['username']],
-                           cwd=local_repo_path, stdout=cmd_out).communicate()[0])
-    print(subprocess.Popen(['git', 'config', '--global', 'user.email', conf['GIT']['email']],
-                           cwd=local_repo_path, stdout=cmd_out).communicate()[0])
-    print(subprocess.Popen(['git', 'add', '.'], cwd=local_repo_path, stdout=cmd_out).communicate()[0])
-    print(subprocess.Popen(['git', 'commit', '-m', commit_message],
-                           cwd=local_repo_path, stdout=cmd_out).communicate()[0])
-    print(subprocess.Popen(['git', 'push', '-u', 'origin', working_branch],
-                           cwd=local_repo_path, stdout=cmd_out).communicate()[0])
+    return commit_message
+
+
+def hiera_paths(conf, repo_path, hiera_file, written=None):
+    """
+    :type hiera_file: str The Hiera file, relative to the repository root.
+    :type written: list The shards written or removed by the run, generate_list.last_paths if None.
+    :return: list The files to stage, relative to the repository root.
+    """
+    if conf.get('Package', 'shards', fallback='') == '':
+        return [hiera_file]
+    return [os.path.relpath(path, repo_path) for path in (generate_list.last_paths if written is None else written)]
+
+
+def update(conf, workspace, provider=None, client=None):
+    """
+    One update cycle: refreshes the working branch, generates the list, commits and pushes it and opens the PR.
+    :type workspace: GitWorkspace Kept across cycles by the daemon.
+    :type provider: function Replaces the configured package provider, see generate_list.get_provider.
+    :type client: BitbucketClient Kept across cycles by the daemon, a new one is used and closed otherwise.
+    :return: dict The 'branch', the 'commit' message, None if nothing was committed, whether the branch was 'pushed',
+    the 'push_error' if it could not be, whether a 'pull_request' was created and the 'pr_error' if it failed.
+    """
+    status = {'branch': get_working_branch(conf), 'commit': None, 'pushed': False, 'push_error': None,
+              'pull_request': False, 'pr_error': None}
+    working_branch = status['branch']
+    if workspace.prepare(conf['GIT']['src_branch'], working_branch) or workspace.discarded:
+        # A declined or merged PR, or unpushed commits dropped: what the snapshot holds is not on the branch
+        remove_snapshot(snapshot_path(conf))
+
+    hiera_file = os.path.join(conf['General']['hiera_folder'], conf['General']['file'])
+    working_file = os.path.join(workspace.path, hiera_file)
+
+    commit_message = generate(conf, working_file, working_branch, provider)
+
+    if workspace.stage(hiera_paths(conf, workspace.path, hiera_file)):
+        workspace.commit(commit_message)
+        status['commit'] = commit_message
+    if status['commit'] or workspace.unpushed:
+        try:
+            workspace.push([working_branch])
+            status['pushed'] = True
+        except GitError as e:
+            # The commit stays on the local branch, the next run pushes it again
+            status['push_error'] = str(e)
+            print(str(e))
+    if not status['push_error']:
+        # Written once the resources are on the remote, a failed push has the next run write the same changes again
+        generate_list.store_snapshot(generate_list.last_snapshot)
 
     try:
-        if conf.getboolean('PR', 'generate'):
-            pr_exists = False
-
-            try:
-                from urllib.request import urlopen, Request
-                from urllib.error import HTTPError
-            except ImportError:
-                from urllib2 import urlopen, Request, HTTPError
-
-            b64auth = base64.b64encode('%s:%s' % (conf['GIT']['user'], conf['GIT']['password']))
-            request = Request(conf['PR']['api_url'] + '?state=OPEN')
-            request.add_header("Authorization", "Basic %s" % b64auth)
-            response = urlopen(request).read()
+        # Without a push the branch is missing on the remote, or older than the local one
+        if not status['push_error'] and conf.getboolean('PR', 'generate') and hiera_exists(working_file):
+            pr_client = client or BitbucketClient.from_conf(conf)
             try:
-                if conf['PR']['title'] in response.decode('utf-8'):
-                    pr_exists = True
-            except Exception as e:
+                if not pr_exists(conf, pr_client):
+                    status['pull_request'] = create_pr_from_conf(conf, working_branch, pr_client) is not None
+                    if not status['pull_request']:
+                        status['pr_error'] = 'PR creation failed'  # Printed by send_payload
+            except PRError as e:
+                status['pr_error'] = str(e)
                 print(str(e))
-                if str(conf['PR']['title']) in str(response):
-                    pr_exists = True
-
-            if not pr_exists and os.path.exists(working_file):
-                send_pull_request = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'send_pull_request.py')
-                send_pull_request_cmd = ['python', send_pull_request, '-c', args.conf_file]
-                print(subprocess.Popen(send_pull_request_cmd, stdout=cmd_out).communicate()[0])
+            finally:
+                if client is None:
+                    pr_client.close()
     except ValueError as e:
         print('Invalid or missing value for PR/generate')
+    if not status['push_error'] and not status['pr_error']:
+        # Cached only now, a run finding the list in the cache stops before retrying the push or the PR
+        generate_list.store_cache_entry(generate_list.last_cache_entry)
+    return status
+
+
+def main(conf):
+    if not sys.platform.startswith('linux') or not is_supported():
+        raise OSError('This OS is not supported: ' + (' '.join(get_linux_dist()[:2]).strip() or sys.platform))
+    metrics.configure(conf, 'update_context')
+
+    start = time.time()
+    if conf['General']['proxy'] != '':
+        os.environ['https_proxy'] = conf['General']['proxy']
+
+    workspace = GitWorkspace.from_conf(conf)
+    try:
+        update(conf, workspace)
+    except GitError as e:
+        print(str(e))
+    print('GIT: %d processes in %.3fs, total run %.3fs' %
+          (workspace.process_count, workspace.elapsed, time.time() - start))
+    metrics.emit()
+
+
+if __name__ == '__main__':
+    try:
+        from configparser import ConfigParser
+    except ImportError:
+        print("Python 3's configparser or its backport to Python 2 is needed")  # ver. < 3.0
+    conf = ConfigParser()
+
+    parser = argparse.ArgumentParser(description='Setup workplace for GIT interaction')
+    parser.add_argument('-c', '--conf-file', dest='conf_file', help='Configuration file', required=True)
+    args = parser.parse_args()
+
+    with open(args.conf_file, 'r') as conf_file:
+        conf.read_file(conf_file)
+    main(conf)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import io
+import json
+import os
+import xml.etree.ElementTree as ElementTree
+from providers import get_repodata_dir
+from repodata import find_repos, locate_data, open_compressed, parse_repomd
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+# Indexes the advisories of updateinfo.xml(.gz) by package, parsed once per repository metadata revision and kept in
+# a JSON cache.
+
+cache_folder = 'updateinfo'
+# Advisory types by priority, the first one wins when several advisories ship the same package
+advisory_types = ('security', 'bugfix', 'enhancement', 'newpackage')
+severities = ('', 'none', 'low', 'moderate', 'important', 'critical')
+
+
+def _severity_rank(severity):
+    severity = (severity or '').strip().lower()
+    return severities.index(severity) if severity in severities else 0
+
+
+def _type_rank(advisory_type):
+    return len(advisory_types) - advisory_types.index(advisory_type) if advisory_type in advisory_types else 0
+
+
+def _is_true(text):
+    return (text or '').strip().lower() in ('1', 'true', 'yes')
+
+
+def iter_updateinfo(path):
+    """
+    Streams the advisories of an updateinfo.xml(.gz) file, each element is released once read.
+    :return: generator of (advisory id, type, severity, reboot suggested, list of (name, version-release)) tuples.
+    """
+    with open_compressed(path) as xml_file:
+        context = ElementTree.iterparse(xml_file, events=('start', 'end'))
+        root = None
+        for event, elem in context:
+            if root is None:
+                root = elem
+            if event != 'end' or elem.tag != 'update':
+                continue
+            reboot = _is_true(elem.findtext('reboot_suggested'))
+            packages = []
+            for package in elem.iter('package'):
+                packages.append((package.get('name'), package.get('version') + '-' + package.get('release')))
+                if _is_true(package.findtext('reboot_suggested')):
+                    reboot = True
+            yield elem.findtext('id'), elem.get('type', ''), (elem.findtext('severity') or '').strip(), reboot, \
+                packages
+            root.clear()
+
+
+class UpdateInfoIndex(object):
+    """
+    Maps a package (name, version-release), as found in the update list, to the most relevant advisory shipping it:
+    the most severe, then by type (security first). Epoch and arch are ignored, they are not in the update list.
+    """
+    __slots__ = ('advisories',)
+
+    def __init__(self, advisories=None):
+        """
+        :type advisories: dict (name, version-release) to (advisory id, type, severity, reboot suggested).
+        """
+        self.advisories = advisories or {}
+
+    @classmethod
+    def from_file(cls, path):
+        index = cls()
+        for advisory_id, advisory_type, severity, reboot, packages in iter_updateinfo(path):
+            for package in packages:
+                index.add(package, (advisory_id, advisory_type, severity, reboot))
+        return index
+
+    def add(self, package, advisory):
+        current = self.advisories.get(package)
+        if current is None:
+            self.advisories[package] = advisory
+            return
+        reboot = current[3] or advisory[3]
+        if (_severity_rank(advisory[2]), _type_rank(advisory[1])) > \
+                (_severity_rank(current[2]), _type_rank(current[1])):
+            current = advisory
+        self.advisories[package] = current[:3] + (reboot,)
+
+    def update(self, other):
+        for package, advisory in other.advisories.items():
+            self.add(package, advisory)
+
+    def get(self, name, version):
+        """
+        :return: tuple (advisory id, type, severity, reboot suggested), None if no advisory ships this version.
+        """
+        return self.advisories.get((name, version))
+
+    def reboot_suggested(self, name, version):
+        advisory = self.advisories.get((name, version))
+        return advisory is not None and advisory[3]
+
+    def matches(self, name, version, types=None, min_severity=''):
+        """
+        :type types: set Advisory types to keep, any if empty.
+        :type min_severity: str Lowest severity to keep, ex: Important keeps Important and Critical.
+        """
+        advisory = self.advisories.get((name, version))
+        if advisory is None:
+            return False
+        if types and advisory[1] not in types:
+            return False
+        return _severity_rank(advisory[2]) >= _severity_rank(min_severity)
+
+    def __len__(self):
+        return len(self.advisories)
+
+
+def _read_cache(cache_path, key):
+    try:
+        with io.open(cache_path, encoding='utf-8') as cache_file:
+            cached = json.load(cache_file)
+        if cached.get('key') != list(key):
+            return None
+        return UpdateInfoIndex(dict(((name, version), tuple(advisory))
+                                    for name, version, advisory in cached['advisories']))
+    except Exception:
+        return None
+
+
+def _write_cache(cache_path, key, index):
+    tmp_path = cache_path + '.' + str(os.getpid())
+    advisories = [[name, version, list(advisory)] for (name, version), advisory in index.advisories.items()]
+    try:
+        with open(tmp_path, 'w') as cache_file:
+            json.dump({'key': list(key), 'advisories': advisories}, cache_file)
+        os.rename(tmp_path, cache_path)
+    except (IOError, OSError):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_repo_index(repo_id, repo_dir, cache_dir=None):
+    """
+    :return: UpdateInfoIndex Empty if the repository has no updateinfo.
+    """
+    repomd = parse_repomd(repo_dir)
+    path = locate_data(repo_dir, repomd, 'updateinfo')
+    if not path:
+        return UpdateInfoIndex()
+    key = (repomd['revision'], repomd['data']['updateinfo']['checksum'])
+    cache_path = None
+    if cache_dir:
+        cache_path = os.path.join(cache_dir, cache_folder, repo_id + '.json')
+        index = _read_cache(cache_path, key)
+        if index is not None:
+            return index
+    index = UpdateInfoIndex.from_file(path)
+    if cache_path:
+        if not os.path.isdir(os.path.dirname(cache_path)):
+            try:
+                os.makedirs(os.path.dirname(cache_path))
+            except OSError:
+                return index
+        _write_cache(cache_path, key, index)
+    return index
+
+
+def load_updateinfo(repodata_dir, repos_filter='', cache_dir=None):
+    """
+    :type repodata_dir: str The package provider cache folder, ex: /var/cache/yum
+    :type repos_filter: str Comma separated repository ids, all cached repositories if empty.
+    :return: UpdateInfoIndex Merged from the selected repositories.
+    """
+    repos = find_repos(repodata_dir) if os.path.isdir(repodata_dir) else {}
+    if repos_filter:
+        repo_ids = [repo_id.strip() for repo_id in repos_filter.split(',') if repo_id.strip() in repos]
+    else:
+        repo_ids = sorted(repos)
+    index = UpdateInfoIndex()
+    for repo_id in repo_ids:
+        repo_index = load_repo_index(repo_id, repos[repo_id], cache_dir)
+        if not index:
+            index = repo_index
+        else:
+            index.update(repo_index)
+    return index
+
+
+def filter_packages(pkg_list, index, types=None, min_severity=''):
+    """
+    :type pkg_list: list Packages as returned by query_yum.
+    :return: list The packages shipped by an advisory of the wanted types and severity.
+    """
+    return [pkg for pkg in pkg_list if index.matches(pkg['name'], pkg['version'], types, min_severity)]
+
+
+def filter_from_conf(conf):
+    """
+    :return: tuple The set of advisory types and the minimum severity to keep, both empty when updates are not
+    filtered by advisory.
+    """
+    types = set(advisory_type.strip().lower() for advisory_type in
+                conf.get('Package', 'advisory_types', fallback='').split(',') if advisory_type.strip())
+    return types, conf.get('Package', 'min_severity', fallback='')
+
+
+def index_from_conf(conf):
+    cache_dir = None
+    if conf.has_option('General', 'cwd'):
+        cache_dir = os.path.join(conf['General']['cwd'], '.cache')
+    return load_updateinfo(get_repodata_dir(conf), conf.get('Package', 'pkg_repos', fallback=''), cache_dir)
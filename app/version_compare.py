@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+_digits = frozenset('0123456789')
+_alnum = frozenset('0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ')
+# A package may switch to or from these between two versions, the package managers still upgrade it
+arch_independent = frozenset(['noarch', 'all'])
+
+
+def rpmvercmp(a, b):
+    """
+    Port of rpmvercmp() from rpm's lib/rpmvercmp.c, including the '~' (sorts before anything) and '^' (sorts after
+    the base version but before any other addition) separators.
+    :return: int -1, 0 or 1.
+    """
+    if a == b:
+        return 0
+    len_a = len(a)
+    len_b = len(b)
+    i = j = 0
+    while i < len_a or j < len_b:
+        while i < len_a and a[i] not in _alnum and a[i] not in '~^':
+            i += 1
+        while j < len_b and b[j] not in _alnum and b[j] not in '~^':
+            j += 1
+
+        if (i < len_a and a[i] == '~') or (j < len_b and b[j] == '~'):
+            if i >= len_a or a[i] != '~':
+                return 1
+            if j >= len_b or b[j] != '~':
+                return -1
+            i += 1
+            j += 1
+            continue
+
+        if (i < len_a and a[i] == '^') or (j < len_b and b[j] == '^'):
+            if i >= len_a:
+                return -1
+            if j >= len_b:
+                return 1
+            if a[i] != '^':
+                return 1
+            if b[j] != '^':
+                return -1
+            i += 1
+            j += 1
+            continue
+
+        if i >= len_a or j >= len_b:
+            break
+
+        start_a = i
+        start_b = j
+        if a[i] in _digits:
+            while i < len_a and a[i] in _digits:
+                i += 1
+            while j < len_b and b[j] in _digits:
+                j += 1
+            is_num = True
+        else:
+            while i < len_a and a[i] in _alnum and a[i] not in _digits:
+                i += 1
+            while j < len_b and b[j] in _alnum and b[j] not in _digits:
+                j += 1
+            is_num = False
+
+        if start_b == j:
+            return 1 if is_num else -1  # Numeric segments are always newer than alpha segments
+
+        segment_a = a[start_a:i]
+        segment_b = b[start_b:j]
+        if is_num:
+            segment_a = segment_a.lstrip('0')
+            segment_b = segment_b.lstrip('0')
+            if len(segment_a) != len(segment_b):
+                return 1 if len(segment_a) > len(segment_b) else -1
+        if segment_a != segment_b:
+            return 1 if segment_a > segment_b else -1
+
+    if i >= len_a and j >= len_b:
+        return 0
+    return -1 if i >= len_a else 1
+
+
+def compare_evr(evr_a, evr_b):
+    """
+    :type evr_a: tuple (epoch, version, release), a None or empty epoch counts as 0.
+    :type evr_b: tuple (epoch, version, release)
+    :return: int -1, 0 or 1.
+    """
+    epoch_a = int(evr_a[0] or 0)
+    epoch_b = int(evr_b[0] or 0)
+    if epoch_a != epoch_b:
+        return 1 if epoch_a > epoch_b else -1
+    result = rpmvercmp(evr_a[1], evr_b[1])
+    if result != 0:
+        return result
+    return rpmvercmp(evr_a[2] or '', evr_b[2] or '')
+
+
+def _deb_order(char):
+    """
+    Weight of a character in a non-digit part of a Debian version: '~' first, then the end of the part, letters, and
+    everything else.
+    """
+    if char == '~':
+        return -1
+    if char.isalpha():
+        return ord(char)
+    return ord(char) + 256
+
+
+def _deb_parts(version):
+    """
+    Splits a Debian upstream version or revision in alternating non-digit and digit parts, as compared by dpkg.
+    :return: list (tuple of character weights ended by 0, int) pairs.
+    """
+    parts = []
+    i = 0
+    length = len(version)
+    while i < length:
+        start = i
+        while i < length and version[i] not in _digits:
+            i += 1
+        letters = tuple(_deb_order(char) for char in version[start:i]) + (0,)
+        start = i
+        while i < length and version[i] in _digits:
+            i += 1
+        parts.append((letters, int(version[start:i] or 0)))
+    return parts
+
+
+_deb_empty_part = ((0,), 0)
+
+
+def _compare_deb_parts(parts_a, parts_b):
+    for k in range(max(len(parts_a), len(parts_b))):
+        part_a = parts_a[k] if k < len(parts_a) else _deb_empty_part
+        part_b = parts_b[k] if k < len(parts_b) else _deb_empty_part
+        if part_a != part_b:
+            return 1 if part_a > part_b else -1
+    return 0
+
+
+def split_debian_version(version):
+    """
+    :type version: str [epoch:]upstream_version[-debian_revision]
+    :return: tuple (epoch, upstream version, revision), the epoch as an int.
+    """
+    epoch = 0
+    if ':' in version:
+        epoch, version = version.split(':', 1)
+        epoch = int(epoch or 0)
+    revision = ''
+    if '-' in version:
+        version, revision = version.rsplit('-', 1)
+    return epoch, version, revision
+
+
+def debvercmp(a, b):
+    """
+    Port of dpkg's version comparison (verrevcmp() of lib/dpkg/version.c) on full Debian versions.
+    :return: int -1, 0 or 1.
+    """
+    if a == b:
+        return 0
+    epoch_a, version_a, revision_a = split_debian_version(a)
+    epoch_b, version_b, revision_b = split_debian_version(b)
+    if epoch_a != epoch_b:
+        return 1 if epoch_a > epoch_b else -1
+    return _compare_deb_parts(_deb_parts(version_a), _deb_parts(version_b)) or \
+        _compare_deb_parts(_deb_parts(revision_a), _deb_parts(revision_b))
+
+
+class BatchComparator(object):
+    """
+    Compares many versions with one comparison function, each distinct pair of versions is compared once. Package
+    lists repeat the same versions a lot (one release of a distribution, several architectures, several repositories).
+    """
+
+    def __init__(self, compare):
+        """
+        :type compare: function compare_evr, debvercmp or any function of two versions returning -1, 0 or 1.
+        """
+        self.compare = compare
+        self.results = {}
+
+    def __call__(self, a, b):
+        key = (a, b)
+        result = self.results.get(key)
+        if result is None:
+            result = self.compare(a, b)
+            self.results[key] = result
+            self.results[(b, a)] = -result
+        return result
+
+    def newest(self, versions):
+        """
+        :type versions: iterable Versions, at least one.
+        :return: The newest version, the first one listed on equal versions.
+        """
+        versions = iter(versions)
+        best = next(versions)
+        for version in versions:
+            if self(version, best) > 0:
+                best = version
+        return best
+
+
+def compute_upgrades(installed, available, compare=compare_evr):
+    """
+    A version of another architecture is an upgrade when the installed or the available one is architecture
+    independent (noarch for rpm, all for apt), as yum, dnf and apt see it.
+    :type installed: dict (name, arch) to the list of installed versions.
+    :type available: iterable (name, arch, version, repo id) tuples.
+    :type compare: function Compares two versions, compare_evr for (epoch, version, release) tuples, debvercmp for
+    Debian version strings.
+    :return: dict Installed (name, arch) to the newest (version, repo id) above the installed versions.
+    """
+    compare = BatchComparator(compare)
+    newest_installed = dict((key, compare.newest(versions)) for key, versions in installed.items())
+    installed_archs = {}
+    for name, arch in newest_installed:
+        installed_archs.setdefault(name, []).append(arch)
+
+    upgrades = {}
+    for name, arch, version, repo_id in available:
+        if arch in arch_independent:
+            keys = [(name, installed_arch) for installed_arch in installed_archs.get(name, ())]
+        else:
+            keys = [(name, installed_arch) for installed_arch in installed_archs.get(name, ())
+                    if installed_arch == arch or installed_arch in arch_independent]
+        for key in keys:
+            if compare(version, newest_installed[key]) <= 0:
+                continue
+            if key not in upgrades or compare(version, upgrades[key][0]) > 0:
+                upgrades[key] = (version, repo_id)
+    return upgrades
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import argparse
+import copy
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+from fixtures import synthetic_bundles  # noqa: E402
+import generate_list  # noqa: E402
+from bundle_index import BundleIndex  # noqa: E402
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+
+def legacy_bundle_package(resources, root_key, package_bundle):
+    """The nested package x bundle scan bundle_package used before the bundle index."""
+    packages = resources
+    execs = {}
+
+    if root_key in resources:
+        packages = resources[root_key]
+
+    for pkg in packages:
+        for bundle in package_bundle:
+            if pkg in package_bundle[bundle]:
+                exec_key = 'update_' + bundle
+                if exec_key in execs:
+                    execs[exec_key]['command'] += generate_list.get_pkg_fqdn(pkg, packages[pkg]['ensure'])
+                else:
+                    command = 'yum -y install' + generate_list.get_pkg_fqdn(pkg, packages[pkg]['ensure'])
+                    execs.update({exec_key: {'command': command, 'path': '/bin:/usr/bin/',
+                                             'unless': 'rpm -q ' + pkg + '-' + packages[pkg]['ensure']}})
+                packages[pkg]['require'] = 'Exec[' + exec_key + ']'
+
+    return {root_key: packages, 'execs': execs}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Micro-benchmark of bundle_package')
+    parser.add_argument('-p', '--packages', dest='packages', type=int, default=10000)
+    parser.add_argument('-b', '--bundles', dest='bundles', type=int, default=1000)
+    parser.add_argument('-s', '--bundle-size', dest='bundle_size', type=int, default=10)
+    parser.add_argument('-r', '--repeat', dest='repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    resources, package_bundle = synthetic_bundles(args.packages, args.bundles, args.bundle_size)
+    print('%d packages, %d bundles of %d members' % (len(resources['packages']), args.bundles, args.bundle_size))
+
+    legacy = min(timeit.repeat(lambda: legacy_bundle_package(copy.deepcopy(resources), 'packages', package_bundle),
+                               number=1, repeat=args.repeat))
+    compile_time = min(timeit.repeat(lambda: BundleIndex.from_bundles(package_bundle), number=1, repeat=args.repeat))
+    index = BundleIndex.from_bundles(package_bundle)
+    indexed = min(timeit.repeat(lambda: generate_list.bundle_package(copy.deepcopy(resources), 'packages', index),
+                                number=1, repeat=args.repeat))
+    copy_time = min(timeit.repeat(lambda: copy.deepcopy(resources), number=1, repeat=args.repeat))
+
+    print('legacy scan:   %.4fs' % (legacy - copy_time))
+    print('index compile: %.4fs' % compile_time)
+    print('indexed:       %.4fs' % (indexed - copy_time))
+    print('speedup:       %.1fx' % ((legacy - copy_time) / max(indexed - copy_time, 1e-9)))
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+from fixtures import synthetic_hiera  # noqa: E402
+from resources import emitters  # noqa: E402
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+
+def measure(label, func):
+    start = time.time()
+    func()
+    elapsed = time.time() - start
+    tracemalloc.start()  # Traced separately, tracing slows down the run several times
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('%-16s %8.3fs %10.1f KiB peak' % (label, elapsed, peak / 1024.0))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Emit time and memory of the output formats')
+    parser.add_argument('-n', '--resources', dest='resources', type=int, default=50000)
+    args = parser.parse_args()
+
+    hiera = synthetic_hiera(args.resources)
+
+    with open(os.devnull, 'w') as devnull:
+        measure('json.dump', lambda: json.dump(hiera, devnull, indent=4, sort_keys=True))
+        for name in sorted(emitters):
+            measure('emit ' + name, lambda: devnull.writelines(emitters[name](hiera, 'packages')))
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+from fixtures import make_remote  # noqa: E402
+from git_workspace import GitWorkspace  # noqa: E402
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+
+def legacy_run(remote, cwd, run):
+    """The sequence of processes update_context.py spawned before GitWorkspace."""
+    count = [0]
+
+    def call(cmd, cwd):
+        count[0] += 1
+        return subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate()[0]
+
+    repo = os.path.join(cwd, 'remote')
+    if not os.path.exists(os.path.join(repo, '.git', 'index')):
+        call(['git', 'clone', remote], cwd)
+    call(['git', 'checkout', 'environment_branch'], repo)
+    call(['git', 'checkout', 'package_update_environment_branch'], repo)
+    branches = [b.strip('*').strip() for b in call(['git', 'branch'], repo).decode('utf-8').split('\n')]
+    if 'package_update_environment_branch' not in branches:
+        call(['git', 'checkout', '-b', 'package_update_environment_branch', 'environment_branch'], repo)
+    else:
+        call(['git', 'checkout', 'package_update_environment_branch'], repo)
+        call(['git', 'pull'], repo)
+    call([sys.executable, '-c', 'import json'], cwd)  # generate_list.py started as a separate interpreter
+    with open(os.path.join(repo, 'hiera', 'Common_RedHat.json'), 'w') as outfile:
+        json.dump({'packages': {'pkg%d' % run: {'ensure': '1.0-1'}}}, outfile)
+    call(['git', 'config', '--global', 'user.name', 'bench'], repo)
+    call(['git', 'config', '--global', 'user.email', 'bench@localhost'], repo)
+    call(['git', 'add', '.'], repo)
+    call(['git', 'commit', '-m', 'run %d' % run], repo)
+    call(['git', 'push', '-u', 'origin', 'package_update_environment_branch'], repo)
+    return count[0]
+
+
+def workspace_run(remote, cwd, run):
+    workspace = GitWorkspace(os.path.join(cwd, 'remote'), remote, ['hiera'], user_name='bench',
+                             user_email='bench@localhost')
+    workspace.prepare('environment_branch', 'package_update_environment_branch')
+    with open(os.path.join(workspace.path, 'hiera', 'Common_RedHat.json'), 'w') as outfile:
+        json.dump({'packages': {'pkg%d' % run: {'ensure': '1.0-1'}}}, outfile)
+    if workspace.stage(['hiera/Common_RedHat.json']):
+        workspace.commit('run %d' % run)
+        workspace.push(['package_update_environment_branch'])
+    return workspace.process_count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the GIT flow of update_context.py against GitWorkspace')
+    parser.add_argument('-f', '--files', dest='files', type=int, default=2000, help='Unrelated files in the repo')
+    parser.add_argument('-r', '--runs', dest='runs', type=int, default=3)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    os.environ['HOME'] = root  # Keep 'git config --global' of the legacy flow away from the real user
+    os.environ['GIT_CONFIG_NOSYSTEM'] = '1'
+    try:
+        remote = make_remote(root, args.files)
+        for name, flow in [('legacy', legacy_run), ('workspace', workspace_run)]:
+            cwd = os.path.join(root, name)
+            os.makedirs(cwd)
+            for run in range(args.runs):
+                start = time.time()
+                processes = flow(remote, cwd, run)
+                print('%-9s run %d: %2d processes, %.3fs' % (name, run, processes, time.time() - start))
+    finally:
+        shutil.rmtree(root)
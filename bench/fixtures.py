@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import json
+import os
+import subprocess
+import sys
+
+app_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'app')
+sys.path.insert(0, app_dir)
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+# Synthetic inputs shared by the benchmarks: package provider objects, update lists, Hiera files, bundle lists and a
+# local bare GIT remote.
+
+root_key = 'packages'
+
+
+class FakeRepo(object):
+    __slots__ = ('id',)
+
+    def __init__(self, repo_id):
+        self.id = repo_id
+
+
+class FakePackage(object):
+    """
+    Stands for the package objects of yum (YumAvailablePackage) and dnf (dnf.package.Package).
+    """
+    __slots__ = ('name', 'version', 'release', 'repo')
+
+    def __init__(self, name, version, release, repo):
+        self.name = name
+        self.version = version
+        self.release = release
+        self.repo = repo
+
+
+class FakeProvider(object):
+    """
+    Package provider answering with the given packages, callable as returned by generate_list.get_provider.
+    """
+
+    def __init__(self, packages, repos=None):
+        self.packages = packages
+        self.repos = repos or []
+
+    def __call__(self, repos_filter, clean_metadata):
+        import providers
+        return providers.clean_package_list(self.packages, self.repos)
+
+
+def package_name(i):
+    return 'pkg%d-%s' % (i, 'libs' if i % 3 == 0 else 'tools')
+
+
+def fake_packages(count, repo_count=3, release_bump=0):
+    """
+    :type release_bump: int Added to the release of every package, to simulate new updates.
+    """
+    repos = [FakeRepo('repo%d' % r) for r in range(repo_count)]
+    return [FakePackage(package_name(i), '1.%d' % (i % 50), '%d.el7' % (i % 7 + 1 + release_bump),
+                        repos[i % repo_count]) for i in range(count)]
+
+
+def package_list(count, repo_count=3):
+    """
+    :return: list Packages as returned by query_yum.
+    """
+    return [{'name': package.name, 'repo': package.repo.id, 'version': package.version + '-' + package.release}
+            for package in fake_packages(count, repo_count)]
+
+
+def synthetic_resources(count, offset=0, version_bump=0):
+    """
+    :type offset: int First package number, to control the overlap with another set.
+    :type version_bump: int Added to the release of every package.
+    :return: dict Package resources, not wrapped.
+    """
+    return dict((package_name(i), {'ensure': '1.%d-%d.el7' % (i % 50, i % 7 + 1 + version_bump)})
+                for i in range(offset, offset + count))
+
+
+def synthetic_hiera(count, with_execs=True):
+    """
+    :return: dict A Hiera hash as written by generate_list, one Exec every ten packages.
+    """
+    packages = {}
+    execs = {}
+    for i in range(count):
+        packages['pkg%d' % i] = {'ensure': '1.%d-1.el7' % i, 'install_options': ['--cacheonly']}
+        if with_execs and i % 10 == 0:
+            packages['pkg%d' % i]['require'] = 'Exec[update_bundle%d]' % (i // 10)
+            execs['update_bundle%d' % (i // 10)] = {
+                'command': 'yum -y install pkg%d-1.%d-1.el7' % (i, i), 'path': '/bin:/usr/bin/',
+                'unless': 'rpm -q pkg%d' % i}
+    hiera = {root_key: packages}
+    if execs:
+        hiera['execs'] = execs
+    return hiera
+
+
+def write_hiera(filename, resources, wrap=True):
+    if not os.path.isdir(os.path.dirname(filename)):
+        os.makedirs(os.path.dirname(filename))
+    with open(filename, 'w') as outfile:
+        json.dump({root_key: resources} if wrap else resources, outfile, indent=4, sort_keys=True)
+
+
+def synthetic_bundles(package_count, bundle_count, bundle_size):
+    """
+    :return: tuple Wrapped package resources and a bundle list where half of the packages belong to a bundle.
+    """
+    package_bundle = {}
+    for b in range(bundle_count):
+        package_bundle['bundle%d' % b] = ['pkg%d-%d' % (b, m) for m in range(bundle_size)]
+    resources = {root_key: {}}
+    for p in range(package_count):
+        b = p % (bundle_count * 2)  # Half of the packages do not belong to any bundle
+        resources[root_key]['pkg%d-%d' % (b, p // (bundle_count * 2))] = {'ensure': '1.0-%d.el7' % p}
+    return resources, package_bundle
+
+
+def make_remote(root, other_files=0, branch='environment_branch', hiera_file='Common_RedHat.json'):
+    """
+    Creates a bare repository holding a hiera folder and other_files unrelated files.
+    :return: str Path of the bare repository.
+    """
+    remote = os.path.join(root, 'remote.git')
+    seed = os.path.join(root, 'seed')
+    subprocess.check_call(['git', 'init', '--quiet', '--bare', remote])
+    subprocess.check_call(['git', 'init', '--quiet', seed])
+    os.makedirs(os.path.join(seed, 'hiera'))
+    with open(os.path.join(seed, 'hiera', hiera_file), 'w') as outfile:
+        json.dump({root_key: {}}, outfile)
+    for i in range(other_files):
+        folder = os.path.join(seed, 'modules', 'module%d' % (i % 50))
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        with open(os.path.join(folder, 'file%d.pp' % i), 'w') as outfile:
+            outfile.write('# %d\n' % i * 200)
+    for cmd in [['add', '.'], ['commit', '--quiet', '-m', 'init'], ['branch', '-M', branch],
+                ['push', '--quiet', remote, branch]]:
+        subprocess.check_call(['git', '-c', 'user.name=bench', '-c', 'user.email=bench@localhost'] + cmd, cwd=seed)
+    return remote
+
+
+def make_conf(cwd, remote, **package_options):
+    """
+    :return: ConfigParser A configuration for update_context working in cwd against the remote, without PR.
+    """
+    from configparser import ConfigParser
+    conf = ConfigParser()
+    package = {'bundle': 'true', 'bundle_list': '', 'install_from_cache': 'false', 'install_multilib': 'true',
+               'merge': 'true', 'pkg_repos': '', 'repo_in_resource': 'false',
+               'repodata_dir': os.path.join(cwd, 'repodata'), 'require': 'false', 'root_key': root_key, 'save': 'true',
+               'wrap': 'true'}
+    package.update(package_options)
+    conf.read_dict({'General': {'cwd': cwd, 'file': 'Common_RedHat.json', 'hiera_folder': 'hiera', 'proxy': ''},
+                    'GIT': {'dest_branch': 'environment_branch', 'email': 'bench@localhost', 'name': 'remote',
+                            'password': '', 'src_branch': 'environment_branch', 'url': remote, 'user': '',
+                            'username': 'bench', 'work_branch': 'package_update'},
+                    'Package': package,
+                    'PR': {'generate': 'false'}})
+    return conf
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import argparse
+import copy
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+import fixtures  # noqa: E402
+import generate_list  # noqa: E402
+import providers  # noqa: E402
+from bundle_index import BundleIndex  # noqa: E402
+from fixtures import root_key  # noqa: E402
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+# Times each stage of the tool on synthetic inputs of several sizes, writes the results as JSON and compares them to a
+# baseline, failing when a stage got slower than the threshold allows.
+
+default_sizes = [100, 10000, 100000]
+result_version = 1
+# Stages with a time limit of their own, whatever the baseline: the check is run every few minutes by the monitoring.
+# Limits are multiples of the bare interpreter start measured in the same run, so they hold on slower runners.
+budgets = {'cli_check': 4.0}
+
+
+def setup_query(size, workdir, run):
+    packages = fixtures.fake_packages(size)
+    repos = ['repo0', 'repo1', 'repo2']
+    return lambda: providers.clean_package_list(packages, repos)
+
+
+def setup_build_hash(size, workdir, run):
+    packages = fixtures.package_list(size)
+    return lambda: generate_list.build_hash(packages, True, False, False, False, root_key)
+
+
+def setup_merge(size, workdir, run):
+    existing_file = os.path.join(workdir, 'merge', str(size), 'existing.json')
+    if not os.path.exists(existing_file):
+        fixtures.write_hiera(existing_file, fixtures.synthetic_resources(size))
+    # Half of the packages are already in the file, with an older version
+    new_resources = {root_key: fixtures.synthetic_resources(size, size // 2, 1)}
+    return lambda: generate_list.merge_resources(existing_file, new_resources, root_key)
+
+
+def setup_strip(size, workdir, run):
+    base_file = os.path.join(workdir, 'strip', str(size), 'base.json')
+    computed_file = os.path.join(workdir, 'strip', str(size), 'computed.json')
+    if not os.path.exists(base_file):
+        fixtures.write_hiera(base_file, fixtures.synthetic_resources(size))
+        fixtures.write_hiera(computed_file, fixtures.synthetic_resources(size, size // 2))
+    return lambda: generate_list.strip_resources(base_file, computed_file, root_key)
+
+
+def setup_bundle(size, workdir, run):
+    resources, package_bundle = fixtures.synthetic_bundles(size, max(1, size // 20), 10)
+    index = BundleIndex.from_bundles(package_bundle)
+    resources = copy.deepcopy(resources)  # bundle_package updates the resources
+    return lambda: generate_list.bundle_package(resources, root_key, index)
+
+
+def setup_shards(size, workdir, run):
+    """
+    A run finding 50 new updates, merged in a sharded Hiera file.
+    """
+    from shards import ShardLayout
+    working_file = os.path.join(workdir, 'shards', str(size), 'Common_RedHat.json')
+    layout = ShardLayout('hash', 2, BundleIndex())
+    if run == 0:
+        if not os.path.isdir(os.path.dirname(working_file)):
+            os.makedirs(os.path.dirname(working_file))
+        generate_list.update_shards(working_file, {root_key: fixtures.synthetic_resources(size)}, root_key, layout)
+    new_resources = {root_key: fixtures.synthetic_resources(min(size, 50), 0, run + 1)}
+    return lambda: generate_list.update_shards(working_file, new_resources, root_key, layout)
+
+
+def setup_update_context(size, workdir, run):
+    """
+    A cron run on a host where the previous run left the workspace: new updates are found, committed and pushed.
+    """
+    import update_context
+    from git_workspace import GitWorkspace
+    folder = os.path.join(workdir, 'update_context', str(size))
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+        fixtures.make_remote(folder)
+    conf = fixtures.make_conf(os.path.join(folder, 'cwd'), os.path.join(folder, 'remote.git'))
+    if run == 0:
+        update_context.update(conf, GitWorkspace.from_conf(conf), fixtures.FakeProvider(fixtures.fake_packages(size)))
+    provider = fixtures.FakeProvider(fixtures.fake_packages(size, release_bump=run + 1))
+    return lambda: update_context.update(conf, GitWorkspace.from_conf(conf), provider)
+
+
+def setup_cli_check(size, workdir, run):
+    """
+    The cold start of cli.py --check, in a new interpreter, answering from a cached list of size packages.
+    """
+    import update_cache
+    folder = os.path.join(workdir, 'cli_check', str(size))
+    conf_file = os.path.join(folder, 'check.conf')
+    if run == 0:
+        update_cache.store(os.path.join(folder, '.cache'), 'bench', fixtures.package_list(size))
+        conf = fixtures.make_conf(folder, '')
+        conf.read_dict({'Cache': {'enabled': 'true', 'ttl': '3600'}})
+        with open(conf_file, 'w') as conf_output:
+            conf.write(conf_output)
+    command = [sys.executable, os.path.join(fixtures.app_dir, 'cli.py'), '--check', '-c', conf_file]
+    return lambda: subprocess.call(command, stdout=subprocess.DEVNULL)
+
+
+def setup_interpreter_start(size, workdir, run):
+    """
+    A new interpreter doing nothing, the reference of the budgets.
+    """
+    command = [sys.executable, '-c', 'pass']
+    return lambda: subprocess.call(command, stdout=subprocess.DEVNULL)
+
+
+stages = [('query_yum', setup_query), ('build_hash', setup_build_hash), ('merge_resources', setup_merge),
+          ('strip_resources', setup_strip), ('bundle_package', setup_bundle), ('update_shards', setup_shards),
+          ('update_context', setup_update_context), ('cli_check', setup_cli_check)]
+
+
+def measure(setup, size, workdir, repeat):
+    """
+    :return: float The best time of repeat runs, each prepared by setup outside of the timing.
+    """
+    best = None
+    for run in range(repeat):
+        func = setup(size, workdir, run)
+        start = timeit.default_timer()
+        func()
+        elapsed = timeit.default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_benchmarks(sizes, stage_names, repeat, workdir):
+    results = {}
+    for name, setup in stages:
+        if name not in stage_names:
+            continue
+        results[name] = {}
+        for size in sizes:
+            results[name][str(size)] = round(measure(setup, size, workdir, repeat), 6)
+            print('%-16s %7d packages %10.4fs' % (name, size, results[name][str(size)]), file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, threshold, min_delta):
+    """
+    :type threshold: float Allowed slow down, relative to the baseline (0.2 for 20%).
+    :type min_delta: float Slow downs under this many seconds are noise.
+    :return: list (stage, size, baseline time, time) of the regressions.
+    """
+    regressions = []
+    for name in sorted(results):
+        for size in sorted(results[name], key=int):
+            if size not in baseline.get(name, {}):
+                continue
+            before, after = baseline[name][size], results[name][size]
+            if after > before * (1 + threshold) and after - before > min_delta:
+                regressions.append((name, size, before, after))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the stages of the tool on synthetic inputs')
+    parser.add_argument('-s', '--sizes', dest='sizes', default=','.join(str(size) for size in default_sizes),
+                        help='Comma separated package counts')
+    parser.add_argument('--stages', dest='stages', default=','.join(name for name, setup in stages),
+                        help='Comma separated stages to run')
+    parser.add_argument('-r', '--repeat', dest='repeat', type=int, default=3, help='Runs per stage, the best counts')
+    parser.add_argument('-o', '--output', dest='output', help='Write the results to this JSON file')
+    parser.add_argument('-b', '--baseline', dest='baseline', help='Fail on a regression against this results file')
+    parser.add_argument('-t', '--threshold', dest='threshold', type=float, default=0.2,
+                        help='Allowed slow down relative to the baseline')
+    parser.add_argument('--min-delta', dest='min_delta', type=float, default=0.005,
+                        help='Ignore slow downs under this many seconds')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ['GIT_CONFIG_NOSYSTEM'] = '1'
+    generate_list.conf = fixtures.make_conf(workdir, '')
+    stdout = sys.stdout
+    try:
+        sys.stdout = sys.stderr  # The stages print their progress, keep stdout for the results
+        results = run_benchmarks([int(size) for size in args.sizes.split(',')], args.stages.split(','), args.repeat,
+                                 workdir)
+        interpreter_start = round(measure(setup_interpreter_start, 0, workdir, args.repeat), 6)
+        print('%-16s %18s %10.4fs' % ('interpreter', '', interpreter_start), file=sys.stderr)
+    finally:
+        sys.stdout = stdout
+        shutil.rmtree(workdir)
+
+    report = {'version': result_version, 'timestamp': time.time(), 'python': platform.python_version(),
+              'platform': platform.platform(), 'repeat': args.repeat, 'interpreter_start': interpreter_start,
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(report, outfile, indent=4, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=4, sort_keys=True))
+
+    over_budget = [(name, size, elapsed) for name in sorted(results) if name in budgets
+                   for size, elapsed in sorted(results[name].items(), key=lambda item: int(item[0]))
+                   if elapsed > budgets[name] * interpreter_start]
+    for name, size, elapsed in over_budget:
+        print('OVER BUDGET %s at %s packages: %.4fs > %.4fs (%.1f x %.4fs interpreter start)'
+              % (name, size, elapsed, budgets[name] * interpreter_start, budgets[name], interpreter_start),
+              file=sys.stderr)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        regressions = compare(results, baseline, args.threshold, args.min_delta)
+        for name, size, before, after in regressions:
+            print('REGRESSION %s at %s packages: %.4fs -> %.4fs' % (name, size, before, after), file=sys.stderr)
+    if regressions or over_budget:
+        sys.exit(1)
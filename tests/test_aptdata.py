@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'app'))
+import aptdata  # noqa: E402
+from version_compare import debvercmp, split_debian_version  # noqa: E402
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+apt_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'fixtures', 'apt')
+lists_dir = os.path.join(apt_dir, 'lists')
+status_file = os.path.join(apt_dir, 'status')
+main_list = os.path.join(lists_dir, 'deb.debian.org_debian_dists_bookworm_main_binary-amd64_Packages')
+
+# (a, b, debvercmp(a, b)), as dpkg --compare-versions orders them
+deb_cases = [
+    ('1.0', '1.0', 0), ('1.0', '1.1', -1), ('1.10', '1.9', 1), ('1.0', '1.0-0', 0), ('0:1.0', '1.0', 0),
+    ('1:1.0', '2.0', 1), ('1:1.0-1', '1:1.0-2', -1), ('1.0a', '1.0', 1), ('1.0a', '1.0.1', -1),
+    ('1.0+b1', '1.0', 1), ('1.0~rc1', '1.0', -1), ('1.0~~', '1.0~', -1), ('1.0~', '1.0', -1),
+    ('1.0-1~bpo12+1', '1.0-1', -1), ('2.36-9+deb12u3', '2.36-9+deb12u10', -1), ('1.2.3-1ubuntu1', '1.2.3-1', 1),
+    ('a', 'b', -1), ('1.0-a', '1.0-+', -1), ('2:9.0.1378-2+deb12u1', '2:9.0.1378-2', 1), ('1.001', '1.1', 0),
+]
+
+
+class DebvercmpTest(unittest.TestCase):
+
+    def test_cases(self):
+        for a, b, expected in deb_cases:
+            self.assertEqual(debvercmp(a, b), expected, '%s vs %s' % (a, b))
+            self.assertEqual(debvercmp(b, a), -expected, '%s vs %s' % (b, a))
+
+    def test_split_debian_version(self):
+        self.assertEqual(split_debian_version('2:9.0.1378-2+deb12u1'), (2, '9.0.1378', '2+deb12u1'))
+        self.assertEqual(split_debian_version('1.0-beta-3'), (0, '1.0-beta', '3'))
+        self.assertEqual(split_debian_version('2024a'), (0, '2024a', ''))
+
+
+class AptDataTest(unittest.TestCase):
+
+    def test_iter_stanzas_skips_continuation_lines(self):
+        with aptdata.open_list(main_list) as package_list:
+            stanzas = list(aptdata.iter_stanzas(package_list))
+        self.assertEqual([stanza['Package'] for stanza in stanzas], ['bash', 'libc6', 'openssl', 'tzdata', 'vim'])
+        self.assertEqual(stanzas[0], {'Package': 'bash', 'Version': '5.2.15-2+b2', 'Architecture': 'amd64'})
+
+    def test_read_status_keeps_installed_packages(self):
+        self.assertEqual(aptdata.read_status(status_file), {('bash', 'amd64'): ['5.2.15-2+b2'],
+                                                            ('libc6', 'amd64'): ['2.36-9+deb12u3'],
+                                                            ('tzdata', 'all'): ['2024a-0+deb12u1'],
+                                                            ('vim', 'amd64'): ['2:9.0.1378-2']})
+
+    def test_repo_id(self):
+        self.assertEqual(aptdata.repo_id('deb.debian.org_debian_dists_bookworm-updates_main_binary-amd64_Packages'),
+                         'bookworm-updates/main')
+        self.assertEqual(aptdata.repo_id('ppa.launchpadcontent.net_x_ubuntu_dists_jammy_main_binary-amd64_Packages'
+                                         '.xz'), 'jammy/main')
+
+    def test_find_lists(self):
+        self.assertEqual(sorted(aptdata.find_lists(lists_dir)), ['bookworm-security/main', 'bookworm/main'])
+        self.assertEqual(aptdata.find_lists(os.path.join(apt_dir, 'missing')), {})
+
+    def test_iter_gzipped_package_list(self):
+        lists = aptdata.find_lists(lists_dir)
+        self.assertEqual(list(aptdata.iter_package_list(lists['bookworm-security/main'][0], set(['vim']))),
+                         [('vim', 'amd64', '2:9.0.1378-2+deb12u1'), ('vim', 'i386', '2:9.0.1378-2+deb12u1')])
+
+    def test_query_apt(self):
+        self.assertEqual(aptdata.query_apt('', lists_dir, status_file),
+                         [{'name': 'libc6', 'repo': 'bookworm-security/main', 'version': '2.36-9+deb12u7'},
+                          {'name': 'tzdata', 'repo': 'bookworm-security/main', 'version': '2025a-0+deb12u1'},
+                          {'name': 'vim', 'repo': 'bookworm-security/main', 'version': '2:9.0.1378-2+deb12u1'}])
+
+    def test_query_apt_filters_repositories(self):
+        self.assertEqual(aptdata.query_apt('bookworm/main, unknown/main', lists_dir, status_file),
+                         [{'name': 'libc6', 'repo': 'bookworm/main', 'version': '2.36-9+deb12u4'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
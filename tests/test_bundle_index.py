@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'app'))
+import bundle_index  # noqa: E402
+from bundle_index import BundleIndex, load_bundle_index  # noqa: E402
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+sample_bundle_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'conf', 'package_bundle.json')
+bundles = {'abrt': ['abrt', 'abrt-*'], 'audit': ['audit', 'audit-libs'], 'python': ['^python[23]?-(libs|devel)$'],
+           'zz_libs': ['audit-libs', '*-libs']}
+
+
+class BundleIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = BundleIndex.from_bundles(bundles)
+
+    def test_exact_members_win_over_patterns(self):
+        self.assertEqual(self.index.exact, {'abrt': 'abrt', 'audit': 'audit', 'audit-libs': 'audit'})
+        self.assertEqual(self.index.lookup('audit-libs'), 'audit')
+        self.assertEqual(self.index.lookup('abrt-libs'), 'abrt')  # Patterns are tried in bundle name order
+
+    def test_globs_and_regular_expressions(self):
+        self.assertEqual(self.index.lookup('abrt-cli'), 'abrt')
+        self.assertEqual(self.index.lookup('python3-libs'), 'python')
+        self.assertEqual(self.index.lookup('python3-devel'), 'python')
+        self.assertEqual(self.index.lookup('python3-tools'), None)
+        self.assertEqual(self.index.lookup('openssl-libs'), 'zz_libs')
+        self.assertIsNone(self.index.lookup('bash'))
+        self.assertEqual(len(self.index), 6)
+
+    def test_sample_bundle_list(self):
+        with open(sample_bundle_file) as bundle_file:
+            index = BundleIndex.from_bundles(json.load(bundle_file))
+        self.assertEqual(index.lookup('abrt-cli'), 'abrt')
+        self.assertEqual(index.lookup('audit-libs'), 'audit')
+
+
+class LoadBundleIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cwd)
+        self.bundle_file = os.path.join(self.cwd, 'package_bundle.json')
+        self.cache_dir = os.path.join(self.cwd, '.cache')
+        self.write(bundles)
+
+    def write(self, content, mtime=1000000000):
+        with open(self.bundle_file, 'w') as bundle_file:
+            json.dump(content, bundle_file)
+        os.utime(self.bundle_file, (mtime, mtime))
+
+    def load(self):
+        with mock.patch.object(BundleIndex, 'from_bundles', wraps=BundleIndex.from_bundles) as from_bundles:
+            index = load_bundle_index(self.bundle_file, self.cache_dir)
+        return index, from_bundles.called
+
+    def test_cache_round_trip(self):
+        index, compiled = self.load()
+        self.assertTrue(compiled)
+        self.assertTrue(os.path.exists(os.path.join(self.cache_dir, bundle_index.cache_file_name)))
+        cached, compiled = self.load()
+        self.assertFalse(compiled)
+        self.assertEqual((cached.exact, cached.patterns), (index.exact, index.patterns))
+        self.assertEqual(cached.lookup('python-libs'), 'python')
+
+    def test_touched_file_reuses_the_content_hash(self):
+        self.load()
+        os.utime(self.bundle_file, (1000000100, 1000000100))
+        index, compiled = self.load()
+        self.assertFalse(compiled)
+        self.assertEqual(index.lookup('audit'), 'audit')
+
+    def test_changed_file_is_compiled_again(self):
+        self.load()
+        self.write({'audit': ['audit', 'audit-libs', 'audispd-plugins']}, 1000000200)
+        index, compiled = self.load()
+        self.assertTrue(compiled)
+        self.assertEqual(index.lookup('audispd-plugins'), 'audit')
+        self.assertIsNone(index.lookup('abrt'))
+        self.assertFalse(self.load()[1])
+
+    def test_corrupt_cache_is_compiled_again(self):
+        self.load()
+        with open(os.path.join(self.cache_dir, bundle_index.cache_file_name), 'w') as cache_file:
+            cache_file.write('{"path": ')
+        index, compiled = self.load()
+        self.assertTrue(compiled)
+        self.assertEqual(index.lookup('abrt-tui'), 'abrt')
+
+    def test_without_cache_dir(self):
+        index = load_bundle_index(self.bundle_file)
+        self.assertEqual(index.lookup('abrt-tui'), 'abrt')
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
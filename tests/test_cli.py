@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+app_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'app')
+sys.path.insert(0, app_dir)
+import cli  # noqa: E402
+import update_cache  # noqa: E402
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+
+class ArgumentsTest(unittest.TestCase):
+
+    def test_conf_file_arg(self):
+        self.assertEqual(cli.conf_file_arg(['check', '-c', 'a.conf']), 'a.conf')
+        self.assertEqual(cli.conf_file_arg(['--conf-file=b.conf', 'check']), 'b.conf')
+        self.assertEqual(cli.conf_file_arg(['-cc.conf', '--check']), 'c.conf')
+        self.assertIsNone(cli.conf_file_arg(['check', '-c']))
+
+    def test_wants_check(self):
+        self.assertTrue(cli.wants_check(['check', '-c', 'a.conf']))
+        self.assertTrue(cli.wants_check(['generate', '--check', '-c', 'a.conf']))
+        self.assertFalse(cli.wants_check(['generate', '-c', 'check']))
+        self.assertTrue(cli.wants_check(['check', '-c', 'check']))
+
+
+class CheckTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cwd)
+        self.conf_file = os.path.join(self.cwd, 'update-with-puppet.conf')
+        self.write_conf('true')
+
+    def write_conf(self, enabled):
+        with open(self.conf_file, 'w') as conf_file:
+            conf_file.write('; comment\n[General]\ncwd = %s\nfile=Common_RedHat.json\n\n[Cache]\nEnabled: %s\n'
+                            'ttl=60\n' % (self.cwd, enabled))
+
+    def check(self):
+        with mock.patch('sys.stdout') as stdout:
+            status = cli.main(['check', '-c', self.conf_file])
+        return status, ''.join(call[0][0] for call in stdout.write.call_args_list)
+
+    def test_read_options(self):
+        options = cli.read_options(self.conf_file)
+        self.assertEqual(options['General'], {'cwd': self.cwd, 'file': 'Common_RedHat.json'})
+        self.assertEqual(options['Cache'], {'enabled': 'true', 'ttl': '60'})
+
+    def test_unknown_without_conf_cache_or_list(self):
+        self.assertEqual(cli.check(os.path.join(self.cwd, 'missing.conf')), cli.check_unknown)
+        self.assertEqual(self.check()[0], cli.check_unknown)
+        self.write_conf('false')
+        self.assertEqual(self.check(), (cli.check_unknown, 'UNKNOWN - the update cache is disabled\n'))
+
+    def test_counts_cached_updates(self):
+        cache_dir = os.path.join(self.cwd, '.cache')
+        update_cache.store(cache_dir, 'key1', [], 60)
+        self.assertEqual(self.check(), (cli.check_ok, 'OK - no package to update | packages=0\n'))
+        update_cache.store(cache_dir, 'key2', [{'name': 'bash', 'repo': 'base', 'version': '4.2.46-35.el7'}], 60)
+        status, output = self.check()
+        self.assertEqual(status, cli.check_warning)
+        self.assertTrue(output.startswith('WARNING - 1 packages to update'), output)
+
+    def test_expired_list_is_unknown(self):
+        cache_dir = os.path.join(self.cwd, '.cache')
+        update_cache.store(cache_dir, 'key1', [], 60)
+        with mock.patch.object(time, 'time', return_value=time.time() + 120):
+            self.assertEqual(self.check()[0], cli.check_unknown)
+
+    def test_check_imports_no_parser(self):
+        update_cache.store(os.path.join(self.cwd, '.cache'), 'key1', [], 60)
+        code = ('import sys; sys.argv = ["cli.py", "--check", "-c", %r]; import cli\n'
+                'try:\n    cli.main()\nfinally:\n'
+                '    print(sorted(m for m in ("argparse", "configparser", "json") if m in sys.modules))') % \
+            self.conf_file
+        output = subprocess.check_output([sys.executable, '-S', '-c', code], cwd=app_dir, env={'PYTHONPATH': app_dir})
+        self.assertEqual(output.decode().splitlines(), ['OK - no package to update | packages=0', '[]'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from configparser import ConfigParser
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'app'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'bench'))
+import daemon  # noqa: E402
+import fixtures  # noqa: E402
+from git_workspace import GitWorkspace  # noqa: E402
+from providers import Provider  # noqa: E402
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+
+class FakeProvider(object):
+    """
+    Package provider whose refresh of the metadata changes the fingerprint only when the mirrors got new updates.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.mirror_revision = 1
+        self.local_revision = 0
+
+    def __call__(self, repos_filter, clean_metadata):
+        self.calls.append(clean_metadata)
+        if clean_metadata:
+            self.local_revision = self.mirror_revision
+        return [{'name': 'bash', 'repo': 'base', 'version': '4.2-%d' % self.local_revision}]
+
+    def fingerprint(self):
+        return self.local_revision
+
+
+def make_conf(cwd):
+    conf = ConfigParser()
+    conf.read_dict({'General': {'cwd': cwd}, 'Daemon': {'interval': '3600', 'jitter': '0', 'poll_interval': '1'},
+                    'Package': {'pkg_repos': 'base'}, 'PR': {'generate': 'false'}})
+    return conf
+
+
+class DaemonTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = tempfile.mkdtemp()
+        self.provider = FakeProvider()
+        self.daemon = daemon.Daemon(make_conf(self.cwd), self.provider, workspace=mock.Mock())
+        self.daemon.fingerprint = self.provider.fingerprint
+        self.daemon.provider.fingerprint = self.provider.fingerprint
+        patcher = mock.patch.object(daemon.update_context, 'update', side_effect=self.fake_update)
+        self.update = patcher.start()
+        self.addCleanup(patcher.stop)
+        metrics_patcher = mock.patch.object(daemon.metrics, 'emit')
+        metrics_patcher.start()
+        self.addCleanup(metrics_patcher.stop)
+
+    def tearDown(self):
+        self.daemon.executor.shutdown()
+        shutil.rmtree(self.cwd)
+
+    def fake_update(self, conf, workspace, provider, client):
+        provider('base', False)
+        return {'commit': None}
+
+    def test_warm_provider_reuses_answer(self):
+        warm = daemon.WarmProvider(self.provider, self.provider.fingerprint)
+        warm('base', False)
+        warm('base', False)
+        self.assertEqual(self.provider.calls, [False])
+        self.provider.local_revision = 5  # Metadata refreshed by someone else
+        warm('base', False)
+        self.assertEqual(self.provider.calls, [False, False])
+
+    def test_warm_provider_refresh_always_queries(self):
+        warm = daemon.WarmProvider(self.provider, self.provider.fingerprint)
+        first = warm.refresh('base')
+        second = warm.refresh('base')
+        self.assertEqual(self.provider.calls, [True, True])
+        self.assertEqual(first, second)
+
+    def test_scheduled_cycle_refreshes_metadata(self):
+        self.assertEqual(self.daemon.run_cycle('schedule'), {'commit': None})
+        self.assertEqual(self.provider.calls, [True])
+        self.assertEqual(self.update.call_count, 1)
+
+        # Nothing new on the mirrors: the metadata is still refreshed, the rest of the cycle is skipped
+        self.assertEqual(self.daemon.run_cycle('schedule'), {'skipped': True})
+        self.assertEqual(self.provider.calls, [True, True])
+        self.assertEqual(self.update.call_count, 1)
+
+        self.provider.mirror_revision = 2
+        self.assertEqual(self.daemon.run_cycle('schedule'), {'commit': None})
+        self.assertEqual(self.provider.calls, [True, True, True])
+        self.assertEqual(self.update.call_count, 2)
+
+    def test_failed_cycle_is_not_skipped(self):
+        self.update.side_effect = RuntimeError('push rejected')
+        with self.assertRaises(RuntimeError):
+            self.daemon.run_cycle('schedule')
+        self.update.side_effect = self.fake_update
+        self.assertEqual(self.daemon.run_cycle('schedule'), {'commit': None})
+        self.assertEqual(self.update.call_count, 2)
+
+    def test_failed_push_is_not_skipped(self):
+        self.update.side_effect = lambda *args: {'commit': 'Found 1 packages', 'push_error': 'rejected'}
+        self.daemon.run_cycle('schedule')
+        self.update.side_effect = self.fake_update
+        self.assertEqual(self.daemon.run_cycle('schedule'), {'commit': None})
+        self.assertEqual(self.update.call_count, 2)
+
+    def test_triggered_cycle_does_not_refresh(self):
+        self.daemon.run_cycle('socket')
+        self.assertEqual(self.provider.calls, [False])
+        self.assertEqual(self.update.call_count, 1)
+
+    def run_async(self, coroutine, timeout=5):
+        async def with_events():
+            self.daemon.wake = asyncio.Event()
+            self.daemon.stopping = asyncio.Event()
+            return await asyncio.wait_for(coroutine(), timeout)
+        return asyncio.run(with_events())
+
+    def test_schedule_runs_on_timer(self):
+        self.daemon.interval = 0.01
+        triggers = []
+
+        async def run_once():
+            triggers.append(self.daemon.status['last_trigger'])
+            if len(triggers) == 2:
+                self.daemon.stop()
+
+        self.daemon.run_once = run_once
+        self.run_async(self.daemon.schedule)
+        self.assertEqual(triggers, ['schedule', 'schedule'])
+
+    def test_schedule_wakes_on_trigger(self):
+        triggers = []
+
+        async def run_once():
+            triggers.append(self.daemon.status['last_trigger'])
+            self.daemon.stop()
+
+        async def schedule_and_trigger():
+            asyncio.get_running_loop().call_soon(self.daemon.trigger, 'socket')
+            await self.daemon.schedule()
+
+        self.daemon.run_once = run_once
+        with mock.patch.object(daemon.random, 'uniform', return_value=60):
+            self.run_async(schedule_and_trigger)
+        self.assertEqual(triggers, ['socket'])
+
+    def test_watch_triggers_on_change(self):
+        self.daemon.poll_interval = 0.01
+
+        async def watch_and_change():
+            watcher = asyncio.ensure_future(self.daemon.watch())
+            await asyncio.sleep(0.05)
+            self.assertFalse(self.daemon.wake.is_set())
+            self.provider.local_revision = 3
+            await asyncio.wait_for(self.daemon.wake.wait(), 1)
+            self.daemon.stop()
+            await watcher
+
+        self.run_async(watch_and_change)
+        self.assertEqual(self.daemon.status['last_trigger'], 'watch')
+
+    def test_watch_ignores_change_seen_by_last_cycle(self):
+        self.daemon.poll_interval = 0.01
+
+        async def watch_and_refresh():
+            watcher = asyncio.ensure_future(self.daemon.watch())
+            await asyncio.sleep(0.05)
+            self.daemon.run_cycle('schedule')
+            await asyncio.sleep(0.05)
+            self.assertFalse(self.daemon.wake.is_set())
+            self.daemon.stop()
+            await watcher
+
+        self.run_async(watch_and_refresh)
+
+    def test_socket_status_and_run(self):
+        self.daemon.schedule = mock.Mock(side_effect=lambda: self.daemon.stopping.wait())
+        self.daemon.watch = mock.Mock(side_effect=lambda: self.daemon.stopping.wait())
+
+        async def serve_and_query():
+            server = asyncio.ensure_future(self.daemon.serve())
+            while not os.path.exists(self.daemon.socket_path):
+                await asyncio.sleep(0.01)
+            loop = asyncio.get_running_loop()
+            status = await loop.run_in_executor(None, daemon.query_status, self.daemon.socket_path)
+            triggered = await loop.run_in_executor(None, daemon.query_status, self.daemon.socket_path, 'run')
+            self.daemon.stop()
+            await server
+            return status, triggered
+
+        status, triggered = asyncio.run(serve_and_query())
+        self.assertEqual(status['cycles'], 0)
+        self.assertEqual(triggered, {'triggered': True})
+        self.assertEqual(self.daemon.status['last_trigger'], 'socket')
+        self.assertFalse(os.path.exists(self.daemon.socket_path))
+
+
+class InstalledProvider(Provider):
+    """
+    Answers with the given updates, none of them installed yet.
+    """
+
+    def __init__(self, packages):
+        self.packages = packages
+
+    def __call__(self, repos_filter, clean_metadata):
+        return list(self.packages)
+
+    def installed(self):
+        return frozenset()
+
+
+class DaemonCycleTest(unittest.TestCase):
+    """
+    Runs whole cycles against a local bare GIT remote.
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.remote = fixtures.make_remote(self.root)
+        self.cwd = os.path.join(self.root, 'cwd')
+        conf = fixtures.make_conf(self.cwd, self.remote, bundle='false', snapshot='true')
+        conf.read_dict({'Daemon': {'interval': '3600', 'jitter': '0', 'poll_interval': '1'}})
+        self.provider = InstalledProvider([{'name': 'bash', 'repo': 'base', 'version': '4.2.46-35.el7'}])
+        self.daemon = daemon.Daemon(conf, self.provider, workspace=GitWorkspace.from_conf(conf))
+        self.addCleanup(self.daemon.executor.shutdown)
+        metrics_patcher = mock.patch.object(daemon.metrics, 'emit')
+        metrics_patcher.start()
+        self.addCleanup(metrics_patcher.stop)
+
+    def remote_file(self):
+        return subprocess.check_output(['git', '--git-dir', self.remote, 'show',
+                                        'package_update_environment_branch:hiera/Common_RedHat.json'])
+
+    def test_snapshot_cycles(self):
+        first = self.daemon.run_cycle('socket')
+        self.assertTrue(first['pushed'], first)
+        self.assertIn(b'bash', self.remote_file())
+
+        self.provider.packages = self.provider.packages + [{'name': 'glibc', 'repo': 'base',
+                                                            'version': '2.17-326.el7'}]
+        self.daemon.provider.packages = None  # The fake provider leaves the fingerprint as it is
+        second = self.daemon.run_cycle('socket')
+        self.assertIsNone(second['push_error'], second)
+        self.assertTrue(second['commit'].startswith('Added 1 packages'), second['commit'])
+        self.assertIn(b'glibc', self.remote_file())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from configparser import ConfigParser
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'app'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'bench'))
+import fan_out  # noqa: E402
+import fixtures  # noqa: E402
+from metrics import metrics  # noqa: E402
+from pr_client import PRError  # noqa: E402
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+
+class ProposeTest(unittest.TestCase):
+
+    def setUp(self):
+        conf = ConfigParser()
+        conf.read_dict({'General': {'cwd': '/tmp/update-with-puppet'},
+                        'GIT': {'src_branch': 'environment_branch', 'work_branch': 'package_update'},
+                        'PR': {'title': 'Package update'},
+                        'Target:production': {'src_branch': 'production'},
+                        'Target:staging': {'src_branch': 'staging'}})
+        self.targets = fan_out.target_confs(conf)
+        self.target_confs_by_name = dict((name, fan_out.dict_to_conf(sections)) for name, sections in self.targets)
+
+    def test_shared_working_branch_is_rejected(self):
+        conf = ConfigParser()
+        conf.read_dict({'General': {'cwd': '/tmp/update-with-puppet'},
+                        'GIT': {'src_branch': 'environment_branch', 'work_branch': 'package_update'},
+                        'Target:production': {'src_branch': 'production'},
+                        'Target:live': {'src_branch': 'production', 'file': 'Live_RedHat.json'}})
+        self.assertRaises(ValueError, fan_out.target_confs, conf)
+
+    def test_pr_error_of_one_target_does_not_stop_the_others(self):
+        def pr_exists(conf, client):
+            if conf['GIT']['src_branch'] == 'production':
+                raise PRError('Bitbucket answered 500')
+            return False
+
+        with mock.patch.object(fan_out, 'pr_exists', side_effect=pr_exists), \
+                mock.patch.object(fan_out, 'create_pr_from_conf', return_value={'id': 1}) as create_pr:
+            pr_errors = fan_out.propose(self.targets, self.target_confs_by_name, mock.Mock())
+        self.assertEqual(pr_errors, {'production': 'Bitbucket answered 500', 'staging': None})
+        create_pr.assert_called_once_with(self.target_confs_by_name['staging'], 'package_update_staging', mock.ANY)
+
+    def test_failed_creation_is_recorded(self):
+        with mock.patch.object(fan_out, 'pr_exists', return_value=False), \
+                mock.patch.object(fan_out, 'create_pr_from_conf', return_value=None):
+            pr_errors = fan_out.propose(self.targets, self.target_confs_by_name, mock.Mock())
+        self.assertEqual(pr_errors, {'production': 'PR creation failed', 'staging': 'PR creation failed'})
+
+
+class RunTargetsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cwd)
+        conf = fixtures.make_conf(self.cwd, '', bundle='false')
+        conf.read_dict({'Target:production': {'src_branch': 'production'},
+                        'Target:staging': {'src_branch': 'staging'}})
+        self.targets = fan_out.target_confs(conf)
+        for name, sections in self.targets:
+            fixtures.write_hiera(os.path.join(sections['General']['cwd'], 'repo', 'hiera', 'Common_RedHat.json'), {})
+        self.packages_found = fixtures.package_list(20)
+        run_metrics = (metrics.stages, metrics.counters, metrics.started)
+        metrics.reset()
+        self.addCleanup(setattr, metrics, 'stages', run_metrics[0])
+        self.addCleanup(setattr, metrics, 'counters', run_metrics[1])
+
+    def test_sequential_targets_merge_their_metrics(self):
+        with metrics.stage('query'):
+            pass
+        metrics.add('packages_found', len(self.packages_found))
+
+        messages, written, cache_entries, snapshots = fan_out.run_targets(self.targets, self.packages_found, 'yum', 1)
+        self.assertEqual(sorted(messages), ['production', 'staging'])
+        stages = [record['stage'] for record in metrics.stages]
+        self.assertEqual(stages.count('query'), 1)
+        self.assertEqual(stages.count('production_generate_list'), 1)
+        self.assertEqual(stages.count('staging_generate_list'), 1)
+        self.assertEqual(metrics.counters['packages_found'], 3 * len(self.packages_found))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'app'))
+import hiera_io  # noqa: E402
+import update_context  # noqa: E402
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+# Small reads cut the document everywhere: in keys, escapes, surrogate pairs and numbers
+chunk_sizes = (1, 2, 3, 5, 7, 64)
+
+hiera = {
+    'execs': {'update_glibc': {'command': 'yum -y install glibc-2.17-326.el7', 'path': '/bin:/usr/bin/',
+                               'unless': 'rpm -q glibc-2.17-326.el7'}},
+    'packages': {
+        'bash': {'ensure': '4.2.46-35.el7', 'install_options': [{'--disablerepo': '*', '--enablerepo': 'base'},
+                                                                '--cacheonly']},
+        'kernel-3.10.0-1160.el7': {'ensure': 'installed', 'require': 'Exec[update_kernel]'},
+        'quote"back\\slash/tab\t': {'ensure': '1.0-1', 'note': 'line\nbreak é€ \U0001f600'},
+        'numbers': {'int': 1234567890, 'float': 1.5, 'exp': -2.5e-10, 'zero': 0, 'big': 12345678901234567890},
+        'literals': {'true': True, 'false': False, 'null': None, 'empty': {}, 'list': []},
+    },
+    'other': [1, 2.25, 'three'],
+}
+
+
+class ReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cwd)
+
+    def write(self, text, name='hiera.json'):
+        path = os.path.join(self.cwd, name)
+        with io.open(path, 'w', encoding='utf-8') as hiera_file:
+            hiera_file.write(text)
+        return path
+
+    def test_iter_resources_matches_json_load(self):
+        for ensure_ascii in (True, False):
+            for indent in (None, 4):
+                path = self.write(json.dumps(hiera, ensure_ascii=ensure_ascii, indent=indent))
+                with io.open(path, encoding='utf-8') as hiera_file:
+                    expected = json.load(hiera_file)
+                for size in chunk_sizes:
+                    with mock.patch.object(hiera_io, 'chunk_size', size):
+                        wrapped = [None]
+                        resources = list(hiera_io.iter_resources(path, 'packages', wrapped))
+                    self.assertEqual(dict(resources), expected['packages'], (ensure_ascii, indent, size))
+                    self.assertEqual([title for title, resource in resources], list(expected['packages']))
+                    self.assertEqual(wrapped, [True])
+
+    def test_unwrapped_resources(self):
+        path = self.write(json.dumps(hiera['packages']))
+        for size in chunk_sizes:
+            with mock.patch.object(hiera_io, 'chunk_size', size):
+                self.assertEqual(hiera_io.read_resources(path, 'packages'), (hiera['packages'], False))
+
+    def test_not_an_object(self):
+        path = self.write('[1, 2]')
+        self.assertEqual(hiera_io.read_resources(path, 'packages'), ({}, False))
+
+    def test_truncated_file_raises(self):
+        path = self.write(json.dumps(hiera)[:-20])
+        with mock.patch.object(hiera_io, 'chunk_size', 3):
+            self.assertRaises(ValueError, hiera_io.read_resources, path, 'packages')
+
+    def test_parse_hiera_matches_json_load(self):
+        path = self.write(json.dumps(hiera, indent=4))
+        for size in chunk_sizes:
+            with mock.patch.object(hiera_io, 'chunk_size', size):
+                self.assertEqual(update_context.parse_hiera(path, 'packages'), (len(hiera['packages']), True))
+
+
+class WriteStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cwd)
+        self.path = os.path.join(self.cwd, 'hiera.json')
+
+    def test_identical_content_is_not_rewritten(self):
+        self.assertTrue(hiera_io.write_json(self.path, hiera))
+        os.utime(self.path, (1000000000, 1000000000))
+        self.assertFalse(hiera_io.write_json(self.path, hiera))
+        self.assertEqual(os.stat(self.path).st_mtime, 1000000000)
+        self.assertEqual(os.listdir(self.cwd), ['hiera.json'])
+
+    def test_changed_content_is_written(self):
+        hiera_io.write_stream(self.path, ['{"packages": ', '{}}'])
+        self.assertTrue(hiera_io.write_stream(self.path, ['{"packages": ', '{"bash": {"ensure": "é"}}}']))
+        with io.open(self.path, encoding='utf-8') as hiera_file:
+            self.assertEqual(json.load(hiera_file), {'packages': {'bash': {'ensure': 'é'}}})
+        self.assertEqual(os.listdir(self.cwd), ['hiera.json'])
+
+    def test_failed_encoding_leaves_the_file(self):
+        hiera_io.write_stream(self.path, ['{}'])
+
+        def chunks():
+            yield '{"packages": '
+            raise TypeError('not serializable')
+
+        self.assertRaises(TypeError, hiera_io.write_stream, self.path, chunks())
+        with open(self.path) as hiera_file:
+            self.assertEqual(hiera_file.read(), '{}')
+        self.assertEqual(os.listdir(self.cwd), ['hiera.json'])
+
+
+if __name__ == '__main__':
+    unittest.main()
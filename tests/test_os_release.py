@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'app'))
+import os_release  # noqa: E402
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+centos_7 = '''NAME="CentOS Linux"
+VERSION="7 (Core)"
+ID="centos"
+ID_LIKE="rhel fedora"
+VERSION_ID="7"
+PRETTY_NAME="CentOS Linux 7 (Core)"
+'''
+
+
+def release(**fields):
+    return '\n'.join('%s=%s' % item for item in fields.items()) + '\n'
+
+
+class OsReleaseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cwd)
+        self.path = os.path.join(self.cwd, 'os-release')
+        for patcher in (mock.patch.object(os_release, 'os_release_paths', [self.path]),
+                        mock.patch.object(os_release, '_os_release', None)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write(self, content):
+        with open(self.path, 'w') as release_file:
+            release_file.write(content)
+        os_release._os_release = None
+
+    def test_parse_os_release_unquotes(self):
+        parsed = os_release.parse_os_release([
+            '# comment', '', 'NAME="Debian GNU/Linux"', "ID='debian'", 'VERSION_ID=12',
+            'PRETTY_NAME="Say \\"hi\\" \\$HOME \\\\ \\`x\\`"', 'BROKEN', 'EMPTY=', 'URL="https://a=b"'])
+        self.assertEqual(parsed, {'NAME': 'Debian GNU/Linux', 'ID': 'debian', 'VERSION_ID': '12',
+                                  'PRETTY_NAME': 'Say "hi" $HOME \\ `x`', 'EMPTY': '', 'URL': 'https://a=b'})
+
+    def test_os_release_is_read_once(self):
+        self.write(centos_7)
+        self.assertEqual(os_release.os_release()['ID'], 'centos')
+        with open(self.path, 'w') as release_file:
+            release_file.write(release(ID='debian'))
+        with mock.patch('os_release.open', side_effect=AssertionError('read twice'), create=True):
+            self.assertEqual(os_release.os_release()['ID'], 'centos')
+        self.assertEqual(os_release.get_linux_dist(), ('CentOS Linux', '7', ''))
+
+    def test_dist_ids_and_major_version(self):
+        self.write(centos_7)
+        self.assertEqual(os_release.dist_ids(), frozenset(['centos', 'rhel', 'fedora']))
+        self.assertEqual(os_release.major_version(), 7)
+        self.assertTrue(os_release.is_supported())
+        self.write(release(ID='rocky', ID_LIKE='"rhel centos fedora"', VERSION_ID='"8.9"'))
+        self.assertEqual(os_release.major_version(), 8)
+        self.write(release(ID='arch'))
+        self.assertEqual(os_release.major_version(), 0)
+        self.assertFalse(os_release.is_supported())
+
+    def test_use_dnf(self):
+        for content, expected in ((centos_7, False),
+                                  (release(ID='rhel', ID_LIKE='fedora', VERSION_ID='"8.6"'), True),
+                                  (release(ID='fedora', VERSION_ID='22'), False),
+                                  (release(ID='fedora', VERSION_ID='39'), True),
+                                  (release(ID='debian', VERSION_ID='12'), False)):
+            self.write(content)
+            self.assertEqual(os_release.use_dnf(), expected, content)
+
+
+if __name__ == '__main__':
+    unittest.main()
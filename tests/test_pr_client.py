@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'app'))
+import pr_client  # noqa: E402
+from pr_client import BitbucketClient, PRError  # noqa: E402
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+api_path = '/2.0/repositories/account/repo/pullrequests'
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    """
+    Bitbucket pull request API stub: scripted failures are consumed first, then open PRs are served two per page.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.requests = []
+        self.connections = set()
+        self.failures = []  # 'drop' closes the connection without answering, an int answers that status
+        self.pull_requests = []
+        self.created = []
+
+    @property
+    def api_url(self):
+        return 'http://127.0.0.1:%d%s' % (self.server_address[1], api_path)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keeps the connection open between requests
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, payload=None, headers=None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def scripted_failure(self):
+        self.server.requests.append((self.command, self.path))
+        self.server.connections.add(self.client_address)
+        if not self.server.failures:
+            return False
+        failure = self.server.failures.pop(0)
+        if failure == 'drop':
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+        else:
+            self.reply(failure, {'error': {'message': 'scripted'}})
+        return True
+
+    def do_GET(self):
+        if self.scripted_failure():
+            return
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        page = int(query.get('page', ['1'])[0])
+        values = self.server.pull_requests[(page - 1) * 2:page * 2]
+        payload = {'values': values, 'page': page}
+        if page * 2 < len(self.server.pull_requests):
+            payload['next'] = parsed.path + '?' + parsed.query.split('&page=')[0] + '&page=' + str(page + 1)
+        etag = '"%d-%d"' % (page, len(self.server.pull_requests))
+        if self.headers.get('If-None-Match') == etag:
+            self.reply(304)
+        else:
+            self.reply(200, payload, {'ETag': etag})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+        if self.scripted_failure():
+            return
+        self.server.created.append(body)
+        self.reply(201, dict(body, id=len(self.server.created)))
+
+
+class BitbucketClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubServer()
+        thread = threading.Thread(target=self.server.serve_forever, args=(0.05,))
+        thread.daemon = True
+        thread.start()
+        self.cache_dir = tempfile.mkdtemp()
+        self.client = BitbucketClient(self.server.api_url, 'user', 'password', cache_dir=self.cache_dir, retries=2,
+                                      backoff=0, timeout=5)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.cache_dir)
+
+    def test_find_open_pr_follows_pages(self):
+        self.server.pull_requests = [{'title': 'Other ' + str(number)} for number in range(4)] + \
+            [{'title': 'OS updates'}]
+        self.assertEqual(self.client.find_open_pr('OS updates'), {'title': 'OS updates'})
+        self.assertEqual(len(self.server.requests), 3)
+        query = parse_qs(urlparse(self.server.requests[0][1]).query)
+        self.assertEqual(query['q'], ['title="OS updates" AND state="OPEN"'])
+        self.assertIsNone(self.client.find_open_pr('Missing'))
+
+    def test_connection_is_kept_alive(self):
+        self.client.find_open_pr('OS updates')
+        self.client.create_pr({'title': 'OS updates'})
+        self.client.find_open_pr('OS updates')
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_etag_answers_unchanged_lookup(self):
+        self.server.pull_requests = [{'title': 'OS updates'}]
+        self.client.find_open_pr('OS updates')
+        with mock.patch.object(pr_client.metrics, 'add') as add:
+            self.assertEqual(self.client.find_open_pr('OS updates'), {'title': 'OS updates'})
+        add.assert_any_call('http_not_modified')
+
+    def test_get_retried_on_status_and_dropped_connection(self):
+        self.server.failures = [503, 'drop']
+        self.server.pull_requests = [{'title': 'OS updates'}]
+        self.assertEqual(self.client.find_open_pr('OS updates'), {'title': 'OS updates'})
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_get_gives_up_after_retries(self):
+        self.server.failures = [500, 500, 500]
+        with self.assertRaises(PRError):
+            self.client.find_open_pr('OS updates')
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_post_not_resent_once_sent(self):
+        self.server.failures = ['drop']
+        with self.assertRaises(PRError):
+            self.client.create_pr({'title': 'OS updates'})
+        self.assertEqual(self.server.requests, [('POST', api_path)])
+
+    def test_post_not_resent_on_server_error(self):
+        self.server.failures = [502]
+        with self.assertRaises(PRError):
+            self.client.create_pr({'title': 'OS updates'})
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_post_resent_on_unprocessed_status(self):
+        self.server.failures = [503]
+        self.assertEqual(self.client.create_pr({'title': 'OS updates'})['id'], 1)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(len(self.server.created), 1)
+
+    def test_post_resent_on_connect_failure(self):
+        connect = pr_client.httplib.HTTPConnection.connect
+        attempts = []
+
+        def refuse_once(connection):
+            attempts.append(connection)
+            if len(attempts) == 1:
+                raise socket.error('Connection refused')
+            connect(connection)
+
+        with mock.patch.object(pr_client.httplib.HTTPConnection, 'connect', refuse_once):
+            self.assertEqual(self.client.create_pr({'title': 'OS updates'})['id'], 1)
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(len(self.server.created), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
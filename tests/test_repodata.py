@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'app'))
+import repodata  # noqa: E402
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+fixtures_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'fixtures')
+repodata_dir = os.path.join(fixtures_dir, 'repodata')
+installed_file = os.path.join(fixtures_dir, 'rpm-qa.txt')
+# base ships primary.xml.gz, updates a primary sqlite database in a dnf cache folder
+base_dir = os.path.join(repodata_dir, 'base')
+updates_dir = os.path.join(repodata_dir, 'updates-0123456789abcdef')
+
+
+class RepodataTest(unittest.TestCase):
+
+    def test_find_repos(self):
+        self.assertEqual(repodata.find_repos(repodata_dir), {'base': base_dir, 'updates': updates_dir})
+
+    def test_parse_repomd(self):
+        repomd = repodata.parse_repomd(base_dir)
+        self.assertEqual(repomd['revision'], '1700000000')
+        self.assertEqual(repomd['data']['primary'], {'location': 'repodata/primary.xml.gz', 'checksum': '1111'})
+
+    def test_iter_primary_xml(self):
+        path = os.path.join(base_dir, 'repodata', 'primary.xml.gz')
+        dependencies = {}
+        packages = list(repodata.iter_primary_xml(path, set(['glibc', 'tzdata']), dependencies))
+        self.assertEqual(packages, [('glibc', 'x86_64', ('0', '2.17', '326.el7')),
+                                    ('tzdata', 'noarch', ('0', '2023c', '1.el7'))])
+        self.assertEqual(dependencies[('glibc', '2.17-326.el7')], (['glibc', 'libc.so.6'], ['glibc-common']))
+        self.assertEqual(len(list(repodata.iter_primary_xml(path))), 6)
+
+    def test_iter_primary_sqlite(self):
+        path = os.path.join(updates_dir, 'repodata', 'primary.sqlite')
+        dependencies = {}
+        packages = list(repodata.iter_primary_sqlite(path, set(['openssl', 'openssl-libs']), dependencies))
+        self.assertEqual(packages, [('openssl-libs', 'x86_64', ('1', '1.0.2k', '26.el7_9')),
+                                    ('openssl', 'x86_64', ('1', '1.0.2k', '26.el7_9'))])
+        self.assertEqual(dependencies, {('openssl', '1.0.2k-26.el7_9'): (['openssl'], ['openssl-libs']),
+                                        ('openssl-libs', '1.0.2k-26.el7_9'): (['openssl-libs', 'libssl.so.10'], [])})
+
+    def test_repo_deps_from_both_formats(self):
+        self.assertEqual(list(repodata.iter_repo_deps(base_dir, {'glibc-common': '2.17-326.el7'})),
+                         [('glibc-common', ['glibc-common'], ['glibc'])])
+        self.assertEqual(list(repodata.iter_repo_deps(updates_dir, {'openssl': '1.0.2k-26.el7_9'})),
+                         [('openssl', ['openssl'], ['openssl-libs'])])
+
+    def test_query_repodata(self):
+        dependencies = {}
+        updates = repodata.query_repodata('', repodata_dir, installed_file, 2, dependencies)
+        self.assertEqual(updates, [{'name': 'bash', 'repo': 'base', 'version': '4.2.46-35.el7'},
+                                   {'name': 'glibc', 'repo': 'base', 'version': '2.17-326.el7'},
+                                   {'name': 'glibc-common', 'repo': 'base', 'version': '2.17-326.el7'},
+                                   {'name': 'openssl', 'repo': 'updates', 'version': '1.0.2k-26.el7_9'},
+                                   {'name': 'openssl-libs', 'repo': 'updates', 'version': '1.0.2k-26.el7_9'},
+                                   {'name': 'tzdata', 'repo': 'updates', 'version': '2024a-1.el7'}])
+        self.assertEqual(dependencies[('base', 'glibc', '2.17-326.el7')], (['glibc', 'libc.so.6'], ['glibc-common']))
+        self.assertNotIn(('updates', 'bash', '4.2.46-35.el7'), dependencies)
+
+    def test_query_repodata_first_listed_repository_wins(self):
+        updates = repodata.query_repodata('updates', repodata_dir, installed_file)
+        self.assertEqual([(pkg['name'], pkg['repo']) for pkg in updates],
+                         [('bash', 'updates'), ('openssl', 'updates'), ('openssl-libs', 'updates'),
+                          ('tzdata', 'updates')])
+        updates = repodata.query_repodata('updates,base', repodata_dir, installed_file)
+        self.assertEqual(updates[0], {'name': 'bash', 'repo': 'updates', 'version': '4.2.46-35.el7'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'app'))
+import generate_list  # noqa: E402
+from bundle_index import BundleIndex  # noqa: E402
+from shards import ShardLayout, shard_folder  # noqa: E402
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+
+def deep_merge(merged, other):
+    """
+    Merges other into merged as a Hiera 'deep' merge does, keys already in merged win.
+    """
+    for key, value in other.items():
+        if isinstance(merged.get(key), dict) and isinstance(value, dict):
+            deep_merge(merged[key], value)
+        else:
+            merged.setdefault(key, value)
+    return merged
+
+
+class ShardsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cwd)
+        self.working_file = os.path.join(self.cwd, 'Common_RedHat.json')
+        patcher = mock.patch.object(generate_list, 'last_paths', [])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_execs_spread_across_shards_are_recoverable(self):
+        package_bundle = BundleIndex.from_bundles({'abrt': ['abrt', 'abrt-libs'], 'audit': ['audit', 'audit-libs']})
+        resources = {'packages': dict((name, {'ensure': '2.1-1.el7'})
+                                      for name in ('abrt', 'abrt-libs', 'audit', 'audit-libs', 'bash'))}
+        generate_list.update_shards(self.working_file, resources, 'packages', ShardLayout('bundle', 2, package_bundle))
+
+        shards = []
+        for path in sorted(glob.glob(os.path.join(shard_folder(self.working_file), '*.json'))):
+            with open(path) as shard_file:
+                shards.append(json.load(shard_file))
+        self.assertGreater(len([shard for shard in shards if 'execs' in shard]), 1)
+        merged = {}
+        for shard in shards:
+            deep_merge(merged, shard)
+        self.assertEqual(set(merged['packages']), set(resources['packages']))
+        self.assertEqual(set(merged['execs']), set(['update_abrt', 'update_audit']))
+        self.assertEqual(merged['packages']['audit-libs']['require'], 'Exec[update_audit]')
+
+
+if __name__ == '__main__':
+    unittest.main()
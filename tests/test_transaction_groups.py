@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'app'))
+from bundle_index import BundleIndex  # noqa: E402
+from transaction_groups import group_packages, read_dependencies  # noqa: E402
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+repodata_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'fixtures', 'repodata')
+
+
+def names(*pkg_names):
+    return dict((name, name) for name in pkg_names)
+
+
+class GroupPackagesTest(unittest.TestCase):
+
+    def test_chained_dependencies_are_grouped(self):
+        providers = {'a': set(['a']), 'b': set(['b']), 'libc.so': set(['c'])}
+        requires = {'a': ['b'], 'b': ['libc.so']}
+        groups = group_packages(names('a', 'b', 'c'), providers, requires)
+        self.assertEqual(groups.groups, {'a': 'auto_a', 'b': 'auto_a', 'c': 'auto_a'})
+
+    def test_independent_packages_are_kept_apart(self):
+        providers = {'a': set(['a']), 'b': set(['b']), 'c': set(['c']), 'd': set(['d'])}
+        requires = {'a': ['b'], 'c': ['d']}
+        groups = group_packages(names('a', 'b', 'c', 'd', 'e'), providers, requires)
+        self.assertEqual(groups.groups, {'a': 'auto_a', 'b': 'auto_a', 'c': 'auto_c', 'd': 'auto_c'})
+        self.assertIsNone(groups.lookup('e'))
+
+    def test_dependencies_outside_the_updates_are_ignored(self):
+        providers = {'a': set(['a']), 'glibc': set(['glibc'])}
+        requires = {'a': ['glibc', 'openssl-libs'], 'glibc': ['a'], 'openssl': ['openssl-libs']}
+        groups = group_packages(names('a', 'b'), providers, requires)
+        self.assertEqual(len(groups), 0)
+
+    def test_static_bundle_names_the_component(self):
+        providers = {'glibc': set(['glibc']), 'glibc-common': set(['glibc-common']), 'nscd': set(['nscd'])}
+        requires = {'nscd': ['glibc']}
+        package_bundle = BundleIndex.from_bundles({'glibc': ['glibc', 'glibc-common']})
+        groups = group_packages(names('glibc', 'glibc-common', 'nscd'), providers, requires, package_bundle)
+        self.assertEqual(groups.groups, {'glibc': 'glibc', 'glibc-common': 'glibc', 'nscd': 'glibc'})
+
+    def test_multi_version_titles_follow_their_package(self):
+        pkg_names = {'kernel-3.10.0-1160.el7': 'kernel', 'kernel-tools': 'kernel-tools'}
+        groups = group_packages(pkg_names, {'kernel': set(['kernel'])}, {'kernel-tools': ['kernel']})
+        self.assertEqual(groups.groups, {'kernel-3.10.0-1160.el7': 'auto_kernel',
+                                         'kernel-tools': 'auto_kernel'})
+
+
+class ReadDependenciesTest(unittest.TestCase):
+
+    def test_read_from_repodata_and_known(self):
+        pkg_list = [{'name': 'glibc', 'repo': 'base', 'version': '2.17-326.el7'},
+                    {'name': 'glibc-common', 'repo': 'base', 'version': '2.17-326.el7'},
+                    {'name': 'openssl', 'repo': 'updates', 'version': '1.0.2k-26.el7_9'},
+                    {'name': 'openssl-libs', 'repo': 'updates', 'version': '1.0.2k-26.el7_9'}]
+        known = {('updates', 'openssl-libs', '1.0.2k-26.el7_9'): (['openssl-libs', 'libssl.so.10'], [])}
+        providers, requires = read_dependencies(pkg_list, repodata_dir, known)
+        self.assertEqual(requires, {'glibc': ['glibc-common'], 'glibc-common': ['glibc'],
+                                    'openssl': ['openssl-libs']})
+        self.assertEqual(providers['libssl.so.10'], set(['openssl-libs']))
+        groups = group_packages(names(*[pkg['name'] for pkg in pkg_list]), providers, requires)
+        self.assertEqual(groups.groups, {'glibc': 'auto_glibc', 'glibc-common': 'auto_glibc',
+                                         'openssl': 'auto_openssl', 'openssl-libs': 'auto_openssl'})
+
+
+if __name__ == '__main__':
+    unittest.main()
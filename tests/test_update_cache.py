@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'app'))
+import update_cache  # noqa: E402
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+repodata_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'fixtures', 'repodata')
+clean_list = [{'name': 'bash', 'repo': 'base', 'version': '4.2.46-35.el7'}]
+
+
+class UpdateCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cwd)
+        self.cache_dir = os.path.join(self.cwd, '.cache')
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, update_cache.cache_folder, key + '.json')
+
+    def age(self, key, seconds):
+        mtime = time.time() - seconds
+        os.utime(self.entry_path(key), (mtime, mtime))
+
+    def test_store_and_lookup(self):
+        self.assertIsNone(update_cache.lookup(self.cache_dir, 'key1'))
+        update_cache.store(self.cache_dir, 'key1', clean_list)
+        self.assertEqual(update_cache.lookup(self.cache_dir, 'key1'), clean_list)
+        self.assertIsNone(update_cache.lookup(self.cache_dir, 'key2'))
+        self.assertEqual(update_cache.latest(self.cache_dir), clean_list)
+        self.assertEqual(update_cache.latest_summary(self.cache_dir)[1], 1)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.cache_dir, update_cache.cache_folder))),
+                         ['key1.json', update_cache.summary_file])
+
+    def test_expired_entry(self):
+        update_cache.store(self.cache_dir, 'key1', clean_list)
+        self.age('key1', 120)
+        self.assertIsNone(update_cache.lookup(self.cache_dir, 'key1', 60))
+        self.assertFalse(update_cache.has_fresh_entry(self.cache_dir, 60))
+        self.assertEqual(update_cache.lookup(self.cache_dir, 'key1', 300), clean_list)
+        self.assertTrue(update_cache.has_fresh_entry(self.cache_dir, 300))
+
+    def test_corrupt_entry_is_a_miss(self):
+        update_cache.store(self.cache_dir, 'key1', clean_list)
+        with open(self.entry_path('key1'), 'w') as entry:
+            entry.write('{"clean_list": [')
+        self.assertIsNone(update_cache.lookup(self.cache_dir, 'key1'))
+
+    def test_evict_expired_then_oldest(self):
+        for number in range(4):
+            update_cache.store(self.cache_dir, 'key%d' % number, clean_list * 10)
+            self.age('key%d' % number, 100 - number)
+        self.age('key0', 7200)
+        size = os.path.getsize(self.entry_path('key1'))
+        update_cache.evict(self.cache_dir, 3600, 2 * size)
+        self.assertEqual([os.path.basename(path) for mtime, size, path in update_cache._entries(self.cache_dir)],
+                         ['key2.json', 'key3.json'])
+
+    def test_summary_without_summary_file(self):
+        update_cache.store(self.cache_dir, 'key1', clean_list * 3)
+        os.remove(os.path.join(self.cache_dir, update_cache.cache_folder, update_cache.summary_file))
+        self.assertEqual(update_cache.latest_summary(self.cache_dir)[1], 3)
+
+    def test_key_follows_repository_metadata_and_rpmdb(self):
+        repos = os.path.join(self.cwd, 'repodata')
+        shutil.copytree(repodata_dir, repos)
+        rpmdb = os.path.join(self.cwd, 'rpm')
+        os.makedirs(rpmdb)
+        with open(os.path.join(rpmdb, 'Packages'), 'w') as rpmdb_file:
+            rpmdb_file.write('v1')
+        key = update_cache.compute_key(repos, '', rpmdb)
+        self.assertEqual(update_cache.compute_key(repos, '', rpmdb), key)
+        self.assertNotEqual(update_cache.compute_key(repos, 'base', rpmdb), key)
+
+        repomd_path = os.path.join(repos, 'updates-0123456789abcdef', 'repodata', 'repomd.xml')
+        with open(repomd_path) as repomd:
+            content = repomd.read()
+        with open(repomd_path, 'w') as repomd:
+            repomd.write(content.replace('1700000100', '1700000300'))
+        changed_repo = update_cache.compute_key(repos, '', rpmdb)
+        self.assertNotEqual(changed_repo, key)
+        self.assertEqual(update_cache.compute_key(repos, 'base', rpmdb),
+                         update_cache.compute_key(repos, 'base', rpmdb))
+
+        with open(os.path.join(rpmdb, 'Packages'), 'w') as rpmdb_file:
+            rpmdb_file.write('v2 with more packages')
+        self.assertNotEqual(update_cache.compute_key(repos, '', rpmdb), changed_repo)
+
+    def test_key_of_apt_lists_follows_the_files(self):
+        lists = os.path.join(self.cwd, 'lists')
+        os.makedirs(lists)
+        with open(os.path.join(lists, 'deb.debian.org_debian_dists_bookworm_main_binary-amd64_Packages'), 'w') as f:
+            f.write('Package: bash\n')
+        key = update_cache.repo_metadata_key(lists, '')
+        with open(os.path.join(lists, 'deb.debian.org_debian_dists_bookworm_main_binary-amd64_Packages'), 'a') as f:
+            f.write('Version: 5.2.15-2+b2\n')
+        self.assertNotEqual(update_cache.repo_metadata_key(lists, ''), key)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from configparser import ConfigParser
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'app'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'bench'))
+import fixtures  # noqa: E402
+import generate_list  # noqa: E402
+import update_context  # noqa: E402
+from git_workspace import GitError  # noqa: E402
+from providers import ListProvider  # noqa: E402
+from updateinfo import UpdateInfoIndex  # noqa: E402
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+
+class GenerateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cwd)
+        self.working_file = os.path.join(self.cwd, 'updates.json')
+        self.write_hiera([])
+        self.conf = ConfigParser()
+        self.conf.read_dict({'General': {'cwd': self.cwd}, 'Package': {'root_key': 'packages'}})
+        patcher = mock.patch.object(generate_list, 'last_delta', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write_hiera(self, packages):
+        with open(self.working_file, 'w') as hiera_file:
+            json.dump(generate_list.build_hash(packages, True, False, False, False, 'packages'), hiera_file)
+
+    def generate(self, packages, updateinfo=None):
+        with mock.patch.object(generate_list, 'run', side_effect=lambda conf, provider: self.write_hiera(packages)), \
+                mock.patch.object(update_context, 'advisory_index', return_value=updateinfo):
+            return update_context.generate(self.conf, self.working_file, 'OS_Update_master')
+
+    def test_kernel_update_recommends_restart(self):
+        message = self.generate([{'name': 'bash', 'repo': 'base', 'version': '4.2.46-35.el7'},
+                                 {'name': 'kernel', 'repo': 'updates', 'version': '3.10.0-1160.el7'}])
+        self.assertTrue(message.endswith(', system restart recommended'), message)
+
+    def test_update_without_reboot(self):
+        message = self.generate([{'name': 'bash', 'repo': 'base', 'version': '4.2.46-35.el7'},
+                                 {'name': 'kernel-headers', 'repo': 'updates', 'version': '3.10.0-1160.el7'}])
+        self.assertNotIn('restart', message)
+
+    def test_advisory_of_kernel_version_recommends_restart(self):
+        updateinfo = UpdateInfoIndex({('kernel-core', '4.18.0-305.el8'): ('RHSA-2021:1', 'security', 'Important',
+                                                                          True)})
+        message = self.generate([{'name': 'kernel-core', 'repo': 'baseos', 'version': '4.18.0-305.el8'}], updateinfo)
+        self.assertTrue(message.endswith(', system restart recommended'), message)
+
+    def test_package_version_of_multi_version_title(self):
+        self.assertEqual(update_context.package_version('kernel-core-4.18.0-305.el8', {'ensure': 'installed'}),
+                         ('kernel-core', '4.18.0-305.el8'))
+        self.assertEqual(update_context.package_version('kernel-tools', {'ensure': '3.10.0-1160.el7'}),
+                         ('kernel-tools', '3.10.0-1160.el7'))
+
+
+class SnapshotGenerateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cwd)
+        self.conf = fixtures.make_conf(self.cwd, '', bundle='false', snapshot='true')
+        self.working_file = os.path.join(self.cwd, 'remote', 'hiera', 'Common_RedHat.json')
+        fixtures.write_hiera(self.working_file, {})
+        self.bash = {'name': 'bash', 'repo': 'base', 'version': '4.2.46-35.el7'}
+        self.glibc = {'name': 'glibc', 'repo': 'base', 'version': '2.17-326.el7'}
+        self.generate([self.bash, self.glibc], frozenset())
+
+    def generate(self, packages, installed):
+        provider = ListProvider(packages)
+        provider.installed = lambda: installed
+        message = update_context.generate(self.conf, self.working_file, 'OS_Update_master', provider)
+        generate_list.store_snapshot(generate_list.last_snapshot)
+        with open(self.working_file) as hiera_file:
+            return message, json.load(hiera_file)['packages']
+
+    def test_removal_kept_until_installed_is_not_counted(self):
+        message, resources = self.generate([self.bash], frozenset())
+        self.assertIn('glibc', resources)
+        self.assertNotIn('emoved', message)
+
+    def test_applied_removal_is_counted(self):
+        message, resources = self.generate([self.bash], frozenset([('glibc', '2.17-326.el7')]))
+        self.assertNotIn('glibc', resources)
+        self.assertTrue(message.startswith('Removed 1 packages'), message)
+
+
+class UpdateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cwd)
+        self.conf = ConfigParser()
+        self.conf.read_dict({'General': {'cwd': self.cwd, 'file': 'Common_RedHat.json', 'hiera_folder': 'hiera'},
+                             'GIT': {'src_branch': 'environment_branch', 'work_branch': 'package_update'},
+                             'Package': {'root_key': 'packages'}, 'PR': {'generate': 'true'}})
+        self.workspace = mock.Mock(path=self.cwd, unpushed=False, discarded=False)
+        self.workspace.prepare.return_value = False
+        os.makedirs(os.path.join(self.cwd, 'hiera'))
+        with open(os.path.join(self.cwd, 'hiera', 'Common_RedHat.json'), 'w') as hiera_file:
+            json.dump({'packages': {}}, hiera_file)
+
+    def test_failed_push_opens_no_pr(self):
+        self.workspace.push.side_effect = GitError('git push failed: rejected')
+        client = mock.Mock()
+        with mock.patch.object(update_context, 'generate', return_value='Found 1 packages'), \
+                mock.patch.object(update_context, 'pr_exists', return_value=False) as pr_exists, \
+                mock.patch.object(update_context, 'create_pr_from_conf') as create_pr, \
+                mock.patch.object(generate_list, 'store_snapshot'), \
+                mock.patch.object(generate_list, 'store_cache_entry') as store_cache_entry:
+            status = update_context.update(self.conf, self.workspace, client=client)
+        self.assertEqual(status['push_error'], 'git push failed: rejected')
+        self.assertFalse(status['pull_request'])
+        pr_exists.assert_not_called()
+        create_pr.assert_not_called()
+        store_cache_entry.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
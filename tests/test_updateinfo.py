@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from configparser import ConfigParser
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'app'))
+import updateinfo  # noqa: E402
+from updateinfo import UpdateInfoIndex, filter_packages, load_updateinfo  # noqa: E402
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+repodata_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'fixtures', 'repodata')
+updateinfo_path = os.path.join(repodata_dir, 'base', 'repodata', 'updateinfo.xml.gz')
+
+packages = [{'name': 'bash', 'repo': 'base', 'version': '4.2.46-35.el7'},
+            {'name': 'glibc', 'repo': 'base', 'version': '2.17-326.el7'},
+            {'name': 'openssl', 'repo': 'updates', 'version': '1.0.2k-26.el7_9'},
+            {'name': 'tzdata', 'repo': 'base', 'version': '2023c-1.el7'}]
+
+
+def names(pkg_list):
+    return [pkg['name'] for pkg in pkg_list]
+
+
+class UpdateInfoIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = UpdateInfoIndex.from_file(updateinfo_path)
+
+    def test_iter_updateinfo(self):
+        advisories = list(updateinfo.iter_updateinfo(updateinfo_path))
+        self.assertEqual(advisories[0], ('RHSA-2023:0001', 'security', 'Important', False,
+                                         [('glibc', '2.17-326.el7'), ('glibc-common', '2.17-326.el7')]))
+        self.assertEqual(advisories[2][:4], ('RHEA-2023:0003', 'enhancement', 'Low', True))
+
+    def test_most_severe_advisory_wins_and_keeps_the_reboot_flag(self):
+        self.assertEqual(self.index.get('glibc', '2.17-326.el7'), ('RHSA-2023:0001', 'security', 'Important', True))
+        self.assertTrue(self.index.reboot_suggested('glibc', '2.17-326.el7'))
+        self.assertFalse(self.index.reboot_suggested('glibc-common', '2.17-326.el7'))
+        self.assertFalse(self.index.reboot_suggested('glibc', '2.17-317.el7'))
+        self.assertIsNone(self.index.get('openssl', '1.0.2k-26.el7_9'))
+
+    def test_filter_by_type(self):
+        self.assertEqual(names(filter_packages(packages, self.index, set(['security']))), ['glibc', 'tzdata'])
+        self.assertEqual(names(filter_packages(packages, self.index, set(['bugfix', 'security']))),
+                         ['bash', 'glibc', 'tzdata'])
+        self.assertEqual(names(filter_packages(packages, self.index)), ['bash', 'glibc', 'tzdata'])
+
+    def test_filter_by_severity(self):
+        self.assertEqual(names(filter_packages(packages, self.index, min_severity='Important')), ['glibc'])
+        self.assertEqual(names(filter_packages(packages, self.index, min_severity='moderate')), ['glibc', 'tzdata'])
+        self.assertEqual(names(filter_packages(packages, self.index, set(['security']), 'Critical')), [])
+
+    def test_filter_from_conf(self):
+        conf = ConfigParser()
+        conf.read_dict({'Package': {'advisory_types': 'Security, bugfix,', 'min_severity': 'Important'}})
+        self.assertEqual(updateinfo.filter_from_conf(conf), (set(['security', 'bugfix']), 'Important'))
+        conf.read_dict({'Package': {'advisory_types': '', 'min_severity': ''}})
+        self.assertEqual(updateinfo.filter_from_conf(conf), (set(), ''))
+
+
+class LoadUpdateInfoTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cwd)
+        self.repodata_dir = os.path.join(self.cwd, 'repodata')
+        shutil.copytree(repodata_dir, self.repodata_dir)
+        self.cache_dir = os.path.join(self.cwd, '.cache')
+
+    def test_repositories_without_updateinfo_give_an_empty_index(self):
+        self.assertEqual(len(load_updateinfo(self.repodata_dir, 'updates', self.cache_dir)), 0)
+        self.assertEqual(len(load_updateinfo(os.path.join(self.cwd, 'missing'))), 0)
+
+    def test_index_is_cached_per_metadata_revision(self):
+        index = load_updateinfo(self.repodata_dir, '', self.cache_dir)
+        self.assertEqual(len(index), 4)
+        self.assertTrue(os.path.exists(os.path.join(self.cache_dir, updateinfo.cache_folder, 'base.json')))
+        with mock.patch.object(UpdateInfoIndex, 'from_file') as from_file:
+            cached = load_updateinfo(self.repodata_dir, '', self.cache_dir)
+        from_file.assert_not_called()
+        self.assertEqual(cached.advisories, index.advisories)
+
+        repomd_path = os.path.join(self.repodata_dir, 'base', 'repodata', 'repomd.xml')
+        with open(repomd_path) as repomd:
+            content = repomd.read()
+        with open(repomd_path, 'w') as repomd:
+            repomd.write(content.replace('1700000000', '1700000200'))
+        with mock.patch.object(UpdateInfoIndex, 'from_file', return_value=UpdateInfoIndex()) as from_file:
+            load_updateinfo(self.repodata_dir, '', self.cache_dir)
+        from_file.assert_called_once_with(os.path.join(self.repodata_dir, 'base', 'repodata', 'updateinfo.xml.gz'))
+
+    def test_corrupt_cache_is_parsed_again(self):
+        load_updateinfo(self.repodata_dir, '', self.cache_dir)
+        with open(os.path.join(self.cache_dir, updateinfo.cache_folder, 'base.json'), 'w') as cache_file:
+            cache_file.write('{"key": [')
+        self.assertEqual(len(load_updateinfo(self.repodata_dir, '', self.cache_dir)), 4)
+
+    def test_index_from_conf(self):
+        conf = ConfigParser()
+        conf.read_dict({'General': {'cwd': self.cwd}, 'Package': {'repodata_dir': self.repodata_dir,
+                                                                  'pkg_repos': 'base'}})
+        self.assertTrue(updateinfo.index_from_conf(conf).reboot_suggested('glibc', '2.17-326.el7'))
+        self.assertTrue(os.path.isdir(os.path.join(self.cache_dir, updateinfo.cache_folder)))
+
+
+if __name__ == '__main__':
+    unittest.main()
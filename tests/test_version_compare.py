@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'app'))
+from version_compare import BatchComparator, compare_evr, compute_upgrades, rpmvercmp  # noqa: E402
+
+__author__ = 'Benjamin Merot <benjamin.merot@dsg.dk>'
+__copyright__ = "Copyright (C) 2017 Dansk Supermarked Group"
+__license__ = "GPL version 3"
+
+# (a, b, rpmvercmp(a, b)), from the rpmvercmp cases of rpm's test suite
+rpm_cases = [
+    ('1.0', '1.0', 0), ('1.0', '2.0', -1), ('2.0', '1.0', 1),
+    ('2.0.1', '2.0.1', 0), ('2.0', '2.0.1', -1), ('2.0.1a', '2.0.1', 1),
+    ('5.5p1', '5.5p2', -1), ('5.5p10', '5.5p1', 1), ('10xyz', '10.1xyz', -1),
+    ('xyz10', 'xyz10.1', -1), ('xyz.4', '8', -1), ('8', 'xyz.4', 1),
+    ('1.0010', '1.9', 1), ('1.05', '1.5', 0), ('1.0', '1', 1),
+    ('2.50', '2.5', 1), ('fc4', 'fc.4', 0), ('FC5', 'fc4', -1),
+    ('2a', '2.0', -1), ('1.0a', '1.0', 1), ('6.0.rc1', '6.0', 1),
+    ('10b2', '10a1', 1), ('1b', '1a', 1), ('b', 'a', 1),
+    ('1.1.a', '1.1', 1), ('a', '1', -1), ('1', 'a', 1),
+    ('1+', '1_', 0), ('+1', '_1', 0), ('+', '_', 0),
+    # Tilde sorts before anything, even the end of the version
+    ('1.0~rc1', '1.0~rc1', 0), ('1.0~rc1', '1.0', -1), ('1.0', '1.0~rc1', 1),
+    ('1.0~rc1', '1.0~rc2', -1), ('1.0~rc1~git123', '1.0~rc1', -1), ('1.0~', '1.0', -1),
+    # Caret sorts after the base version, before anything else added to it
+    ('1.0^', '1.0', 1), ('1.0^git1', '1.0', 1), ('1.0^git1', '1.01', -1),
+    ('1.0^20160101', '1.0.1', -1), ('1.0^20160101^git1', '1.0^20160101', 1), ('1.0~rc1^git1', '1.0~rc1', 1),
+    ('1.0^git1~pre', '1.0^git1', -1), ('1.0^git1', '1.0^git2', -1),
+]
+
+
+class RpmvercmpTest(unittest.TestCase):
+
+    def test_cases(self):
+        for a, b, expected in rpm_cases:
+            self.assertEqual(rpmvercmp(a, b), expected, '%s vs %s' % (a, b))
+
+    def test_epoch_wins_over_version(self):
+        self.assertEqual(compare_evr(('1', '1.0', '1'), ('0', '2.0', '1')), 1)
+        self.assertEqual(compare_evr((None, '2.0', '1'), ('0', '2.0', '1')), 0)
+        self.assertEqual(compare_evr(('', '2.0', '1.el7'), ('0', '2.0', '2.el7')), -1)
+
+    def test_batch_comparator_compares_each_pair_once(self):
+        calls = []
+
+        def compare(a, b):
+            calls.append((a, b))
+            return rpmvercmp(a, b)
+
+        compare_once = BatchComparator(compare)
+        self.assertEqual(compare_once('1.0', '1.1'), -1)
+        self.assertEqual(compare_once('1.1', '1.0'), 1)
+        self.assertEqual(compare_once.newest(['1.0', '1.1', '1.1.0', '1.0']), '1.1.0')
+        self.assertEqual(compare_once.newest(['1.05', '1.5']), '1.05')
+        self.assertEqual(len(calls), len(set(frozenset(pair) for pair in calls)))
+
+    def test_compute_upgrades(self):
+        installed = {('bash', 'x86_64'): [('0', '4.2.46', '34.el7')],
+                     ('kernel', 'x86_64'): [('0', '3.10.0', '1160.el7'), ('0', '3.10.0', '957.el7')],
+                     ('tzdata', 'noarch'): [('0', '2023c', '1.el7')]}
+        available = [('bash', 'x86_64', ('0', '4.2.46', '35.el7'), 'base'),
+                     ('bash', 'i686', ('0', '4.2.46', '36.el7'), 'base'),
+                     ('kernel', 'x86_64', ('0', '3.10.0', '1062.el7'), 'base'),
+                     ('tzdata', 'noarch', ('0', '2024a', '1.el7'), 'base'),
+                     ('tzdata', 'noarch', ('0', '2024a', '1.el7'), 'updates')]
+        self.assertEqual(compute_upgrades(installed, available),
+                         {('bash', 'x86_64'): (('0', '4.2.46', '35.el7'), 'base'),
+                          ('tzdata', 'noarch'): (('0', '2024a', '1.el7'), 'base')})
+
+
+if __name__ == '__main__':
+    unittest.main()